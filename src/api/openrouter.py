@@ -1,12 +1,84 @@
 # Импорт необходимых библиотек
 import requests  # Библиотека для выполнения HTTP-запросов к API
 import os       # Библиотека для работы с операционной системой и переменными окружения
+import json     # Разбор ответа API (с замером времени разбора)
+import threading  # Замер времени соединения в потоке запроса
+import time     # Замер длительности этапов запроса
+from requests.adapters import HTTPAdapter  # Адаптер с замером времени соединения
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry  # Повтор запросов при временных ошибках
 from dotenv import load_dotenv  # Библиотека для загрузки переменных окружения из .env файла
 from utils.logger import AppLogger  # Импорт собственного логгера для отслеживания работы
+from utils.metrics import Counter, Histogram  # Счетчики запросов для эндпоинта метрик
+from utils.tracing import span  # Интервалы трассировки этапов запроса
 
 # Загрузка переменных окружения из .env файла при импорте модуля
 load_dotenv()
 
+# Длительность последнего установленного соединения в текущем потоке
+# (при повторном использовании соединения из пула остается 0)
+_connect_timing = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """HTTP соединение, запоминающее время установки (TCP)"""
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _connect_timing.value = time.perf_counter() - started
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS соединение, запоминающее время установки (TCP и TLS)"""
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _connect_timing.value = time.perf_counter() - started
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _CountingRetry(Retry):
+    """Политика повторов urllib3, сообщающая о каждом повторе (для счетчика метрик)"""
+
+    def __init__(self, *args, on_retry=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_retry = on_retry
+
+    def new(self, **kwargs):
+        # urllib3 создает новый объект политики на каждую попытку
+        retry = super().new(**kwargs)
+        retry.on_retry = self.on_retry
+        return retry
+
+    def increment(self, method=None, url=None, *args, **kwargs):
+        # При исчерпании попыток super() выбрасывает MaxRetryError - повтора нет
+        retry = super().increment(method, url, *args, **kwargs)
+        if self.on_retry:
+            self.on_retry(url)
+        return retry
+
+
+class TimingAdapter(HTTPAdapter):
+    """Транспортный адаптер requests с замером времени установки соединения"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
 class OpenRouterClient:
     """
     Клиент для взаимодействия с OpenRouter API.
@@ -51,12 +123,45 @@ class OpenRouterClient:
             "Content-Type": "application/json"          # Указание формата данных
         }
 
+        # Счетчики запросов по эндпоинтам API (публикуются через register_metrics)
+        self.request_count = Counter('openrouter_requests', 'Запросы к API', ('endpoint',))
+        self.error_count = Counter('openrouter_errors', 'Неудачные запросы к API', ('endpoint',))
+        self.retry_count = Counter('openrouter_retries', 'Повторы запросов к API после временных ошибок', ('endpoint',))
+        self.request_latency = Histogram('openrouter_request_seconds', 'Длительность запросов к API', ('endpoint',))
+
+        # Повторы только там, где запрос точно не обработан: ошибка установки
+        # соединения и ответы 429/502/503 (с учетом Retry-After). Ошибки чтения
+        # ответа не повторяются - модель могла уже сгенерировать (и списать) ответ
+        max_retries = int(os.getenv("OPENROUTER_MAX_RETRIES") or 2)
+        retry = _CountingRetry(
+            total=max_retries, connect=max_retries, read=0, status=max_retries,
+            status_forcelist=(429, 502, 503), allowed_methods=None,
+            backoff_factor=0.5, raise_on_status=False,
+            on_retry=lambda url: self.retry_count.inc(self._endpoint(url))
+        )
+
+        # Сессия с постоянными соединениями: повторные запросы не тратят
+        # время на TCP и TLS; адаптер замеряет время новых соединений
+        self.session = requests.Session()
+        self.session.mount("http://", TimingAdapter(max_retries=retry))
+        self.session.mount("https://", TimingAdapter(max_retries=retry))
+
         # Логирование успешной инициализации клиента
         self.logger.info("OpenRouterClient initialized successfully")
 
+        # Цены моделей в долларах за токен: model -> {'prompt', 'completion'}
+        # (заполняются вместе со списком моделей)
+        self.model_pricing = {}
+
         # Загрузка списка доступных моделей при инициализации
         self.available_models = self.get_models()
 
+    @staticmethod
+    def _endpoint(url):
+        """Метка эндпоинта в метриках по URL запроса ('chat', 'models', 'credits')"""
+        path = (url or '').split('?', 1)[0].rstrip('/')
+        return 'chat' if path.endswith('/chat/completions') else path.rsplit('/', 1)[-1]
+
     def get_models(self):
         """
         Получение списка доступных языковых моделей.
@@ -66,14 +171,16 @@ class OpenRouterClient:
                  [{"id": "model-id", "name": "Model Name"}, ...]
                  
         Note:
-            При ошибке запроса возвращает список базовых моделей по умолчанию
+            При ошибке запроса возвращает список базовых моделей по умолчанию.
+            Цены моделей из ответа сохраняются в self.model_pricing
         """
         # Логирование начала запроса списка моделей
         self.logger.debug("Fetching available models")
+        self.request_count.inc('models')
         
         try:
             # Выполнение GET запроса к API для получения списка моделей
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/models",
                 headers=self.headers
             )
@@ -82,6 +189,17 @@ class OpenRouterClient:
             
             # Логирование успешного получения списка моделей
             self.logger.info(f"Retrieved {len(models_data['data'])} models")
+
+            # Цены за токен приходят строками; модели без цен пропускаются
+            for model in models_data["data"]:
+                pricing = model.get("pricing") or {}
+                try:
+                    self.model_pricing[model["id"]] = {
+                        "prompt": float(pricing["prompt"]),
+                        "completion": float(pricing["completion"])
+                    }
+                except (KeyError, TypeError, ValueError):
+                    continue
             
             # Преобразование данных в нужный формат
             return [
@@ -92,6 +210,7 @@ class OpenRouterClient:
                 for model in models_data["data"]
             ]
         except Exception as e:
+            self.error_count.inc('models')
             # Список моделей по умолчанию при ошибке API
             models_default = [
                 {"id": "deepseek-coder", "name": "DeepSeek"},
@@ -111,7 +230,19 @@ class OpenRouterClient:
             model (str): Идентификатор выбранной модели
 
         Returns:
-            dict: Ответ от API, содержащий либо ответ модели, либо информацию об ошибке
+            dict: Ответ от API, содержащий либо ответ модели, либо информацию об ошибке.
+                  В ключе 'timings' - длительности этапов запроса в секундах:
+                  connect_time (установка соединения, 0 для соединения из пула),
+                  first_byte_time (время сервера до первого байта ответа: от отправки
+                  до заголовков, включая соединение; запрос без потоковой передачи,
+                  поэтому это не время до первого токена - провайдер отвечает
+                  после генерации всего ответа),
+                  download_time (получение тела ответа), parse_time (разбор JSON),
+                  request_time (весь запрос, включая повторы после временных ошибок)
+                  и tokens_per_second (токены ответа за время провайдера - включает
+                  ожидание в очереди провайдера и обработку запроса, а не только генерацию).
+                  В ключе 'usage' - prompt_tokens, completion_tokens, total_tokens
+                  и cost (стоимость в долларах, если ее сообщил провайдер)
         """
         # Логирование отправки сообщения
         self.logger.debug(f"Sending message to model: {model}")
@@ -120,30 +251,65 @@ class OpenRouterClient:
         # Формирование данных для отправки в API
         data = {
             "model": model,  # Идентификатор выбранной модели
-            "messages": [{"role": "user", "content": message}]  # Сообщение в формате API
+            "messages": [{"role": "user", "content": message}],  # Сообщение в формате API
+            "usage": {"include": True}  # Запрос стоимости хода в ответе
         }
 
         try:
             # Логирование начала выполнения запроса
             self.logger.debug("Making API request")
 
-            # Отправка POST запроса к API
-            response = requests.post(
-                f"{self.base_url}/chat/completions",  # Эндпоинт для чата
-                headers=self.headers,                 # Заголовки с авторизацией
-                json=data                            # Данные запроса
-            )
+            # Отправка POST запроса к API. stream=True возвращает управление
+            # после получения заголовков, что позволяет замерить время сервера до
+            # первого байта ответа. Сам ответ не потоковый: заголовки приходят
+            # после генерации, поэтому это время не равно времени до первого токена
+            self.request_count.inc('chat')
+            _connect_timing.value = 0.0
+            started = time.perf_counter()
+            with span('http.first_byte') as request_span:
+                response = self.session.post(
+                    f"{self.base_url}/chat/completions",  # Эндпоинт для чата
+                    headers=self.headers,                 # Заголовки с авторизацией
+                    json=data,                           # Данные запроса
+                    stream=True
+                )
+                request_span.set('status', response.status_code)
+                request_span.set('connect_ms', _connect_timing.value * 1000)
+            first_byte = time.perf_counter()
+            with span('http.download') as download_span:
+                body = response.content                  # Получение тела ответа
+                download_span.set('bytes', len(body))
+            downloaded = time.perf_counter()
 
             # Проверка на ошибки HTTP
             response.raise_for_status()
 
+            with span('http.parse'):
+                result = json.loads(body)
+            parsed = time.perf_counter()
+            self.request_latency.observe(parsed - started, 'chat')
+
             # Логирование успешного получения ответа
             self.logger.info("Successfully received response from API")
 
+            # Время на стороне провайдера: ожидание ответа без установки соединения и загрузка тела
+            connect_time = _connect_timing.value
+            provider_time = (first_byte - started - connect_time) + (downloaded - first_byte)
+            completion_tokens = result.get("usage", {}).get("completion_tokens") or 0
+            result["timings"] = {
+                "connect_time": connect_time,
+                "first_byte_time": first_byte - started,
+                "download_time": downloaded - first_byte,
+                "parse_time": parsed - downloaded,
+                "request_time": parsed - started,
+                "tokens_per_second": completion_tokens / provider_time if provider_time > 0 else None,
+            }
+
             # Возврат данных ответа
-            return response.json()
+            return result
 
         except Exception as e:
+            self.error_count.inc('chat')
             # Формирование информативного сообщения об ошибке
             error_msg = f"API request failed: {str(e)}"
             # Логирование ошибки с полным стектрейсом для отладки
@@ -158,9 +324,20 @@ class OpenRouterClient:
         Returns:
             str: Строка с балансом в формате '$X.XX' или 'Ошибка' при неудаче
         """
+        balance = self.get_balance_value()
+        return "Ошибка" if balance is None else f"${balance:.2f}"
+
+    def get_balance_value(self):
+        """
+        Получение текущего баланса аккаунта числом.
+
+        Returns:
+            float: Баланс в долларах или None при неудаче
+        """
+        self.request_count.inc('credits')
         try:
             # Запрос баланса через API
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/credits",  # Эндпоинт для проверки баланса
                 headers=self.headers         # Заголовки с авторизацией
             )
@@ -172,13 +349,52 @@ class OpenRouterClient:
                 # Вычисление доступного баланса (всего кредитов минус использовано)
                 total_credits = balance_data.get('total_credits', 0)
                 total_usage = balance_data.get('total_usage', 0)
-                balance = max(0, total_credits - total_usage)  # Убедимся, что баланс не отрицательный
-                return f"${balance:.2f}"
-            return "Ошибка"
+                return max(0, total_credits - total_usage)  # Убедимся, что баланс не отрицательный
+            return None
         except Exception as e:
+            self.error_count.inc('credits')
             # Формирование сообщения об ошибке
             error_msg = f"API request failed: {str(e)}"
             # Логирование ошибки с полным стектрейсом
             self.logger.error(error_msg, exc_info=True)
-            # Возврат сообщения об ошибке
-            return "Ошибка"
+            # Возврат признака ошибки
+            return None
+
+    def register_metrics(self, registry):
+        """
+        Публикация метрик клиента: запросы, ошибки, повторы, длительность и пулы соединений.
+
+        Args:
+            registry (MetricsRegistry): Реестр метрик
+        """
+        registry.register(self.request_count)
+        registry.register(self.error_count)
+        registry.register(self.retry_count)
+        registry.register(self.request_latency)
+        registry.gauge('openrouter_pool_connections_in_use', 'Соединения пула, занятые запросами',
+                       ('host',), callback=lambda: self._pool_stats(in_use=True))
+        registry.counter('openrouter_pool_connections_opened', 'Открытые соединения (новые TCP/TLS)',
+                         ('host',), callback=lambda: self._pool_stats(in_use=False))
+
+    def _pool_stats(self, in_use):
+        """
+        Состояние пулов соединений сессии.
+
+        Args:
+            in_use (bool): True - занятые соединения, False - количество открытых соединений
+
+        Returns:
+            dict: (хост,) -> значение
+        """
+        stats = {}
+        for adapter in self.session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None or pool.pool is None:
+                    continue
+                # Очередь пула заполнена свободными соединениями и пустыми местами (None),
+                # поэтому занятые соединения - разница размера очереди и ее заполнения
+                value = pool.pool.maxsize - pool.pool.qsize() if in_use else pool.num_connections
+                stats[(pool.host,)] = stats.get((pool.host,), 0) + value
+        return stats
@@ -6,14 +6,26 @@ sys.path.insert(0, os.path.dirname(__file__))      # Добавление дир
 import flet as ft                                  # Фреймворк для создания кроссплатформенных приложений с современным UI
 from api.openrouter import OpenRouterClient        # Клиент для взаимодействия с AI API через OpenRouter
 from ui.styles import AppStyles                    # Модуль с настройками стилей интерфейса
-from ui.components import MessageBubble, ModelSelector, LoginWindow, LoginContainer  # Компоненты пользовательского интерфейса
+from ui.components import MessageBubble, ModelSelector, LoginWindow, LoginContainer, ConversationSidebar, BranchSelector, AnalyticsDashboard  # Компоненты пользовательского интерфейса
 from utils.cache import ChatCache                  # Модуль для кэширования истории чата
+from utils.storage_daemon import RemoteChatCache   # Клиент демона хранилища (несколько окон с одной базой)
 from utils.logger import AppLogger                 # Модуль для логирования работы приложения
 from utils.analytics import Analytics              # Модуль для сбора и анализа статистики использования
 from utils.monitor import PerformanceMonitor       # Модуль для мониторинга производительности
+from utils.retention import RetentionPolicy, RetentionManager  # Политика хранения и фоновое обслуживание базы
+from utils.export import HistoryExporter           # Потоковый экспорт и импорт истории
+from utils.backup import BackupScheduler           # Плановые онлайн-копии базы
+from utils.budget import BudgetGuard               # Лимиты расходов и сверка баланса
+from utils.metrics import MetricsRegistry, MetricsServer  # Эндпоинт метрик для сборщика (OpenMetrics)
+from utils.tracing import Tracer, set_tracer, span  # Трассировка этапов хода
+from utils.profiler import SamplingProfiler        # Выборочный профилировщик для диагностики
+from utils.memory import MemoryDiagnostics         # Диагностика роста памяти
+from utils.loop_monitor import LoopMonitor         # Задержка цикла событий и загрузка пулов потоков
+import argparse                                    # Аргументы командной строки
 import asyncio                                     # Библиотека для асинхронного программирования
 import time                                        # Библиотека для работы с временными метками
-import json                                        # Библиотека для работы с JSON-данными
+import threading                                   # Библиотека для работы с потоками (отмена фоновых операций)
+import contextvars                                 # Передача контекста трассировки в пул потоков
 from datetime import datetime                      # Класс для работы с датой и временем
 
 class ChatApp:
@@ -21,7 +33,19 @@ class ChatApp:
     Основной класс приложения чата.
     Управляет всей логикой работы приложения, включая UI и взаимодействие с API.
     """
-    def __init__(self):
+
+    # Интервал проверки возможности фонового обслуживания базы (секунды)
+    MAINTENANCE_INTERVAL = 30
+    # Время без действий пользователя, после которого приложение считается простаивающим
+    IDLE_THRESHOLD = 60
+    # Сжимать ли экспортируемые файлы истории gzip
+    EXPORT_GZIP = False
+    # Длительность профиля, снимаемого сочетанием клавиш Ctrl+Shift+P (секунды)
+    PROFILE_SECONDS = 30
+    # Интервал сохранения базовых уровней метрик в базу (секунды)
+    BASELINE_SAVE_INTERVAL = 300
+
+    def __init__(self, profile_seconds=None):
         """
         Инициализация основных компонентов приложения:
         - Система кэширования для сохранения истории и аутентификационных данных
@@ -31,20 +55,66 @@ class ChatApp:
         - API клиент инициализируется после аутентификации
         """
         # Инициализация основных компонентов
-        self.cache = ChatCache()                   # Инициализация системы кэширования
+        # Инициализация системы кэширования: напрямую или через демон хранилища,
+        # если заданы несколько окон/процессов с общей базой (CACHE_DAEMON_SOCKET)
+        daemon_socket = os.getenv("CACHE_DAEMON_SOCKET")
+        self.cache = RemoteChatCache(daemon_socket) if daemon_socket else ChatCache()
         self.logger = AppLogger()                  # Инициализация системы логирования
-        self.monitor = PerformanceMonitor()        # Инициализация системы мониторинга
-
-        # API клиент и аналитика инициализируются после аутентификации
+        self.monitor = PerformanceMonitor.from_env()  # Инициализация системы мониторинга (замеры в фоне)
+        # Базовые уровни метрик, выученные в прошлых запусках
+        self.monitor.detector.load(self.cache.get_metric_baselines())
+        self.baselines_saved = time.time()
+
+        # Метрики приложения для сборщика; эндпоинт включается переменной METRICS_PORT.
+        # Метрики базы доступны только при прямой работе с базой (с демоном их публикует демон)
+        self.metrics = MetricsRegistry()
+        self.metrics_server = MetricsServer.from_env(self.metrics)
+        self.monitor.register_metrics(self.metrics)
+
+        # Задержка цикла событий интерфейса: медленные обработчики попадают в журнал и в check_health
+        self.loop_monitor = LoopMonitor.from_env(logger=self.logger)
+        self.loop_monitor.register_metrics(self.metrics)
+        self.monitor.add_health_check(self.loop_monitor.health_warnings)
+
+        # Трассировка хода в файл формата Chrome Trace Event (включается переменной TRACE_FILE)
+        set_tracer(Tracer.from_env())
+
+        # Профилировщик для диагностики медленной работы: профиль и flame graph пишутся в logs/.
+        # Запускается сочетанием клавиш или с начала работы (аргумент --profile)
+        self.profiler = SamplingProfiler(directory=self.logger.logs_dir)
+        if profile_seconds:
+            self.start_profile(profile_seconds)
+
+        # Диагностика роста памяти: снимки tracemalloc и перепись объектов
+        # (включается переменной MEMORY_DIAGNOSTICS_INTERVAL; превышение бюджета - в check_health)
+        self.memory = MemoryDiagnostics.from_env(logger=self.logger)
+        if self.memory:
+            self.monitor.add_health_check(self.memory.health_warnings)
+        if isinstance(self.cache, ChatCache):
+            self.cache.register_metrics(self.metrics)
+
+        # Фоновое обслуживание базы: архивация по политике хранения и инкрементальный vacuum
+        self.retention = RetentionManager(self.cache, RetentionPolicy.from_env())
+        self.last_activity = time.time()           # Время последнего действия пользователя
+
+        # Плановые резервные копии базы в фоновом потоке (включаются через BACKUP_INTERVAL_HOURS)
+        self.backups = BackupScheduler.from_env(self.cache, monitor=self.monitor, logger=self.logger)
+
+        # API клиент, аналитика и контроль расходов инициализируются после аутентификации
         self.api_client = None
         self.analytics = None
+        self.budget = None
 
         # Создание компонента для отображения баланса API (инициализируется после аутентификации)
         self.balance_text = None
 
+        # Обработчик редактирования сообщения (задается при построении интерфейса)
+        self.edit_turn = None
+
         # Создание директории для экспорта истории чата
         self.exports_dir = "exports"               # Путь к директории экспорта
         os.makedirs(self.exports_dir, exist_ok=True)  # Создание директории, если её нет
+        self.exporter = HistoryExporter(self.cache)   # Потоковый экспорт/импорт истории
 
     def initialize_after_auth(self):
         """
@@ -59,30 +129,37 @@ class ChatApp:
 
         # Инициализация API клиента с сохраненным ключом
         self.api_client = OpenRouterClient(api_key=auth_data['api_key'])
-        self.analytics = Analytics(self.cache)     # Инициализация системы аналитики
+        self.analytics = Analytics(self.cache, detector=self.monitor.detector)  # Инициализация системы аналитики
+        self.analytics.set_model_pricing(self.api_client.model_pricing)  # Цены моделей для учета расходов
+        self.budget = BudgetGuard.from_env(self.analytics)  # Лимиты расходов из переменных окружения
+        self.api_client.register_metrics(self.metrics)
+        self.analytics.register_metrics(self.metrics)
 
         # Создание компонента для отображения баланса API
         self.balance_text = ft.Text(
             "Баланс: н/д",                         # Начальный текст до загрузки реального баланса
             **AppStyles.BALANCE_TEXT               # Применение стилей из конфигурации
         )
-        self.update_balance()                      # Первичное обновление баланса (временно отключено)
+        self.update_balance()                      # Первичная сверка баланса
 
     def load_chat_history(self):
         """
         Загрузка истории чата из кэша и отображение её в интерфейсе.
+        Загружается текущая ветка беседы.
         Сообщения добавляются в обратном порядке для правильной хронологии.
         """
         try:
             history = self.cache.get_chat_history()    # Получение истории из кэша
             for msg in reversed(history):              # Перебор сообщений в обратном порядке
                 # Распаковка данных сообщения в отдельные переменные
-                _, model, user_message, ai_response, timestamp, tokens = msg
+                message_id, model, user_message, ai_response, timestamp, tokens = msg
                 # Добавление пары сообщений (пользователь + AI) в интерфейс
                 self.chat_history.controls.extend([
                     MessageBubble(                     # Создание пузырька сообщения пользователя
                         message=user_message,
-                        is_user=True
+                        is_user=True,
+                        on_edit=(lambda i=message_id, t=user_message: self.edit_turn(i, t))
+                        if self.edit_turn else None
                     ),
                     MessageBubble(                     # Создание пузырька ответа AI
                         message=ai_response,
@@ -93,26 +170,126 @@ class ChatApp:
             # Логирование ошибки при загрузке истории
             self.logger.error(f"Ошибка загрузки истории чата: {e}")
 
+    async def maintenance_loop(self):
+        """
+        Фоновое обслуживание базы данных в периоды простоя.
+
+        Каждые MAINTENANCE_INTERVAL секунд, если пользователь не отправлял
+        сообщений дольше IDLE_THRESHOLD, выполняется один короткий шаг
+        обслуживания в пуле потоков, не блокируя интерфейс. Раз в
+        BASELINE_SAVE_INTERVAL секунд сохраняются базовые уровни метрик.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.MAINTENANCE_INTERVAL)
+            # Сохранение базовых уровней метрик не ждет простоя: это одна короткая транзакция
+            if time.time() - self.baselines_saved >= self.BASELINE_SAVE_INTERVAL and self.monitor.detector.dirty:
+                try:
+                    await loop.run_in_executor(None, self.cache.save_metric_baselines, self.monitor.detector.dump())
+                    self.baselines_saved = time.time()
+                except Exception as e:
+                    self.logger.error(f"Ошибка сохранения базовых уровней метрик: {e}")
+            if time.time() - self.last_activity < self.IDLE_THRESHOLD:
+                continue
+            try:
+                # Длительности этапов последнего хода, отложенные до следующей записи
+                await loop.run_in_executor(None, self.cache.flush_turn_timings)
+                result = await loop.run_in_executor(None, self.retention.run_idle_step)
+                if result['action'] == 'retention':
+                    self.logger.info(
+                        f"Архивировано сообщений: {result['archived_rows']}, "
+                        f"сегментов: {len(result['segments'])}"
+                    )
+                elif result['action'] == 'compact':
+                    self.logger.debug(f"Журнал записи перенесен в базу: {result['merged_pages']} страниц")
+                elif result['action'] == 'vacuum':
+                    self.logger.debug(
+                        f"Incremental vacuum: освобождено страниц {result['freed_pages']}, "
+                        f"осталось {result['remaining_pages']}"
+                    )
+            except Exception as e:
+                self.logger.error(f"Ошибка фонового обслуживания базы: {e}")
+
+    def start_profile(self, seconds, page=None):
+        """
+        Сбор профиля всех потоков в фоне в течение seconds секунд.
+
+        Args:
+            seconds (float): Длительность профиля
+            page (ft.Page, optional): Страница для уведомления о начале и результате
+        """
+        if self.profiler.is_running:
+            return
+
+        def notify(message):
+            if page is None:
+                return
+            snack = ft.SnackBar(content=ft.Text(message), duration=5000)
+            page.overlay.append(snack)
+            snack.open = True
+            page.update()
+
+        def done(result):
+            if isinstance(result, Exception):
+                self.logger.error(f"Ошибка профилирования: {result}")
+                notify(f"Ошибка профилирования: {result}")
+                return
+            self.logger.info(f"Профиль сохранен: {result['svg']} ({result['samples']} снимков)")
+            notify(f"Профиль сохранен: {result['svg']}")
+
+        self.logger.info(f"Запуск профилирования на {seconds} с")
+        self.profiler.capture_in_background(seconds, done)
+        notify(f"Профилирование {seconds} с...")
+
+    async def balance_loop(self):
+        """
+        Периодическая сверка баланса с API.
+
+        Между сверками баланс оценивается по расходам сохраненных ходов
+        (BudgetGuard.estimated_balance), поэтому API не опрашивается после
+        каждого сообщения. Запрос выполняется в пуле потоков.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.MAINTENANCE_INTERVAL)
+            if not self.budget.needs_reconcile():
+                continue
+            try:
+                await loop.run_in_executor(None, self.update_balance)
+                self.balance_text.update()
+            except Exception as e:
+                self.logger.error(f"Ошибка сверки баланса: {e}")
+
     def update_balance(self):
         """
-        Обновление отображения баланса API в интерфейсе.
+        Сверка баланса с API и обновление его отображения в интерфейсе.
         При успешном получении баланса показывает его зеленым цветом,
         при ошибке - красным с текстом 'н/д' (не доступен).
         """
         try:
             # Логирование попытки получения баланса
             self.logger.info("Запрос баланса через API")
-            balance = self.api_client.get_balance()         # Запрос баланса через API
+            balance = self.api_client.get_balance_value()   # Запрос баланса через API
+            self.budget.reconcile(balance)                  # Точка отсчета для оценки баланса
             self.logger.info(f"Баланс получен: {balance}")
-
-            self.balance_text.value = f"Баланс: {balance}"  # Обновление текста с балансом
-            self.balance_text.color = ft.Colors.GREEN_400   # Установка зеленого цвета для успешного получения
+            self.show_balance()
         except Exception as e:
             # Обработка ошибки получения баланса
             self.logger.error(f"Ошибка обновления баланса: {e}")
             self.balance_text.value = "Баланс: н/д"         # Установка текста ошибки
             self.balance_text.color = ft.Colors.RED_400     # Установка красного цвета для ошибки
-            
+
+    def show_balance(self):
+        """Отображение баланса, оцененного по расходам после последней сверки"""
+        balance = self.budget.estimated_balance()
+        if balance is None:
+            self.balance_text.value = "Баланс: н/д"
+            self.balance_text.color = ft.Colors.RED_400
+        else:
+            self.balance_text.value = f"Баланс: ${balance:.2f}"
+            self.balance_text.color = ft.Colors.GREEN_400
+
+
     def show_main_ui(self, page: ft.Page):
         """
         Отображение основного интерфейса приложения после успешной аутентификации.
@@ -149,40 +326,64 @@ class ChatApp:
         async def send_message_click(e):
             """
             Асинхронная функция отправки сообщения.
+
+            Ход записывается в трассировку (TRACE_FILE) деревом интервалов
+            с корнем chat.send_message.
             """
             if not self.message_input.value:
                 return
 
-            try:
-                # Визуальная индикация процесса
-                self.message_input.border_color = ft.Colors.BLUE_400
-                page.update()
-
-                # Сохранение данных сообщения
-                start_time = time.time()
-                user_message = self.message_input.value
-                self.message_input.value = ""
-                page.update()
+            self.last_activity = time.time()       # Отметка активности для фонового обслуживания
 
-                # Добавление сообщения пользователя
-                self.chat_history.controls.append(
-                    MessageBubble(message=user_message, is_user=True)
-                )
+            with span('chat.send_message', model=self.model_dropdown.value):
+                await send_message(self.model_dropdown.value)
 
-                # Индикатор загрузки
-                loading = ft.ProgressRing()
-                self.chat_history.controls.append(loading)
-                page.update()
+        async def send_message(model):
+            """Отправка сообщения из поля ввода и сохранение хода"""
+            # Проверка лимитов расходов до отправки запроса
+            with span('budget.check'):
+                allowed, budget_warnings = self.budget.check(model, self.message_input.value)
+            for warning in budget_warnings:
+                self.logger.warning(warning)
+                show_error_snack(page, warning)
+            if not allowed:
+                return
 
-                # Асинхронная отправка запроса
+            try:
+                with span('ui.input'):
+                    # Визуальная индикация процесса
+                    self.message_input.border_color = ft.Colors.BLUE_400
+                    page.update()
+
+                    # Сохранение данных сообщения
+                    start_time = time.time()
+                    user_message = self.message_input.value
+                    self.message_input.value = ""
+                    page.update()
+
+                    # Добавление сообщения пользователя
+                    user_bubble = MessageBubble(message=user_message, is_user=True)
+                    self.chat_history.controls.append(user_bubble)
+
+                    # Индикатор загрузки
+                    loading = ft.ProgressRing()
+                    self.chat_history.controls.append(loading)
+                    page.update()
+
+                # Асинхронная отправка запроса. Время ожидания свободного потока
+                # пула учитывается отдельно от времени самого запроса
+                stages = {}
+                submitted = time.perf_counter()
+
+                def request():
+                    stages['queue_time'] = time.perf_counter() - submitted
+                    return self.api_client.send_message(user_message, model)
+
+                # Контекст передается в поток пула, чтобы интервалы клиента
+                # стали дочерними для интервала запроса
                 loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: self.api_client.send_message(
-                        user_message, 
-                        self.model_dropdown.value
-                    )
-                )
+                with span('api.chat', model=model):
+                    response = await loop.run_in_executor(None, contextvars.copy_context().run, request)
 
                 # Удаление индикатора загрузки
                 self.chat_history.controls.remove(loading)
@@ -192,35 +393,59 @@ class ChatApp:
                     response_text = f"Ошибка: {response['error']}"
                     tokens_used = 0
                     self.logger.error(f"Ошибка API: {response['error']}")
+                    self.analytics.track_error(model)
                 else:
                     response_text = response["choices"][0]["message"]["content"]
                     tokens_used = response.get("usage", {}).get("total_tokens", 0)
-
-                # Сохранение в кэш
-                self.cache.save_message(
-                    model=self.model_dropdown.value,
-                    user_message=user_message,
-                    ai_response=response_text,
-                    tokens_used=tokens_used
-                )
+                usage = response.get("usage")
+
+                # Время ответа - длительность запроса к API (без работы интерфейса);
+                # при ошибке до получения ответа - время от нажатия кнопки
+                timings = response.get("timings", {})
+                stages.update(timings)
+                response_time = timings.get("request_time", time.time() - start_time)
+
+                # Сохранение хода (сообщение и метрики одной записью) и обновление аналитики
+                persist_started = time.perf_counter()
+                with span('analytics.track_turn', tokens=tokens_used):
+                    message_id = self.analytics.track_turn(
+                        model=model,
+                        user_message=user_message,
+                        ai_response=response_text,
+                        response_time=response_time,
+                        tokens_used=tokens_used,
+                        timings=stages,
+                        usage=usage,
+                        failed="error" in response
+                    )
+                render_started = time.perf_counter()
+                persist_time = render_started - persist_started
+                user_bubble.set_on_edit(lambda: edit_turn(message_id, user_message))
 
                 # Добавление ответа в чат
                 self.chat_history.controls.append(
                     MessageBubble(message=response_text, is_user=False)
                 )
 
-                # Обновление аналитики
-                response_time = time.time() - start_time
-                self.analytics.track_message(
-                    model=self.model_dropdown.value,
-                    message_length=len(user_message),
-                    response_time=response_time,
-                    tokens_used=tokens_used
-                )
-
                 # Логирование метрик
-                self.monitor.log_metrics(self.logger)
-                page.update()
+                with span('monitor.log_metrics'):
+                    self.monitor.log_metrics(self.logger)
+
+                # Обновление счетчиков беседы в боковой панели, списка веток и оценки баланса
+                with span('ui.refresh'):
+                    self.sidebar.refresh()
+                    self.branch_selector.refresh()
+                    self.show_balance()
+                with span('ui.update'):
+                    page.update()
+
+                # Запись и отрисовка известны только после сохранения хода;
+                # кэш запишет их вместе со следующим ходом или в простое
+                with span('cache.update_turn_timings'):
+                    self.cache.update_turn_timings(message_id, {
+                        'persist_time': persist_time,
+                        'render_time': time.perf_counter() - render_started
+                    })
 
             except Exception as e:
                 self.logger.error(f"Ошибка отправки сообщения: {e}")
@@ -255,19 +480,104 @@ class ChatApp:
             page.update()                         # Обновление страницы
 
 
+        def format_latency(label, percentiles):
+            """Строка с квантилями времени ответа"""
+            if not percentiles['count']:
+                return f"{label}: нет данных"
+            return (
+                f"{label}: p50 {percentiles['p50']:.2f} с, "
+                f"p95 {percentiles['p95']:.2f} с, p99 {percentiles['p99']:.2f} с"
+            )
+
+        def format_stages(stages):
+            """Строки со средними длительностями этапов хода"""
+            if not stages['turns']:
+                return [ft.Text("Этапы хода: нет измерений")]
+
+            def ms(key):
+                return f"{(stages.get(key) or 0) * 1000:.0f} мс"
+
+            speed = stages.get('tokens_per_second')
+            return [
+                ft.Text(f"Этапы хода (среднее по {stages['turns']} ходам):"),
+                ft.Text(f"Провайдер: {ms('provider_time')} · приложение: {ms('client_time')}", size=12),
+                ft.Text(
+                    f"Очередь {ms('queue_time')}, соединение {ms('connect_time')}, "
+                    f"ответ сервера (первый байт) {ms('first_byte_time')}, загрузка {ms('download_time')}",
+                    size=12
+                ),
+                ft.Text(
+                    f"Разбор JSON {ms('parse_time')}, запись в базу {ms('persist_time')}, "
+                    f"отрисовка {ms('render_time')}",
+                    size=12
+                ),
+                ft.Text(f"Токенов в секунду провайдера: {speed:.1f}" if speed
+                        else "Токенов в секунду провайдера: нет данных", size=12),
+            ]
+
+        def format_spend(spend, today, conversations):
+            """Строки с расходами по моделям, дням и беседам"""
+            lines = [ft.Text(f"Расходы: ${spend['total']:.4f}")]
+            lines.extend(
+                ft.Text(f"{model}: ${cost:.4f}", size=12)
+                for model, cost in spend.items() if model != 'total'
+            )
+            lines.append(ft.Text(f"Сегодня: ${today:.4f}", size=12))
+            lines.extend(
+                ft.Text(f"Беседа «{conversation['title']}»: ${conversation['cost']:.4f}", size=12)
+                for conversation in conversations[:5] if conversation['cost']
+            )
+            return lines
+
+        def load_analytics():
+            """Данные диалога аналитики (чтение базы - выполняется в пуле потоков)"""
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            return {
+                'stats': self.analytics.get_statistics(),
+                'latency': self.analytics.get_latency_percentiles(),
+                'today': self.analytics.get_spend(today),
+                'conversations': self.analytics.get_spend_by_conversation(),
+                'dashboard': AnalyticsDashboard(self.analytics),
+            }
+
         async def show_analytics(e):
             """Показ статистики использования"""
-            stats = self.analytics.get_statistics()    # Получение статистики
+            # Статистика читается из базы вне цикла событий, чтобы не задерживать интерфейс
+            loop = asyncio.get_event_loop()
+            data = await loop.run_in_executor(None, load_analytics)
+            stats = data['stats']
+
+            # Сводка: итоги и квантили времени ответа
+            summary = ft.Column([
+                ft.Text(f"Всего сообщений: {stats['total_messages']}"),
+                ft.Text(f"Всего токенов: {stats['total_tokens']}"),
+                ft.Text(f"Среднее токенов/сообщение: {stats['tokens_per_message']:.2f}"),
+                ft.Text(f"Сообщений в минуту: {stats['messages_per_minute']:.2f}"),
+                ft.Text(format_latency("Время ответа", stats['latency'])),
+                *[
+                    ft.Text(format_latency(model, percentiles), size=12)
+                    for model, percentiles in data['latency'].items()
+                ],
+                ft.Divider(),
+                *format_stages(stats['stages']),
+                ft.Divider(),
+                *format_spend(stats['spend'], data['today'], data['conversations'])
+            ], scroll=ft.ScrollMode.AUTO)
 
-            # Создание диалога статистики
+            # Создание диалога статистики: сводка и графики за период
             dialog = ft.AlertDialog(
                 title=ft.Text("Аналитика"),
-                content=ft.Column([
-                    ft.Text(f"Всего сообщений: {stats['total_messages']}"),
-                    ft.Text(f"Всего токенов: {stats['total_tokens']}"),
-                    ft.Text(f"Среднее токенов/сообщение: {stats['tokens_per_message']:.2f}"),
-                    ft.Text(f"Сообщений в минуту: {stats['messages_per_minute']:.2f}")
-                ]),
+                content=ft.Container(
+                    content=ft.Tabs(
+                        tabs=[
+                            ft.Tab(text="Сводка", content=ft.Container(summary, padding=10)),
+                            ft.Tab(text="Графики", content=ft.Container(data['dashboard'], padding=10)),
+                        ],
+                        selected_index=0,
+                    ),
+                    width=AppStyles.DASHBOARD_CONTAINER["width"] + 20,
+                    height=AppStyles.DASHBOARD_CONTAINER["height"] + 80,
+                ),
                 actions=[
                     ft.TextButton("Закрыть", on_click=lambda e: close_dialog(dialog)),
                 ],
@@ -282,9 +592,12 @@ class ChatApp:
             Очистка истории чата.
             """
             try:
-                self.cache.clear_history()          # Очистка кэша
-                self.analytics.clear_data()         # Очистка аналитики
+                # Очистка сообщений текущей беседы; метрики ходов остаются в базе
+                # (analytics_messages), поэтому статистика аналитики не сбрасывается
+                self.cache.clear_history()
                 self.chat_history.controls.clear()  # Очистка истории чата
+                self.sidebar.refresh()              # Обновление счетчиков в панели бесед
+                self.branch_selector.refresh()      # Веток больше нет
                 
             except Exception as e:
                 self.logger.error(f"Ошибка очистки истории: {e}")
@@ -305,7 +618,7 @@ class ChatApp:
             dialog = ft.AlertDialog(
                 modal=True,
                 title=ft.Text("Подтверждение удаления"),
-                content=ft.Text("Вы уверены? Это действие нельзя отменить!"),
+                content=ft.Text("Удалить все сообщения текущей беседы? Это действие нельзя отменить!"),
                 actions=[
                     ft.TextButton("Отмена", on_click=close_dlg),
                     ft.TextButton("Очистить", on_click=clear_confirmed),
@@ -326,38 +639,160 @@ class ChatApp:
                 page.overlay.remove(dialog)
       
 
-        async def save_dialog(e):
+        def open_conversation(conversation_id):
             """
-            Сохранение истории диалога в JSON файл.
+            Переключение на другую беседу.
+            Загружаются только сообщения выбранной беседы.
             """
             try:
-                # Получение истории из кэша
-                history = self.cache.get_chat_history()
-
-                # Форматирование данных для сохранения
-                dialog_data = []
-                for msg in history:
-                    dialog_data.append({
-                        "timestamp": msg[4],
-                        "model": msg[1],
-                        "user_message": msg[2],
-                        "ai_response": msg[3],
-                        "tokens_used": msg[5]
-                    })
+                self.cache.switch_conversation(conversation_id)
+                self.chat_history.controls.clear()  # Очистка отображаемой истории
+                self.load_chat_history()            # Загрузка сообщений выбранной беседы
+                self.sidebar.refresh()              # Подсветка выбранной беседы
+                self.branch_selector.refresh()      # Ветки выбранной беседы
+                page.update()
+            except Exception as e:
+                self.logger.error(f"Ошибка переключения беседы: {e}")
+                show_error_snack(page, f"Ошибка переключения беседы: {str(e)}")
+
+        def edit_turn(message_id, text):
+            """
+            Редактирование прошлого сообщения.
+            Беседа возвращается к ходу перед ним, текст переносится в поле ввода;
+            отправка создаст новую ветку, исходная ветка сохраняется.
+            """
+            try:
+                self.cache.fork_from(message_id)
+                self.chat_history.controls.clear()
+                self.load_chat_history()            # Общий префикс веток
+                self.branch_selector.refresh()
+                self.message_input.value = str(text)
+                page.update()
+            except Exception as e:
+                self.logger.error(f"Ошибка редактирования сообщения: {e}")
+                show_error_snack(page, f"Ошибка редактирования сообщения: {str(e)}")
+
+        def switch_branch(head_id):
+            """Переключение на другую ветку текущей беседы"""
+            try:
+                self.cache.switch_branch(head_id)
+                self.chat_history.controls.clear()
+                self.load_chat_history()
+                self.branch_selector.refresh()
+                page.update()
+            except Exception as e:
+                self.logger.error(f"Ошибка переключения ветки: {e}")
+                show_error_snack(page, f"Ошибка переключения ветки: {str(e)}")
+
+        self.edit_turn = edit_turn
+
+        def create_conversation():
+            """Создание новой беседы и переход в нее"""
+            try:
+                conversation_id = self.cache.create_conversation()
+                open_conversation(conversation_id)
+            except Exception as e:
+                self.logger.error(f"Ошибка создания беседы: {e}")
+                show_error_snack(page, f"Ошибка создания беседы: {str(e)}")
+
+        def rename_conversation(conversation_id, title):
+            """Диалог переименования беседы"""
+            title_field = ft.TextField(value=title, autofocus=True, width=300)
+
+            def rename_confirmed(e):
+                try:
+                    if title_field.value and title_field.value.strip():
+                        self.cache.rename_conversation(conversation_id, title_field.value.strip())
+                        self.sidebar.refresh()
+                except Exception as ex:
+                    self.logger.error(f"Ошибка переименования беседы: {ex}")
+                close_dialog(dialog)
+
+            dialog = ft.AlertDialog(
+                modal=True,
+                title=ft.Text("Переименовать беседу"),
+                content=title_field,
+                actions=[
+                    ft.TextButton("Отмена", on_click=lambda e: close_dialog(dialog)),
+                    ft.TextButton("Сохранить", on_click=rename_confirmed),
+                ],
+                actions_alignment=ft.MainAxisAlignment.END,
+            )
+
+            page.overlay.append(dialog)
+            dialog.open = True
+            page.update()
+
+        def show_progress_dialog(title, cancel_event):
+            """
+            Диалог прогресса фоновой операции с кнопкой отмены.
+
+            Returns:
+                tuple: (диалог, функция обновления прогресса progress(done, total))
+            """
+            progress_bar = ft.ProgressBar(width=300, value=None)
+            progress_text = ft.Text("Подготовка...")
+
+            dialog = ft.AlertDialog(
+                modal=True,
+                title=ft.Text(title),
+                content=ft.Column([progress_bar, progress_text], tight=True),
+                actions=[
+                    ft.TextButton("Отмена", on_click=lambda e: cancel_event.set()),
+                ],
+            )
+            page.overlay.append(dialog)
+            dialog.open = True
+            page.update()
+
+            def report_progress(done, total):
+                """Обновление прогресса (вызывается из фонового потока)"""
+                progress_bar.value = done / total if total else None
+                progress_text.value = f"Обработано: {done}" + (f" из {total}" if total else "")
+                page.update()
+
+            return dialog, report_progress
+
+        async def save_dialog(e):
+            """
+            Потоковый экспорт текущей беседы в NDJSON файл.
+
+            Экспорт выполняется в фоновом потоке пачками, поэтому интерфейс
+            не блокируется, а память не зависит от размера истории.
+            """
+            cancel_event = threading.Event()
+            progress_dialog, report_progress = show_progress_dialog("Экспорт диалога", cancel_event)
 
+            try:
                 # Создание имени файла
-                filename = f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+                extension = ".ndjson.gz" if self.EXPORT_GZIP else ".ndjson"
+                filename = f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
                 filepath = os.path.join(self.exports_dir, filename)
+                conversation_id = self.cache.current_conversation_id
+
+                # Экспорт в фоновом потоке
+                loop = asyncio.get_event_loop()
+                result = await loop.run_in_executor(
+                    None,
+                    lambda: self.exporter.export_ndjson(
+                        filepath,
+                        conversation_id=conversation_id,
+                        progress=report_progress,
+                        cancel_event=cancel_event
+                    )
+                )
+                close_dialog(progress_dialog)
 
-                # Сохранение в JSON
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(dialog_data, f, ensure_ascii=False, indent=2, default=str)
+                if result['cancelled']:
+                    show_error_snack(page, "Экспорт отменен")
+                    return
 
                 # Создание диалога успешного сохранения
                 dialog = ft.AlertDialog(
                     modal=True,
                     title=ft.Text("Диалог сохранен"),
                     content=ft.Column([
+                        ft.Text(f"Сообщений: {result['rows']}"),
                         ft.Text("Путь сохранения:"),
                         ft.Text(filepath, selectable=True, weight=ft.FontWeight.BOLD),
                     ]),
@@ -374,24 +809,80 @@ class ChatApp:
                 page.update()
 
             except Exception as e:
+                close_dialog(progress_dialog)
                 self.logger.error(f"Ошибка сохранения: {e}")
                 show_error_snack(page, f"Ошибка сохранения: {str(e)}")
 
-    
+        async def import_history(e: ft.FilePickerResultEvent):
+            """
+            Массовый импорт истории из выбранного NDJSON файла.
+            Для каждой беседы из файла создается новая беседа.
+            """
+            if not e.files:
+                return
+
+            cancel_event = threading.Event()
+            progress_dialog, report_progress = show_progress_dialog("Импорт истории", cancel_event)
+
+            try:
+                loop = asyncio.get_event_loop()
+                result = await loop.run_in_executor(
+                    None,
+                    lambda: self.exporter.import_ndjson(
+                        e.files[0].path,
+                        progress=report_progress,
+                        cancel_event=cancel_event
+                    )
+                )
+                close_dialog(progress_dialog)
+                self.logger.info(f"Импортировано сообщений: {result['rows']}")
+
+                self.sidebar.refresh()    # Новые беседы в панели
+                page.update()
+                if result['cancelled']:
+                    show_error_snack(page, f"Импорт прерван, сохранено сообщений: {result['rows']}")
+
+            except Exception as ex:
+                close_dialog(progress_dialog)
+                self.logger.error(f"Ошибка импорта: {ex}")
+                show_error_snack(page, f"Ошибка импорта: {str(ex)}")
+
+        # Диалог выбора файла для импорта
+        import_picker = ft.FilePicker(on_result=import_history)
+        page.overlay.append(import_picker)
 
         # Создание компонентов интерфейса
         self.message_input = ft.TextField(**AppStyles.MESSAGE_INPUT) # Поле ввода
         self.chat_history = ft.ListView(**AppStyles.CHAT_HISTORY)    # История чата
 
-        # Загрузка существующей истории
+        # Загрузка истории текущей беседы
         self.load_chat_history()
 
+        # Переключатель веток текущей беседы
+        self.branch_selector = BranchSelector(self.cache, on_switch=switch_branch)
+
+        # Боковая панель со списком бесед
+        self.sidebar = ConversationSidebar(
+            self.cache,
+            on_select=open_conversation,
+            on_create=create_conversation,
+            on_rename=rename_conversation
+        )
+
         # Создание кнопок управления
         save_button = ft.ElevatedButton(
             on_click=save_dialog,           # Привязка функции сохранения
             **AppStyles.SAVE_BUTTON         # Применение стилей
         )
 
+        import_button = ft.ElevatedButton(
+            on_click=lambda e: import_picker.pick_files(
+                allowed_extensions=["ndjson", "gz"],
+                allow_multiple=False
+            ),                              # Выбор файла для импорта
+            **AppStyles.IMPORT_BUTTON       # Применение стилей
+        )
+
         clear_button = ft.ElevatedButton(
             on_click=confirm_clear_history, # Привязка функции очистки
             **AppStyles.CLEAR_BUTTON        # Применение стилей
@@ -413,6 +904,7 @@ class ChatApp:
         control_buttons = ft.Row(  
             controls=[                      # Размещение кнопок в ряд
                 save_button,
+                import_button,
                 analytics_button,
                 clear_button
             ],
@@ -457,20 +949,57 @@ class ChatApp:
         self.main_column = ft.Column(
             controls=[                            # Размещение основных элементов
                 model_selection,
+                self.branch_selector,
                 self.chat_history,
                 controls_column
             ],
             **AppStyles.MAIN_COLUMN               # Применение стилей к главной колонке
         )
 
-        # Добавление основной колонки на страницу
-        page.add(self.main_column)
+        # Размещение панели бесед слева от основной колонки
+        layout_row = ft.Row(
+            controls=[
+                self.sidebar,
+                self.main_column
+            ],
+            **AppStyles.LAYOUT_ROW                # Применение стилей к строке
+        )
+
+        # Добавление разметки на страницу
+        page.add(layout_row)
 
         # Финальное обновление страницы для рендеринга всех компонентов
         page.update()
 
-        # Запуск монитора
-        self.monitor.get_metrics()
+        # Запуск фоновых замеров монитора и эндпоинта метрик
+        self.monitor.start()
+        if self.metrics_server:
+            self.metrics_server.start()
+
+        # Диагностика памяти: подозреваемые источники роста - история чата,
+        # данные сессии аналитики, история замеров монитора и диалоги страницы
+        if self.memory:
+            self.memory.track_type(MessageBubble)
+            self.memory.track_size('chat_history.controls', lambda: len(self.chat_history.controls))
+            self.memory.track_size('session_data', lambda: self.analytics.get_session_data_size())
+            self.memory.track_size('metrics_history', lambda: self.monitor.get_average_metrics().get('samples_count', 0))
+            self.memory.track_size('page.overlay', lambda: len(page.overlay))
+            self.memory.start()
+
+        # Скрытое действие диагностики: Ctrl+Shift+P снимает профиль всех потоков
+        def on_keyboard(e: ft.KeyboardEvent):
+            if e.ctrl and e.shift and e.key.upper() == "P":
+                self.start_profile(self.PROFILE_SECONDS, page)
+
+        page.on_keyboard_event = on_keyboard
+
+        # Запуск фонового обслуживания базы, сверки баланса и плановых резервных копий
+        page.run_task(self.maintenance_loop)
+        page.run_task(self.balance_loop)
+        self.backups.start()
+
+        # Контрольная задача цикла событий и учитываемый пул потоков run_in_executor
+        page.run_task(self.loop_monitor.run)
 
         # Логирование запуска
         self.logger.info("Приложение запущено")
@@ -529,7 +1058,12 @@ class ChatApp:
 
 def main():
     """Точка входа в приложение"""
-    app = ChatApp()                              # Создание экземпляра приложения
+    parser = argparse.ArgumentParser(description="AI чат на OpenRouter")
+    parser.add_argument("--profile", type=float, metavar="SECONDS", default=None,
+                        help="Снять профиль всех потоков за первые SECONDS секунд работы (в logs/)")
+    args = parser.parse_args()
+
+    app = ChatApp(profile_seconds=args.profile)  # Создание экземпляра приложения
     # Запуск приложения
     ft.app(target=app.main)
     #ft.app(target=app.main, view=ft.WEB_BROWSER)
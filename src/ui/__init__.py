@@ -2,7 +2,7 @@
 UI package initialization.
 Contains UI components and styles.
 """
-from .components import MessageBubble, ModelSelector
+from .components import MessageBubble, ModelSelector, ConversationSidebar, BranchSelector, AnalyticsDashboard
 from .styles import AppStyles
 
-__all__ = ['MessageBubble', 'ModelSelector', 'AppStyles']
+__all__ = ['MessageBubble', 'ModelSelector', 'ConversationSidebar', 'BranchSelector', 'AnalyticsDashboard', 'AppStyles']
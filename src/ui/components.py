@@ -2,6 +2,7 @@
 import flet as ft                  # Фреймворк для создания пользовательского интерфейса
 from ui.styles import AppStyles    # Импорт стилей приложения
 import asyncio                     # Библиотека для асинхронного программирования
+from datetime import datetime, timedelta  # Периоды графиков аналитики
 
 class MessageBubble(ft.Container):
     """
@@ -11,10 +12,13 @@ class MessageBubble(ft.Container):
     Отображает сообщения пользователя и AI с разными стилями и позиционированием.
     
     Args:
-        message (str): Текст сообщения для отображения
+        message (str): Текст сообщения для отображения (str или ленивый CompressedText
+                       из кэша - он распаковывается здесь, при отображении)
         is_user (bool): Флаг, указывающий, является ли это сообщением пользователя
+        on_edit: Колбэк редактирования сообщения пользователя (создает новую ветку беседы).
+                 Можно задать позже через set_on_edit(), когда станет известен ID сообщения
     """
-    def __init__(self, message: str, is_user: bool):
+    def __init__(self, message: str, is_user: bool, on_edit=None):
         # Инициализация родительского класса Container
         super().__init__()
         
@@ -45,21 +49,44 @@ class MessageBubble(ft.Container):
             bottom=5                         # Отступ снизу
         )
         
+        # Кнопка редактирования (только для сообщений пользователя)
+        self.on_edit = on_edit
+        self.edit_button = ft.IconButton(
+            icon=ft.icons.EDIT,
+            icon_size=14,
+            icon_color=ft.Colors.WHITE70,
+            tooltip="Изменить и отправить заново",
+            visible=is_user and on_edit is not None,
+            on_click=lambda e: self.on_edit and self.on_edit()
+        )
+
         # Создание содержимого пузырька
         self.content = ft.Column(
             controls=[
                 # Текст сообщения с настройками отображения
                 ft.Text(
-                    value=message,                    # Текст сообщения
+                    value=str(message),               # Текст сообщения
                     color=ft.Colors.WHITE,            # Белый цвет текста
                     size=16,                         # Размер шрифта
                     selectable=True,                 # Возможность выделения текста
                     weight=ft.FontWeight.W_400       # Нормальная толщина шрифта
-                )
+                ),
+                self.edit_button
             ],
-            tight=True  # Плотное расположение элементов в колонке
+            tight=True,  # Плотное расположение элементов в колонке
+            horizontal_alignment=ft.CrossAxisAlignment.END
         )
 
+    def set_on_edit(self, on_edit):
+        """
+        Установка колбэка редактирования и показ кнопки.
+
+        Args:
+            on_edit: Колбэк без аргументов
+        """
+        self.on_edit = on_edit
+        self.edit_button.visible = on_edit is not None
+
 
 class ModelSelector(ft.Dropdown):
     """
@@ -130,6 +157,283 @@ class ModelSelector(ft.Dropdown):
         e.page.update()
 
 
+class ConversationSidebar(ft.Container):
+    """
+    Боковая панель со списком бесед.
+
+    Показывает для каждой беседы название, количество сообщений и время
+    последней активности. Данные приходят из ChatCache.list_conversations(),
+    который считает их одним агрегирующим запросом.
+
+    Args:
+        cache (ChatCache): Экземпляр класса кэширования с беседами
+        on_select: Колбэк выбора беседы, принимает ID беседы
+        on_create: Колбэк создания новой беседы
+        on_rename: Колбэк переименования, принимает ID и текущее название беседы
+    """
+    def __init__(self, cache, on_select=None, on_create=None, on_rename=None):
+        # Инициализация родительского класса Container
+        super().__init__(**AppStyles.SIDEBAR_CONTAINER)
+
+        # Сохранение ссылки на кэш и обработчиков событий
+        self.cache = cache
+        self.on_select = on_select
+        self.on_create = on_create
+        self.on_rename = on_rename
+
+        # Список бесед с прокруткой
+        self.conversation_list = ft.ListView(**AppStyles.SIDEBAR_LIST)
+
+        # Кнопка создания новой беседы
+        self.new_button = ft.ElevatedButton(
+            on_click=lambda e: self.on_create and self.on_create(),
+            **AppStyles.NEW_CHAT_BUTTON
+        )
+
+        self.content = ft.Column(
+            controls=[
+                self.new_button,
+                ft.Divider(height=1, color=ft.Colors.GREY_700),
+                self.conversation_list
+            ],
+            expand=True,
+            spacing=10
+        )
+
+        # Первичное заполнение списка
+        self.refresh()
+
+    def refresh(self):
+        """
+        Перечитывание списка бесед из базы и перерисовка элементов.
+
+        Вызывающий код сам отвечает за page.update().
+        """
+        current_id = self.cache.current_conversation_id
+        self.conversation_list.controls = [
+            self._build_tile(conversation, conversation["id"] == current_id)
+            for conversation in self.cache.list_conversations()
+        ]
+
+    def _build_tile(self, conversation: dict, selected: bool):
+        """
+        Создание элемента списка для одной беседы.
+
+        Args:
+            conversation (dict): Данные беседы из list_conversations()
+            selected (bool): Является ли беседа текущей
+
+        Returns:
+            ft.ListTile: Элемент списка бесед
+        """
+        # Время последней активности без долей секунды
+        last_activity = str(conversation["last_activity"] or "")[:16]
+
+        return ft.ListTile(
+            title=ft.Text(
+                conversation["title"],
+                color=ft.Colors.WHITE,
+                size=14,
+                max_lines=1,
+                overflow=ft.TextOverflow.ELLIPSIS
+            ),
+            subtitle=ft.Text(
+                f"{conversation['message_count']} сообщ. · {last_activity}",
+                color=ft.Colors.GREY_400,
+                size=11
+            ),
+            trailing=ft.IconButton(
+                icon=ft.icons.EDIT,
+                icon_size=16,
+                tooltip="Переименовать",
+                on_click=lambda e, c=conversation: self.on_rename and self.on_rename(c["id"], c["title"])
+            ),
+            selected=selected,
+            bgcolor=ft.Colors.GREY_800 if selected else None,
+            dense=True,
+            on_click=lambda e, c=conversation: self.on_select and self.on_select(c["id"])
+        )
+
+
+class BranchSelector(ft.Dropdown):
+    """
+    Переключатель веток текущей беседы.
+
+    Ветка появляется, когда пользователь редактирует одно из прошлых
+    сообщений и отправляет его заново. Список строится из листьев дерева
+    ходов (ChatCache.list_branches()); при одной ветке переключатель скрыт.
+
+    Args:
+        cache (ChatCache): Экземпляр класса кэширования
+        on_switch: Колбэк переключения, принимает ID последнего хода ветки
+    """
+    def __init__(self, cache, on_switch=None):
+        # Инициализация родительского класса Dropdown
+        super().__init__(**AppStyles.BRANCH_DROPDOWN)
+
+        self.cache = cache
+        self.on_switch = on_switch
+        self.on_change = self._handle_change
+
+        # Первичное заполнение списка
+        self.refresh()
+
+    def refresh(self):
+        """
+        Перечитывание веток текущей беседы.
+
+        Вызывающий код сам отвечает за page.update().
+        """
+        branches = self.cache.list_branches()
+        self.options = [
+            ft.dropdown.Option(
+                key=str(branch["head_id"]),
+                text=f"{str(branch['timestamp'])[:16]} · {str(branch['user_message'] or '')[:40]}"
+            )
+            for branch in branches
+        ]
+        current = next((branch for branch in branches if branch["is_current"]), None)
+        self.value = str(current["head_id"]) if current else None
+        self.visible = len(branches) > 1
+
+    def _handle_change(self, e):
+        """Обработка выбора ветки"""
+        if self.value and self.on_switch:
+            self.on_switch(int(self.value))
+
+
+class AnalyticsDashboard(ft.Container):
+    """
+    Панель графиков аналитики: сообщения, токены, расходы и квантили времени ответа за период.
+
+    Данные берутся из сводных таблиц и скетчей (Analytics.get_usage_series,
+    Analytics.get_latency_series), поэтому панель открывается быстро на базе
+    любого размера; длинные ряды уже прорежены до нескольких сотен точек.
+
+    Args:
+        analytics (Analytics): Экземпляр класса аналитики
+    """
+
+    # Периоды графиков: ключ -> (название, длительность; None - вся история)
+    RANGES = {
+        "day": ("24 часа", timedelta(days=1)),
+        "week": ("7 дней", timedelta(days=7)),
+        "month": ("30 дней", timedelta(days=30)),
+        "year": ("Год", timedelta(days=365)),
+        "all": ("Вся история", None),
+    }
+    # Ключ выбора "все модели" в списке моделей
+    ALL_MODELS = "__all__"
+
+    def __init__(self, analytics):
+        # Инициализация родительского класса Container
+        super().__init__(**AppStyles.DASHBOARD_CONTAINER)
+
+        self.analytics = analytics
+
+        # Выбор периода и модели
+        self.range_dropdown = ft.Dropdown(
+            options=[ft.dropdown.Option(key=key, text=title) for key, (title, _) in self.RANGES.items()],
+            value="week",
+            width=160,
+            on_change=lambda e: self.refresh(),
+            **AppStyles.DASHBOARD_DROPDOWN
+        )
+        self.model_dropdown = ft.Dropdown(
+            options=[ft.dropdown.Option(key=self.ALL_MODELS, text="Все модели")] + [
+                ft.dropdown.Option(key=model, text=model) for model in sorted(analytics.model_usage)
+            ],
+            value=self.ALL_MODELS,
+            width=320,
+            on_change=lambda e: self.refresh(),
+            **AppStyles.DASHBOARD_DROPDOWN
+        )
+        self.charts = ft.Column(spacing=15)
+
+        self.content = ft.Column(
+            controls=[ft.Row([self.range_dropdown, self.model_dropdown]), self.charts],
+            scroll=ft.ScrollMode.AUTO,
+            spacing=10
+        )
+
+        # Первичное построение графиков
+        self.refresh()
+
+    def refresh(self):
+        """
+        Перестроение графиков для выбранного периода и модели.
+
+        Если панель уже показана, обновляет страницу.
+        """
+        _, duration = self.RANGES[self.range_dropdown.value]
+        start = datetime.now() - duration if duration else None
+        model = None if self.model_dropdown.value == self.ALL_MODELS else self.model_dropdown.value
+
+        self.charts.controls = [
+            self._build_chart("Сообщения", self.analytics.get_usage_series('count', start, model=model)),
+            self._build_chart("Токены", self.analytics.get_usage_series('tokens', start, model=model)),
+            self._build_chart("Расходы, $", self.analytics.get_usage_series('cost', start, model=model)),
+            self._build_chart("Время ответа, с", self.analytics.get_latency_series(start, model=model)),
+        ]
+        if self.page:
+            self.update()
+
+    def _build_chart(self, title, series):
+        """
+        График нескольких рядов с легендой.
+
+        Args:
+            title (str): Заголовок графика
+            series (dict): Имя ряда -> список (datetime, значение)
+
+        Returns:
+            ft.Column: Заголовок, легенда и график (или надпись об отсутствии данных)
+        """
+        # Не больше рядов, чем цветов: остальные модели видны при выборе модели
+        series = {name: points for name, points in series.items() if points}
+        series = dict(list(series.items())[:len(AppStyles.CHART_COLORS)])
+        if not series:
+            return ft.Column([ft.Text(title, weight=ft.FontWeight.BOLD), ft.Text("Нет данных", color=ft.Colors.GREY_500)])
+
+        xs = [point[0].timestamp() for points in series.values() for point in points]
+        max_y = max(value for points in series.values() for _, value in points) or 1
+        min_x, max_x = min(xs), max(xs)
+        # Формат подписей оси времени зависит от длины периода
+        time_format = "%d.%m %H:%M" if max_x - min_x <= 2 * 86400 else "%d.%m.%y"
+
+        chart = ft.LineChart(
+            data_series=[
+                ft.LineChartData(
+                    data_points=[ft.LineChartDataPoint(bucket.timestamp(), value) for bucket, value in points],
+                    color=color,
+                    stroke_width=2,
+                )
+                for (name, points), color in zip(series.items(), AppStyles.CHART_COLORS)
+            ],
+            min_x=min_x,
+            max_x=max_x if max_x > min_x else min_x + 1,
+            min_y=0,
+            max_y=max_y * 1.1,
+            left_axis=ft.ChartAxis(labels_size=45),
+            bottom_axis=ft.ChartAxis(
+                labels=[
+                    ft.ChartAxisLabel(value=x, label=ft.Text(datetime.fromtimestamp(x).strftime(time_format), size=10))
+                    for x in sorted({min_x, (min_x + max_x) / 2, max_x})
+                ],
+                labels_size=25,
+            ),
+            **AppStyles.DASHBOARD_CHART
+        )
+        legend = ft.Row(
+            [
+                ft.Text(name, color=color, size=11)
+                for name, color in zip(series, AppStyles.CHART_COLORS)
+            ],
+            wrap=True
+        )
+        return ft.Column([ft.Text(title, weight=ft.FontWeight.BOLD), legend, chart], spacing=5)
+
+
 class LoginWindow(ft.AlertDialog):
     """
     Окно аутентификации (входа в систему).
@@ -70,7 +70,21 @@ class AppStyles:
             bgcolor=ft.Colors.BLUE_700,      # Цвет фона
             padding=10,                      # Внутренние отступы
         ),
-        "tooltip": "Сохранить диалог в файл", # Всплывающая подсказка
+        "tooltip": "Экспортировать диалог в NDJSON файл", # Всплывающая подсказка
+        "width": 130,                        # Ширина кнопки
+        "height": 40,                        # Высота кнопки
+    }
+
+    # Настройки кнопки импорта истории
+    IMPORT_BUTTON = {
+        "text": "Импорт",                    # Текст на кнопке
+        "icon": ft.icons.UPLOAD_FILE,        # Иконка загрузки файла
+        "style": ft.ButtonStyle(             # Стиль оформления кнопки
+            color=ft.Colors.WHITE,           # Цвет текста
+            bgcolor=ft.Colors.BLUE_700,      # Цвет фона
+            padding=10,                      # Внутренние отступы
+        ),
+        "tooltip": "Импортировать историю из NDJSON файла",  # Всплывающая подсказка
         "width": 130,                        # Ширина кнопки
         "height": 40,                        # Высота кнопки
     }
@@ -184,6 +198,91 @@ class AppStyles:
         "border": ft.border.all(1, ft.Colors.GREY_700),  # Тонкая серая граница
     }
 
+    # Настройки боковой панели со списком бесед
+    SIDEBAR_CONTAINER = {
+        "width": 240,                        # Ширина панели
+        "padding": 10,                       # Внутренние отступы
+        "bgcolor": ft.Colors.GREY_900,       # Цвет фона
+        "border_radius": 8,                  # Радиус скругления углов
+        "border": ft.border.all(1, ft.Colors.GREY_700),  # Тонкая серая граница
+    }
+
+    # Настройки списка бесед в боковой панели
+    SIDEBAR_LIST = {
+        "expand": True,                      # Список занимает всю высоту панели
+        "spacing": 2,                        # Отступ между элементами
+    }
+
+    # Настройки кнопки создания новой беседы
+    NEW_CHAT_BUTTON = {
+        "text": "Новый чат",                 # Текст на кнопке
+        "icon": ft.icons.ADD,                # Иконка добавления
+        "style": ft.ButtonStyle(             # Стиль оформления кнопки
+            color=ft.Colors.WHITE,           # Цвет текста
+            bgcolor=ft.Colors.BLUE_700,      # Цвет фона
+            padding=10,                      # Внутренние отступы
+        ),
+        "tooltip": "Начать новую беседу",    # Всплывающая подсказка
+        "width": 220,                        # Ширина кнопки
+        "height": 40,                        # Высота кнопки
+    }
+
+    # Настройки переключателя веток беседы
+    BRANCH_DROPDOWN = {
+        "width": 400,                        # Ширина списка
+        "height": 45,                        # Высота в закрытом состоянии
+        "border_radius": 8,                  # Радиус скругления углов
+        "bgcolor": ft.Colors.GREY_900,       # Цвет фона
+        "border_color": ft.Colors.GREY_700,  # Цвет границы
+        "color": ft.Colors.WHITE,            # Цвет текста
+        "content_padding": 10,               # Внутренние отступы
+        "text_size": 13,                     # Размер шрифта
+        "hint_text": "Ветка беседы",         # Текст-подсказка
+        "tooltip": "Переключить ветку беседы",  # Всплывающая подсказка
+    }
+
+    # Настройки панели графиков аналитики
+    DASHBOARD_CONTAINER = {
+        "width": 680,                        # Ширина панели в диалоге
+        "height": 560,                       # Высота панели в диалоге
+    }
+
+    # Настройки выпадающих списков периода и модели на панели графиков
+    DASHBOARD_DROPDOWN = {
+        "height": 45,                        # Высота в закрытом состоянии
+        "border_radius": 8,                  # Радиус скругления углов
+        "bgcolor": ft.Colors.GREY_900,       # Цвет фона
+        "border_color": ft.Colors.GREY_700,  # Цвет границы
+        "color": ft.Colors.WHITE,            # Цвет текста
+        "content_padding": 10,               # Внутренние отступы
+        "text_size": 13,                     # Размер шрифта
+    }
+
+    # Настройки графика временного ряда
+    DASHBOARD_CHART = {
+        "height": 150,                       # Высота графика
+        "tooltip_bgcolor": ft.Colors.with_opacity(0.9, ft.Colors.GREY_800),  # Фон подсказки
+        "border": ft.border.all(1, ft.Colors.GREY_700),  # Рамка области графика
+        "horizontal_grid_lines": ft.ChartGridLines(color=ft.Colors.GREY_800, width=1),  # Линии сетки
+    }
+
+    # Цвета линий графиков (по порядку рядов)
+    CHART_COLORS = [
+        ft.Colors.BLUE_400,
+        ft.Colors.GREEN_400,
+        ft.Colors.ORANGE_400,
+        ft.Colors.PURPLE_300,
+        ft.Colors.RED_400,
+        ft.Colors.TEAL_300,
+    ]
+
+    # Настройки строки с боковой панелью и основной колонкой
+    LAYOUT_ROW = {
+        "expand": True,                                   # Разрешение расширения
+        "spacing": 20,                                    # Отступ между панелью и чатом
+        "vertical_alignment": ft.CrossAxisAlignment.STRETCH,  # Растягивание по высоте
+    }
+
     @staticmethod
     def set_window_size(page: ft.Page):
         """
@@ -192,6 +291,6 @@ class AppStyles:
         Args:
             page (ft.Page): Объект страницы приложения
         """
-        page.window.width = 600              # Фиксированная ширина окна
+        page.window.width = 880              # Фиксированная ширина окна (чат + панель бесед)
         page.window.height = 800             # Фиксированная высота окна
         page.window.resizable = False        # Запрет изменения размера пользователем
@@ -3,13 +3,46 @@ Utils package initialization.
 Contains utility modules for the application.
 """
 from .analytics import Analytics
+from .anomaly import AnomalyDetector
+from .backup import BackupScheduler
+from .budget import BudgetGuard
 from .cache import ChatCache
+from .compression import MessageCompressor
+from .export import HistoryExporter, AnalyticsExporter
 from .logger import AppLogger
+from .loop_monitor import LoopMonitor, CountingExecutor
+from .memory import MemoryDiagnostics
+from .metrics import MetricsRegistry, MetricsServer, Counter, Gauge, Histogram
 from .monitor import PerformanceMonitor
+from .retention import RetentionPolicy, RetentionManager
+from .storage import StorageBackend, SQLiteFileBackend, MemoryBackend, LogStructuredBackend
+from .storage_daemon import StorageDaemon, RemoteChatCache
 
 __all__ = [
     'Analytics',
+    'AnomalyDetector',
+    'BackupScheduler',
+    'BudgetGuard',
     'ChatCache',
+    'MessageCompressor',
+    'HistoryExporter',
+    'AnalyticsExporter',
     'AppLogger',
-    'PerformanceMonitor'
+    'LoopMonitor',
+    'CountingExecutor',
+    'MemoryDiagnostics',
+    'MetricsRegistry',
+    'MetricsServer',
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'PerformanceMonitor',
+    'RetentionPolicy',
+    'RetentionManager',
+    'StorageBackend',
+    'SQLiteFileBackend',
+    'MemoryBackend',
+    'LogStructuredBackend',
+    'StorageDaemon',
+    'RemoteChatCache'
 ]
@@ -1,6 +1,11 @@
 # Импорт необходимых библиотек
 import time                  # Библиотека для работы с временными метками и измерения интервалов
-from datetime import datetime  # Библиотека для работы с датой и временем в удобном формате
+from collections import deque  # Исходы последних запросов для доли ошибок
+from datetime import datetime, timedelta  # Библиотека для работы с датой и временем в удобном формате
+from .sketch import LatencySketch  # Скетчи квантилей времени ответа
+from .columnar import SessionStore  # Колоночное хранение метрик сообщений
+from .timeseries import lttb, fill_buckets, BUCKET_STEPS  # Временные ряды для графиков
+from .tracing import span  # Интервалы трассировки записи хода
 
 class Analytics:
     """
@@ -12,62 +17,179 @@ class Analytics:
     - Использование токенов
     - Длину сообщений
     - Общую длительность сессии
+    - Время ответа и долю ошибок для детектора отклонений (если он задан)
     """
 
-    def __init__(self, cache):
+    # Количество последних запросов, по которым считается доля ошибок
+    ERROR_RATE_WINDOW = 20
+
+    def __init__(self, cache, detector=None):
         """
         Инициализация системы аналитики.
         
         Args:
             cache (ChatCache): Экземпляр класса для работы с базой данных
+            detector (AnomalyDetector, optional): Детектор отклонений для времени ответа и доли ошибок
         
         Создает необходимые структуры данных для хранения:
         - Времени начала сессии
         - Статистики использования моделей
-        - Детальных данных о каждом сообщении
+        - Детальных данных о каждом сообщении (загружаются при первом обращении)
         """
         self.cache = cache
         self.start_time = time.time()
-        self.model_usage = {}
-        self.session_data = []
-        
-        # Загрузка исторических данных из базы
-        self._load_historical_data()
+        self._session_data = None
+        self.detector = detector
+        self._outcomes = deque(maxlen=self.ERROR_RATE_WINDOW)  # True - запрос завершился ошибкой
         
-    def _load_historical_data(self):
+        # Загрузка сводки по моделям из базы (агрегация в SQL)
+        self.model_usage = self.cache.get_model_usage()
+
+        # Цены моделей (долларов за токен) из кэша: доступны и без ответа API
+        self.model_pricing = self.cache.get_model_pricing()
+
+    def set_model_pricing(self, pricing: dict):
+        """
+        Обновление цен моделей (из OpenRouterClient.model_pricing).
+
+        Args:
+            pricing (dict): model -> {'prompt': float, 'completion': float} в долларах за токен
         """
-        Загрузка исторических данных из базы данных.
-        Обновляет статистику использования моделей и сессионные данные.
+        if not pricing:
+            return
+        self.model_pricing.update(pricing)
+        self.cache.save_model_pricing(pricing)
+
+    def compute_cost(self, model: str, prompt_tokens: int, completion_tokens: int, reported_cost=None):
         """
-        history = self.cache.get_analytics_history()
-        
-        for record in history:
-            timestamp, model, message_length, response_time, tokens_used = record
-            
-            # Обновление статистики моделей
-            if model not in self.model_usage:
-                self.model_usage[model] = {
-                    'count': 0,
-                    'tokens': 0
-                }
-            self.model_usage[model]['count'] += 1
-            self.model_usage[model]['tokens'] += tokens_used
-            
-            # Добавление в сессионные данные
-            self.session_data.append({
-                'timestamp': datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S.%f'),
-                'model': model,
-                'message_length': message_length,
-                'response_time': response_time,
-                'tokens_used': tokens_used
-            })
+        Стоимость хода в долларах.
+
+        Стоимость, сообщенная провайдером, точнее (учитывает скидки и кэш
+        запросов), поэтому используется в первую очередь; иначе токены
+        оцениваются по сохраненным ценам модели.
+
+        Args:
+            model (str): Идентификатор модели
+            prompt_tokens (int): Токены запроса
+            completion_tokens (int): Токены ответа
+            reported_cost (float, optional): Стоимость из ответа API
+
+        Returns:
+            float: Стоимость или None, если цены модели неизвестны
+        """
+        if reported_cost is not None:
+            return float(reported_cost)
+        price = self.model_pricing.get(model)
+        if price is None:
+            return None
+        return (prompt_tokens or 0) * price['prompt'] + (completion_tokens or 0) * price['completion']
+
+    def estimate_cost(self, model: str, message: str, completion_tokens: int = None) -> float:
+        """
+        Предварительная оценка стоимости хода до отправки.
+
+        Токены запроса оцениваются по длине текста (около 4 символов на токен),
+        токены ответа - по среднему числу токенов ответа модели в истории.
+
+        Args:
+            model (str): Идентификатор модели
+            message (str): Текст сообщения
+            completion_tokens (int, optional): Ожидаемые токены ответа
+
+        Returns:
+            float: Оценка стоимости (0, если цены модели неизвестны)
+        """
+        if completion_tokens is None:
+            completion_tokens = self.cache.get_average_completion_tokens(model)
+        return self.compute_cost(model, len(message or '') // 4 + 1, completion_tokens) or 0.0
+
+    @property
+    def session_data(self) -> SessionStore:
+        """
+        Детальные данные о сообщениях.
+
+        Строки истории читаются из базы только при первом обращении
+        (например, при экспорте), а не при запуске приложения.
+
+        Returns:
+            SessionStore: Колоночное хранилище; ведет себя как список словарей
+        """
+        if self._session_data is None:
+            self._session_data = self._load_historical_data()
+        return self._session_data
+
+    def get_session_data_size(self) -> int:
+        """
+        Количество загруженных записей сессии (для диагностики памяти).
+
+        В отличие от session_data не загружает историю из базы.
+
+        Returns:
+            int: Количество записей (0 - история еще не загружена)
+        """
+        return len(self._session_data) if self._session_data is not None else 0
+
+    def _load_historical_data(self) -> SessionStore:
+        """
+        Загрузка детальных исторических данных из базы данных.
+
+        Returns:
+            SessionStore: Метрики каждого сообщения
+        """
+        store = SessionStore()
+        for timestamp, model, message_length, response_time, tokens_used in self.cache.get_analytics_history():
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp)
+            store.append(timestamp, model, message_length, response_time, tokens_used)
+        return store
+
+    def track_turn(self, model: str, user_message: str, ai_response: str,
+                   response_time: float, tokens_used: int, conversation_id=None, timings: dict = None,
+                   usage: dict = None, failed: bool = False) -> int:
+        """
+        Сохранение хода диалога вместе с его метриками.
+
+        Сообщение и метрики записываются в базу одной строкой в одной
+        транзакции (ChatCache.save_turn), затем обновляется статистика в памяти.
+
+        Args:
+            model (str): Идентификатор использованной модели
+            user_message (str): Текст сообщения пользователя
+            ai_response (str): Ответ AI модели
+            response_time (float): Время ответа в секундах
+            tokens_used (int): Количество использованных токенов
+            conversation_id (int, optional): ID беседы. По умолчанию - текущая беседа
+            timings (dict, optional): Длительности этапов хода (см. ChatCache.STAGE_COLUMNS)
+            usage (dict, optional): Поле usage ответа API (prompt_tokens, completion_tokens, cost);
+                стоимость без cost вычисляется по ценам модели
+            failed (bool): Ход завершился ошибкой API (уже учтенной track_error); время
+                такого хода и его исход не передаются детектору отклонений
+
+        Returns:
+            int: ID сохраненного сообщения
+        """
+        spend = None
+        if usage:
+            prompt_tokens = usage.get('prompt_tokens')
+            completion_tokens = usage.get('completion_tokens')
+            spend = {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'cost': self.compute_cost(model, prompt_tokens, completion_tokens, usage.get('cost'))
+            }
+        with span('cache.save_turn'):
+            message_id, timestamp = self.cache.save_turn(
+                model, user_message, ai_response, tokens_used, response_time, conversation_id, timings, spend
+            )
+        self._record(timestamp, model, len(user_message or ''), response_time, tokens_used, failed)
+        return message_id
 
     def track_message(self, model: str, message_length: int, response_time: float, tokens_used: int):
         """
         Отслеживание метрик отдельного сообщения.
         
-        Сохраняет подробную информацию о каждом сообщении и обновляет
-        общую статистику использования моделей.
+        Используется для метрик, не связанных с сохраненным сообщением;
+        для ходов диалога предназначен track_turn().
         
         Args:
             model (str): Идентификатор использованной модели
@@ -79,7 +201,331 @@ class Analytics:
         
         # Сохранение в базу данных
         self.cache.save_analytics(timestamp, model, message_length, response_time, tokens_used)
-        
+        self._record(timestamp, model, message_length, response_time, tokens_used)
+
+    def track_error(self, model: str):
+        """
+        Учет ошибки API для модели (в сводных таблицах по часам и дням).
+
+        Args:
+            model (str): Идентификатор модели
+        """
+        self.cache.record_error(model)
+        self._observe_outcome(True)
+
+    def _observe_outcome(self, failed: bool, timestamp=None):
+        """Передача детектору доли ошибок среди последних ERROR_RATE_WINDOW запросов"""
+        if self.detector is None:
+            return
+        self._outcomes.append(failed)
+        self.detector.observe('error_rate', sum(self._outcomes) / len(self._outcomes), timestamp)
+
+    def get_period_statistics(self, start=None, end=None, granularity: str = 'hour', model: str = None) -> list:
+        """
+        Статистика по интервалам за период из сводных таблиц.
+
+        Args:
+            start (datetime, optional): Начало периода
+            end (datetime, optional): Конец периода
+            granularity (str): 'hour' или 'day'
+            model (str, optional): Только указанная модель
+
+        Returns:
+            list: Словари bucket, model, count, tokens, errors, cost,
+                  avg_response_time и std_response_time для каждого интервала
+        """
+        result = []
+        for row in self.cache.get_rollups(granularity, start, end, model):
+            count = row['count']
+            mean = row['latency_sum'] / count if count else 0.0
+            # Дисперсия по сумме и сумме квадратов: E[x^2] - E[x]^2
+            variance = row['latency_sq_sum'] / count - mean * mean if count else 0.0
+            result.append({
+                'bucket': row['bucket'],
+                'model': row['model'],
+                'count': count,
+                'tokens': row['tokens'],
+                'errors': row['errors'],
+                'cost': row['cost'],
+                'avg_response_time': mean,
+                'std_response_time': max(variance, 0.0) ** 0.5
+            })
+        return result
+
+    def get_daily_spend(self, start=None, end=None, model: str = None) -> list:
+        """
+        Расходы по дням (из сводной таблицы по дням).
+
+        Args:
+            start (datetime, optional): Начало периода
+            end (datetime, optional): Конец периода
+            model (str, optional): Только указанная модель
+
+        Returns:
+            list: Пары (день, стоимость в долларах) в порядке времени
+        """
+        days = {}
+        for row in self.cache.get_rollups('day', start, end, model):
+            days[row['bucket']] = days.get(row['bucket'], 0.0) + row['cost']
+        return sorted(days.items())
+
+    def get_spend(self, start=None, end=None) -> float:
+        """
+        Суммарные расходы за период.
+
+        Args:
+            start (datetime, optional): Начало периода (точность - час)
+            end (datetime, optional): Конец периода
+
+        Returns:
+            float: Стоимость в долларах
+        """
+        if start is None and end is None:
+            return self.cache.get_total_cost()
+        return sum(row['cost'] for row in self.cache.get_rollups('hour', start, end))
+
+    def get_spend_by_conversation(self) -> list:
+        """
+        Расходы по беседам.
+
+        Returns:
+            list: Словари id, title, turns, prompt_tokens, completion_tokens, cost
+                  в порядке убывания стоимости
+        """
+        return self.cache.get_conversation_costs()
+
+    # Границы корзин гистограммы времени ответа для эндпоинта метрик (секунды)
+    LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+    def register_metrics(self, registry):
+        """
+        Публикация метрик использования по моделям: сообщения, токены,
+        стоимость и гистограмма времени ответа.
+
+        Значения читаются при запросе метрик из статистики в памяти
+        и сводных таблиц, поэтому на отправку сообщений не влияют.
+
+        Args:
+            registry (MetricsRegistry): Реестр метрик
+        """
+        def usage(key):
+            return lambda: {(model,): stats[key] for model, stats in list(self.model_usage.items())}
+
+        registry.counter('chat_messages', 'Сообщения по моделям', ('model',), callback=usage('count'))
+        registry.counter('chat_tokens', 'Токены по моделям', ('model',), callback=usage('tokens'))
+        registry.counter('chat_cost_dollars', 'Расходы по моделям в долларах', ('model',),
+                         callback=lambda: {(model,): cost for model, cost in self.get_spend_by_model().items()
+                                           if model != 'total'})
+        registry.histogram('chat_response_time_seconds', 'Время ответа по моделям', ('model',),
+                           callback=self._latency_histograms, buckets=self.LATENCY_BUCKETS)
+
+    def _latency_histograms(self) -> dict:
+        """
+        Гистограммы времени ответа по моделям из скетчей и сводных таблиц.
+
+        Returns:
+            dict: (model,) -> (количества по корзинам LATENCY_BUCKETS и +Inf, сумма времени)
+        """
+        sums = {model: totals['avg_response_time'] * totals['count']
+                for model, totals in self.get_range_totals().items()}
+        histograms = {}
+        for model, sketch in self._model_sketches().items():
+            ranks = [sketch.rank(bound) for bound in self.LATENCY_BUCKETS] + [sketch.count]
+            counts = [rank - previous for rank, previous in zip(ranks, [0] + ranks[:-1])]
+            histograms[(model,)] = (counts, sums.get(model, 0.0))
+        return histograms
+
+    def _model_sketches(self, start=None, end=None, granularity: str = 'day') -> dict:
+        """Объединенные скетчи времени ответа по моделям"""
+        sketches = {}
+        for row in self.cache.get_latency_sketches(granularity, start, end):
+            sketch = LatencySketch.from_bytes(row['data'])
+            if row['model'] in sketches:
+                sketches[row['model']].merge(sketch)
+            else:
+                sketches[row['model']] = sketch
+        return sketches
+
+    # Квантили времени ответа, показываемые в статистике
+    PERCENTILES = {'p50': 0.5, 'p95': 0.95, 'p99': 0.99}
+
+    def get_latency_sketch(self, start=None, end=None, model: str = None, granularity: str = 'day') -> LatencySketch:
+        """
+        Объединенный скетч времени ответа за период.
+
+        Args:
+            start (datetime, optional): Начало периода
+            end (datetime, optional): Конец периода
+            model (str, optional): Только указанная модель
+            granularity (str): Интервал скетчей ('day' или 'hour' для точных границ периода)
+
+        Returns:
+            LatencySketch: Скетч (его можно сериализовать и объединить со скетчами других установок)
+        """
+        rows = self.cache.get_latency_sketches(granularity, start, end, model)
+        return LatencySketch.merge_all(row['data'] for row in rows)
+
+    def get_latency_percentiles(self, start=None, end=None, granularity: str = 'day') -> dict:
+        """
+        Квантили времени ответа по моделям за период.
+
+        Returns:
+            dict: model -> {'count': int, 'p50': float, 'p95': float, 'p99': float}
+        """
+        sketches = self._model_sketches(start, end, granularity)
+        return {model: self._percentiles(sketch) for model, sketch in sketches.items()}
+
+    def _percentiles(self, sketch: LatencySketch) -> dict:
+        """Квантили PERCENTILES и количество значений скетча"""
+        result = {'count': sketch.count}
+        for name, q in self.PERCENTILES.items():
+            result[name] = sketch.quantile(q)
+        return result
+
+    # Максимальное количество точек графика после прореживания
+    MAX_CHART_POINTS = 300
+    # Периоды не длиннее этого строятся по часам, длиннее - по дням
+    HOURLY_RANGE_LIMIT = timedelta(days=14)
+    # Показатели сводных таблиц, доступные для графиков
+    USAGE_METRICS = ('count', 'tokens', 'errors', 'cost')
+
+    def _series_granularity(self, start, end):
+        """Интервал сводных таблиц для периода графика"""
+        if start is not None and (end or datetime.now()) - start <= self.HOURLY_RANGE_LIMIT:
+            return 'hour'
+        return 'day'
+
+    def _downsample(self, series, max_points):
+        """Прореживание ряда (datetime, значение) алгоритмом LTTB"""
+        points = [(bucket.timestamp(), value) for bucket, value in series]
+        return [(datetime.fromtimestamp(x), y) for x, y in lttb(points, max_points)]
+
+    def get_usage_series(self, metric: str = 'count', start=None, end=None, model: str = None,
+                         max_points: int = None) -> dict:
+        """
+        Временной ряд использования по моделям для графиков.
+
+        Ряд строится из сводных таблиц (по часам для коротких периодов,
+        по дням для длинных), интервалы без сообщений заполняются нулями,
+        длинные ряды прореживаются LTTB до max_points точек.
+
+        Args:
+            metric (str): 'count' (сообщения), 'tokens', 'errors' или 'cost'
+            start (datetime, optional): Начало периода. По умолчанию - вся история
+            end (datetime, optional): Конец периода. По умолчанию - текущее время
+            model (str, optional): Только указанная модель
+            max_points (int, optional): Максимум точек ряда. По умолчанию - MAX_CHART_POINTS
+
+        Returns:
+            dict: model -> список (datetime, значение)
+
+        Raises:
+            ValueError: Если показатель не поддерживается
+        """
+        if metric not in self.USAGE_METRICS:
+            raise ValueError(f"Неизвестный показатель: {metric}")
+        granularity = self._series_granularity(start, end)
+        rows = self.cache.get_rollups(granularity, start, end, model)
+        if not rows:
+            return {}
+
+        values = {}
+        for row in rows:
+            values.setdefault(row['model'], {})[row['bucket']] = row[metric]
+        # Ряд покрывает весь период: от интервала, содержащего start, до end
+        step = BUCKET_STEPS[granularity]
+        if start is not None:
+            first = start.replace(minute=0, second=0, microsecond=0)
+            if granularity == 'day':
+                first = first.replace(hour=0)
+            last = end or datetime.now()
+        else:
+            first = min(row['bucket'] for row in rows)
+            last = max(row['bucket'] for row in rows) + step
+        return {
+            row_model: self._downsample(fill_buckets(buckets, first, last, step),
+                                        max_points or self.MAX_CHART_POINTS)
+            for row_model, buckets in values.items()
+        }
+
+    def get_latency_series(self, start=None, end=None, model: str = None, max_points: int = None) -> dict:
+        """
+        Временные ряды квантилей времени ответа (p50/p95/p99) для графиков.
+
+        Для каждого интервала скетчи моделей объединяются; интервалы без
+        сообщений пропускаются. Длинные ряды прореживаются LTTB.
+
+        Args:
+            start (datetime, optional): Начало периода
+            end (datetime, optional): Конец периода
+            model (str, optional): Только указанная модель
+            max_points (int, optional): Максимум точек ряда
+
+        Returns:
+            dict: 'p50', 'p95', 'p99' -> список (datetime, секунды)
+        """
+        granularity = self._series_granularity(start, end)
+        sketches = {}
+        for row in self.cache.get_latency_sketches(granularity, start, end, model):
+            sketch = LatencySketch.from_bytes(row['data'])
+            if row['bucket'] in sketches:
+                sketches[row['bucket']].merge(sketch)
+            else:
+                sketches[row['bucket']] = sketch
+
+        buckets = sorted(sketches)
+        return {
+            name: self._downsample([(bucket, sketches[bucket].quantile(q)) for bucket in buckets],
+                                   max_points or self.MAX_CHART_POINTS)
+            for name, q in self.PERCENTILES.items()
+        }
+
+    def get_range_totals(self, start=None, end=None, granularity: str = 'day') -> dict:
+        """
+        Итоги по моделям за период, собранные из сводных таблиц.
+
+        Args:
+            start (datetime, optional): Начало периода
+            end (datetime, optional): Конец периода
+            granularity (str): Интервал сводной таблицы ('day' - меньше строк, 'hour' - точнее границы)
+
+        Returns:
+            dict: model -> {'count', 'tokens', 'errors', 'cost', 'avg_response_time', 'std_response_time'}
+        """
+        sums = {}
+        for row in self.cache.get_rollups(granularity, start, end):
+            total = sums.setdefault(row['model'], {'count': 0, 'tokens': 0, 'errors': 0, 'cost': 0.0,
+                                                   'latency_sum': 0.0, 'latency_sq_sum': 0.0})
+            for key in total:
+                total[key] += row[key]
+
+        totals = {}
+        for model, total in sums.items():
+            count = total['count']
+            mean = total['latency_sum'] / count if count else 0.0
+            variance = total['latency_sq_sum'] / count - mean * mean if count else 0.0
+            totals[model] = {
+                'count': count,
+                'tokens': total['tokens'],
+                'errors': total['errors'],
+                'cost': total['cost'],
+                'avg_response_time': mean,
+                'std_response_time': max(variance, 0.0) ** 0.5
+            }
+        return totals
+
+    def _record(self, timestamp, model, message_length, response_time, tokens_used, failed=False):
+        """
+        Обновление статистики в памяти.
+
+        Args:
+            timestamp (datetime): Время записи
+            model (str): Идентификатор использованной модели
+            message_length (int): Длина сообщения в символах
+            response_time (float): Время ответа в секундах
+            tokens_used (int): Количество использованных токенов
+            failed (bool): Запрос завершился ошибкой (исход уже учтен track_error)
+        """
         # Инициализация статистики для новой модели при первом использовании
         if model not in self.model_usage:
             self.model_usage[model] = {
@@ -91,14 +537,17 @@ class Analytics:
         self.model_usage[model]['count'] += 1          # Увеличение счетчика сообщений
         self.model_usage[model]['tokens'] += tokens_used  # Добавление использованных токенов
 
-        # Сохранение подробной информации о сообщении
-        self.session_data.append({
-            'timestamp': timestamp,           # Время отправки сообщения
-            'model': model,                   # Использованная модель
-            'message_length': message_length, # Длина сообщения
-            'response_time': response_time,   # Время ответа
-            'tokens_used': tokens_used        # Количество токенов
-        })
+        # Базовые уровни времени ответа (отдельно для каждой модели) и доли ошибок;
+        # время неудачного запроса - не время ответа модели, а его исход уже учтен
+        if self.detector is not None and not failed:
+            self.detector.observe(f'response_time/{model}', response_time, timestamp)
+            self._observe_outcome(False, timestamp)
+
+        # Сохранение подробной информации о сообщении (если данные уже загружены;
+        # иначе запись будет прочитана из базы вместе с остальной историей)
+        if self._session_data is None:
+            return
+        self._session_data.append(timestamp, model, message_length, response_time, tokens_used)
 
     def get_statistics(self) -> dict:
         """
@@ -115,6 +564,10 @@ class Analytics:
                 - messages_per_minute: среднее количество сообщений в минуту
                 - tokens_per_message: среднее количество токенов на сообщение
                 - model_usage: статистика использования каждой модели
+                - latency: квантили времени ответа (p50, p95, p99) за всю историю
+                - stages: средние длительности этапов хода (ChatCache.get_stage_averages)
+                  и их разделение на время провайдера и время приложения
+                - spend: расходы в долларах по моделям (model -> стоимость) и всего ('total')
         """
         # Расчет общей длительности сессии
         total_time = time.time() - self.start_time
@@ -141,16 +594,70 @@ class Analytics:
             'tokens_per_message': total_tokens / total_messages if total_messages > 0 else 0,
             
             # Полная статистика использования моделей
-            'model_usage': self.model_usage
+            'model_usage': self.model_usage,
+
+            # Квантили времени ответа: среднее скрывает редкие долгие ответы
+            'latency': self._percentiles(self.get_latency_sketch()),
+
+            # Этапы хода: медленно отвечает провайдер или само приложение
+            'stages': self.get_stage_statistics(),
+
+            # Расходы за всю историю
+            'spend': self.get_spend_by_model()
         }
 
-    def export_data(self) -> list:
+    def get_spend_by_model(self, start=None, end=None) -> dict:
+        """
+        Расходы по моделям за период.
+
+        Returns:
+            dict: model -> стоимость в долларах и 'total' - сумма по всем моделям
+        """
+        spend = {model: total['cost'] for model, total in self.get_range_totals(start, end).items()
+                 if total['cost']}
+        spend['total'] = sum(spend.values())
+        return spend
+
+    def get_session_summary(self, since=None) -> dict:
+        """
+        Статистика по моделям из детальных данных (векторные вычисления по столбцам).
+
+        Args:
+            since (datetime, optional): Учитывать только сообщения не раньше этого времени
+
+        Returns:
+            dict: model -> {'count', 'tokens', 'avg_response_time', 'max_response_time'}
+        """
+        return self.session_data.summary(since)
+
+    def get_stage_statistics(self) -> dict:
+        """
+        Средние длительности этапов хода.
+
+        Returns:
+            dict: Средние по колонкам ChatCache.STAGE_COLUMNS, количество ходов с
+                  измерениями ('turns'), а также 'provider_time' (ожидание ответа
+                  без соединения и загрузка) и 'client_time' (очередь, разбор,
+                  запись в базу и отрисовка) в секундах
+        """
+        stages = self.cache.get_stage_averages()
+
+        def value(key):
+            return stages.get(key) or 0.0
+
+        stages['provider_time'] = value('first_byte_time') - value('connect_time') + value('download_time')
+        stages['client_time'] = (value('queue_time') + value('parse_time')
+                                 + value('persist_time') + value('render_time'))
+        return stages
+
+    def export_data(self) -> SessionStore:
         """
         Экспорт всех собранных данных сессии.
         
         Returns:
-            list: Список словарей с подробной информацией о каждом сообщении
-                 включая временные метки, использованные модели и метрики.
+            SessionStore: Последовательность словарей с подробной информацией о каждом
+                 сообщении (создаются при обращении), включая временные метки,
+                 использованные модели и метрики.
         """
         return self.session_data
 
@@ -164,4 +671,4 @@ class Analytics:
         - Сбрасывает время начала сессии
         """
         self.model_usage.clear()    # Очистка статистики по моделям
-        self.session_data.clear()   # Очистка истории сообщений
+        self._session_data = SessionStore()  # Очистка истории сообщений
@@ -0,0 +1,223 @@
+# Импорт необходимых библиотек
+import math        # Стандартное отклонение
+import os          # Библиотека для работы с переменными окружения
+import threading   # Значения поступают из фонового потока монитора и из интерфейса
+import time        # Время последнего оповещения
+from datetime import datetime  # Час суток значения (сезонный базовый уровень)
+
+
+class AnomalyDetector:
+    """
+    Обнаружение отклонений метрик от выученного базового уровня.
+
+    Для каждой метрики поддерживаются экспоненциально взвешенные среднее
+    и дисперсия (EWMA): общий уровень и отдельный уровень для каждого часа
+    суток (сезонность - днем нагрузка выше, чем ночью). Значение считается
+    отклонением, если оно выше базового уровня больше чем на z_threshold
+    стандартных отклонений и больше минимального значимого отклонения
+    (MIN_DEVIATION или MIN_RELATIVE_DEVIATION от среднего) - так небольшие
+    колебания стабильной метрики не вызывают ложных предупреждений.
+    Учитываются только отклонения вверх: для всех метрик (загрузка,
+    время ответа, доля ошибок) рост означает ухудшение.
+
+    Пока уровень не выучен (меньше min_samples значений), отклонения не
+    определяются - используются фиксированные пороги PerformanceMonitor.
+    Уровень часа используется, когда для этого часа накоплено min_samples
+    значений, до этого - общий уровень.
+
+    Оповещения по одной метрике выдаются не чаще раза в cooldown секунд.
+
+    Args:
+        alpha (float): Вес нового значения в EWMA (0..1)
+        z_threshold (float): Порог отклонения в стандартных отклонениях
+        min_samples (int): Количество значений, после которого уровень считается выученным
+        cooldown (float): Минимальный интервал между оповещениями по метрике (секунды)
+        seasonal (bool): Учитывать ли час суток
+    """
+
+    # Общий (не сезонный) базовый уровень метрики
+    GLOBAL = -1
+
+    # Минимальное значимое отклонение в единицах метрики (по имени до '/')
+    MIN_DEVIATION = {
+        'cpu_percent': 10.0,     # Проценты CPU
+        'memory_percent': 2.0,   # Проценты памяти системы
+        'thread_count': 3,       # Потоки
+        'error_rate': 0.1,       # Доля неудачных запросов
+    }
+    # Для остальных метрик - доля от среднего (например, время ответа)
+    MIN_RELATIVE_DEVIATION = 0.25
+
+    def __init__(self, alpha=0.05, z_threshold=3.0, min_samples=30, cooldown=900, seasonal=True):
+        if not 0 < alpha <= 1:
+            raise ValueError("Вес EWMA должен быть в диапазоне (0, 1]")
+        if z_threshold <= 0 or min_samples < 1:
+            raise ValueError("Порог отклонения и количество значений должны быть положительными")
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.seasonal = seasonal
+
+        self.baselines = {}   # (метрика, час или GLOBAL) -> [среднее, дисперсия, количество]
+        self.dirty = False    # Есть ли изменения, не сохраненные в базу
+        self._active = {}     # Метрика -> последнее отклонение (пока метрика не вернулась к уровню)
+        self._alerted = {}    # Метрика -> время последнего оповещения
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Создание детектора из переменных окружения.
+
+        Использует ANOMALY_Z_THRESHOLD, ANOMALY_MIN_SAMPLES и
+        ANOMALY_ALERT_COOLDOWN_MINUTES.
+
+        Returns:
+            AnomalyDetector: Детектор (3 сигмы, 30 значений, оповещение раз в 15 минут по умолчанию)
+        """
+        z_threshold = os.getenv("ANOMALY_Z_THRESHOLD")
+        min_samples = os.getenv("ANOMALY_MIN_SAMPLES")
+        cooldown = os.getenv("ANOMALY_ALERT_COOLDOWN_MINUTES")
+        return cls(
+            z_threshold=float(z_threshold) if z_threshold else 3.0,
+            min_samples=int(min_samples) if min_samples else 30,
+            cooldown=float(cooldown) * 60 if cooldown else 900
+        )
+
+    def _seasons(self, timestamp):
+        """Ключи базовых уровней для значения: общий и (при сезонности) час суток"""
+        if not self.seasonal:
+            return (self.GLOBAL,)
+        if timestamp is None:
+            timestamp = datetime.now()
+        return (self.GLOBAL, timestamp.hour)
+
+    def _minimum_deviation(self, metric, mean):
+        """Минимальное значимое отклонение метрики"""
+        base = metric.split('/', 1)[0]
+        if base in self.MIN_DEVIATION:
+            return self.MIN_DEVIATION[base]
+        return abs(mean) * self.MIN_RELATIVE_DEVIATION
+
+    def _baseline_locked(self, metric, seasons):
+        """Выученный уровень: часа суток, если накоплен, иначе общий"""
+        for season in reversed(seasons):
+            state = self.baselines.get((metric, season))
+            if state is not None and state[2] >= self.min_samples:
+                return state
+        return None
+
+    def is_learned(self, metric):
+        """Выучен ли общий базовый уровень метрики"""
+        with self._lock:
+            state = self.baselines.get((metric, self.GLOBAL))
+            return state is not None and state[2] >= self.min_samples
+
+    def baseline(self, metric, timestamp=None):
+        """
+        Базовый уровень метрики для момента timestamp.
+
+        Returns:
+            dict: mean, std, count или None, если уровень не выучен
+        """
+        with self._lock:
+            state = self._baseline_locked(metric, self._seasons(timestamp))
+            if state is None:
+                return None
+            return {'mean': state[0], 'std': math.sqrt(state[1]), 'count': state[2]}
+
+    def observe(self, metric, value, timestamp=None):
+        """
+        Проверка значения по базовому уровню и обновление уровня.
+
+        Значение сравнивается с уровнем до обновления; затем уровень
+        обновляется в любом случае, поэтому устойчивое изменение метрики
+        со временем становится новым уровнем.
+
+        Args:
+            metric (str): Имя метрики (например, 'cpu_percent' или 'response_time/<модель>')
+            value (float): Значение
+            timestamp (datetime, optional): Время значения. По умолчанию - текущее
+
+        Returns:
+            dict: Отклонение (metric, value, mean, std, z, timestamp) или None
+        """
+        seasons = self._seasons(timestamp)
+        with self._lock:
+            anomaly = None
+            state = self._baseline_locked(metric, seasons)
+            if state is not None:
+                mean, variance = state[0], state[1]
+                std = math.sqrt(variance)
+                deviation = value - mean
+                z = deviation / std if std > 0 else math.inf
+                if z > self.z_threshold and deviation > self._minimum_deviation(metric, mean):
+                    anomaly = {
+                        'metric': metric,
+                        'value': value,
+                        'mean': mean,
+                        'std': std,
+                        'z': z,
+                        'timestamp': timestamp or datetime.now(),
+                    }
+            if anomaly:
+                self._active[metric] = anomaly
+            else:
+                self._active.pop(metric, None)
+
+            for season in seasons:
+                state = self.baselines.setdefault((metric, season), [value, 0.0, 0])
+                # Первые значения усредняются равномерно, затем - с весом alpha
+                weight = max(self.alpha, 1.0 / (state[2] + 1))
+                diff = value - state[0]
+                state[0] += weight * diff
+                state[1] = (1 - weight) * (state[1] + weight * diff * diff)
+                state[2] += 1
+            self.dirty = True
+            return anomaly
+
+    def get_anomalies(self):
+        """
+        Метрики, последнее значение которых отклоняется от уровня.
+
+        Returns:
+            list: Отклонения (см. observe), по убыванию z
+        """
+        with self._lock:
+            return sorted(self._active.values(), key=lambda anomaly: -anomaly['z'])
+
+    def should_alert(self, metric):
+        """
+        Ограничение частоты оповещений: True не чаще раза в cooldown секунд для метрики.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._alerted.get(metric)
+            if last is not None and now - last < self.cooldown:
+                return False
+            self._alerted[metric] = now
+            return True
+
+    def load(self, baselines):
+        """
+        Загрузка сохраненных уровней.
+
+        Args:
+            baselines (list): Кортежи (metric, season, mean, variance, count)
+        """
+        with self._lock:
+            for metric, season, mean, variance, count in baselines:
+                self.baselines[(metric, season)] = [mean, variance, count]
+            self.dirty = False
+
+    def dump(self):
+        """
+        Уровни для сохранения в базу (ChatCache.save_metric_baselines).
+
+        Returns:
+            list: Кортежи (metric, season, mean, variance, count)
+        """
+        with self._lock:
+            self.dirty = False
+            return [(metric, season, *state) for (metric, season), state in self.baselines.items()]
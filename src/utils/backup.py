@@ -0,0 +1,174 @@
+# Импорт необходимых библиотек
+import os          # Библиотека для работы с файлами и переменными окружения
+import threading   # Библиотека для работы с потоками
+import time        # Библиотека для работы с временными метками
+from datetime import datetime  # Библиотека для работы с датой и временем
+
+
+class BackupScheduler:
+    """
+    Плановые резервные копии базы чата с ротацией.
+
+    Копии создаются в фоновом потоке через ChatCache.backup() (онлайн backup API
+    SQLite), поэтому приложение продолжает работать во время копирования.
+    После копирования снимок проверяется (ChatCache.verify_backup); поврежденный
+    снимок удаляется. Хранятся только keep последних снимков.
+    Длительность и пропускная способность передаются в PerformanceMonitor.
+
+    Args:
+        cache (ChatCache): Экземпляр класса кэширования
+        directory (str): Директория для снимков
+        interval (float, optional): Интервал между снимками в секундах.
+            None - плановое копирование выключено (снимок можно создать вручную)
+        keep (int): Количество хранимых снимков
+        pages_per_step (int): Количество страниц за один шаг копирования
+        monitor (PerformanceMonitor, optional): Монитор для учета длительности копирования
+        logger (AppLogger, optional): Логгер для записи результатов
+    """
+
+    # Шаблон имени файла снимка
+    SNAPSHOT_PREFIX = "chat_cache-"
+    SNAPSHOT_SUFFIX = ".db"
+
+    def __init__(self, cache, directory="backups", interval=None, keep=7, pages_per_step=256,
+                 monitor=None, logger=None):
+        if interval is not None and interval <= 0:
+            raise ValueError("Интервал резервного копирования должен быть положительным")
+        self.cache = cache
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.monitor = monitor
+        self.logger = logger
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()  # Не более одного копирования одновременно
+
+    @classmethod
+    def from_env(cls, cache, monitor=None, logger=None):
+        """
+        Создание планировщика из переменных окружения.
+
+        Использует BACKUP_INTERVAL_HOURS, BACKUP_KEEP и BACKUP_DIR.
+
+        Returns:
+            BackupScheduler: Планировщик (выключенный, если интервал не задан или равен 0)
+        """
+        interval_hours = float(os.getenv("BACKUP_INTERVAL_HOURS") or 0)
+        keep = os.getenv("BACKUP_KEEP")
+        return cls(
+            cache,
+            directory=os.getenv("BACKUP_DIR") or "backups",
+            interval=interval_hours * 3600 if interval_hours != 0 else None,
+            keep=int(keep) if keep else 7,
+            monitor=monitor,
+            logger=logger
+        )
+
+    def list_snapshots(self):
+        """
+        Список снимков, от старых к новым.
+
+        Returns:
+            list: Пути к файлам снимков
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(self.SNAPSHOT_PREFIX) and name.endswith(self.SNAPSHOT_SUFFIX)
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def rotate(self):
+        """
+        Удаление старых снимков сверх keep.
+
+        Returns:
+            list: Пути удаленных снимков
+        """
+        snapshots = self.list_snapshots()
+        removed = snapshots[:-self.keep] if self.keep > 0 else snapshots
+        for path in removed:
+            os.remove(path)
+        return removed
+
+    def snapshot(self):
+        """
+        Создание, проверка и ротация снимка (выполняется в вызывающем потоке).
+
+        Returns:
+            dict: Результат ChatCache.backup() с дополнительными ключами
+                  'ok' (снимок прошел проверку), 'errors' и 'removed' (удаленные старые снимки)
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Метка времени в имени файла задает порядок снимков
+            name = f"{self.SNAPSHOT_PREFIX}{datetime.now():%Y%m%d-%H%M%S}{self.SNAPSHOT_SUFFIX}"
+            path = os.path.join(self.directory, name)
+
+            started = time.perf_counter()
+            try:
+                result = self.cache.backup(path, pages_per_step=self.pages_per_step)
+            except Exception:
+                if self.monitor:
+                    self.monitor.record_operation('backup', time.perf_counter() - started, ok=False)
+                raise
+
+            verification = self.cache.verify_backup(path)
+            result.update(verification)
+            if not verification['ok']:
+                os.remove(path)
+                result['removed'] = []
+            else:
+                result['removed'] = self.rotate()
+
+            if self.monitor:
+                self.monitor.record_operation('backup', result['duration'], result['bytes'],
+                                              ok=verification['ok'])
+            if self.logger:
+                if verification['ok']:
+                    self.logger.info(
+                        f"Резервная копия {path}: {result['bytes'] / 1024:.0f} КБ "
+                        f"за {result['duration']:.2f} с ({result['throughput'] / 1024 / 1024:.1f} МБ/с)"
+                    )
+                else:
+                    self.logger.error(f"Резервная копия {path} не прошла проверку: {verification['errors']}")
+            return result
+
+    def _seconds_until_next(self):
+        """Время до следующего снимка с учетом времени последнего существующего снимка"""
+        snapshots = self.list_snapshots()
+        if not snapshots:
+            return 0
+        age = time.time() - os.path.getmtime(snapshots[-1])
+        return max(0.0, self.interval - age)
+
+    def _run(self):
+        """Цикл фонового потока: ожидание интервала и создание снимка"""
+        while not self._stop_event.wait(self._seconds_until_next()):
+            try:
+                self.snapshot()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Ошибка резервного копирования: {e}")
+                # Повторная попытка не раньше чем через интервал
+                if self._stop_event.wait(self.interval):
+                    break
+
+    def start(self):
+        """Запуск планового копирования в фоновом потоке (если задан интервал)"""
+        if self.interval is None or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="BackupScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка фонового потока (текущее копирование завершается)"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
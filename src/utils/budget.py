@@ -0,0 +1,122 @@
+# Импорт необходимых библиотек
+import os          # Библиотека для работы с переменными окружения
+import time        # Интервалы сверки баланса
+from datetime import datetime  # Границы дня и месяца для лимитов
+
+
+class BudgetGuard:
+    """
+    Контроль расходов перед отправкой сообщения.
+
+    Перед каждым ходом сумма расходов за день и за месяц (из сводных таблиц
+    аналитики) вместе с оценкой стоимости хода сравнивается с лимитами.
+    В режиме 'warn' превышение только порождает предупреждение, в режиме
+    'block' отправка запрещается.
+
+    Баланс аккаунта не запрашивается после каждого хода: запрошенное значение
+    запоминается вместе с суммой расходов на момент запроса, а текущий баланс
+    оценивается как запрошенный минус расходы после запроса. Сверка с API
+    выполняется раз в reconcile_interval секунд.
+
+    Args:
+        analytics (Analytics): Источник расходов и цен моделей
+        daily_limit (float, optional): Лимит расходов за день в долларах
+        monthly_limit (float, optional): Лимит расходов за месяц в долларах
+        mode (str): 'warn' (предупреждать) или 'block' (запрещать отправку)
+        reconcile_interval (float): Интервал сверки баланса с API в секундах
+    """
+
+    # Допустимые режимы реакции на превышение лимита
+    MODES = ('warn', 'block')
+
+    def __init__(self, analytics, daily_limit=None, monthly_limit=None, mode='warn', reconcile_interval=900):
+        if mode not in self.MODES:
+            raise ValueError(f"Неизвестный режим бюджета: {mode}")
+        self.analytics = analytics
+        self.daily_limit = daily_limit
+        self.monthly_limit = monthly_limit
+        self.mode = mode
+        self.reconcile_interval = reconcile_interval
+        self.balance = None          # Баланс при последней сверке
+        self._balance_spend = 0.0    # Сумма расходов на момент сверки
+        self._reconciled_at = None   # Время последней сверки (time.monotonic)
+
+    @classmethod
+    def from_env(cls, analytics):
+        """
+        Создание контроля расходов из переменных окружения.
+
+        Использует BUDGET_DAILY_USD, BUDGET_MONTHLY_USD, BUDGET_MODE и
+        BALANCE_RECONCILE_MINUTES.
+
+        Returns:
+            BudgetGuard: Контроль расходов (без лимитов, если переменные не заданы)
+        """
+        daily_limit = os.getenv("BUDGET_DAILY_USD")
+        monthly_limit = os.getenv("BUDGET_MONTHLY_USD")
+        return cls(
+            analytics,
+            daily_limit=float(daily_limit) if daily_limit else None,
+            monthly_limit=float(monthly_limit) if monthly_limit else None,
+            mode=os.getenv("BUDGET_MODE") or 'warn',
+            reconcile_interval=float(os.getenv("BALANCE_RECONCILE_MINUTES") or 15) * 60
+        )
+
+    def check(self, model, message):
+        """
+        Проверка лимитов перед отправкой сообщения.
+
+        Args:
+            model (str): Идентификатор модели
+            message (str): Текст сообщения
+
+        Returns:
+            tuple: (разрешена ли отправка, список предупреждений)
+        """
+        estimate = self.analytics.estimate_cost(model, message)
+        now = datetime.now()
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        month_start = day_start.replace(day=1)
+
+        warnings = []
+        limits = (('дневной', self.daily_limit, day_start), ('месячный', self.monthly_limit, month_start))
+        for name, limit, start in limits:
+            if limit is None:
+                continue
+            spent = self.analytics.get_spend(start)
+            if spent + estimate > limit:
+                warnings.append(f"Превышен {name} лимит: ${spent:.2f} из ${limit:.2f}")
+
+        balance = self.estimated_balance()
+        if balance is not None and balance < estimate:
+            warnings.append(f"Недостаточно средств: ${balance:.2f}")
+
+        return not (warnings and self.mode == 'block'), warnings
+
+    def reconcile(self, balance):
+        """
+        Сверка с балансом, полученным от API.
+
+        Args:
+            balance (float): Баланс в долларах (None - запрос не удался, оценка сохраняется)
+        """
+        self._reconciled_at = time.monotonic()
+        if balance is None:
+            return
+        self.balance = balance
+        self._balance_spend = self.analytics.get_spend()
+
+    def needs_reconcile(self):
+        """Прошел ли интервал сверки с момента последней сверки"""
+        return self._reconciled_at is None or time.monotonic() - self._reconciled_at >= self.reconcile_interval
+
+    def estimated_balance(self):
+        """
+        Оценка текущего баланса: баланс при сверке минус расходы после нее.
+
+        Returns:
+            float: Баланс в долларах или None до первой успешной сверки
+        """
+        if self.balance is None:
+            return None
+        return max(0.0, self.balance - (self.analytics.get_spend() - self._balance_spend))
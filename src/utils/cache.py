@@ -1,10 +1,18 @@
 # Импорт необходимых библиотек
 import sqlite3      # Библиотека для работы с SQLite базой данных
 import json        # Библиотека для работы с JSON форматом
+import os          # Библиотека для работы с файлами и переменными окружения
 from datetime import datetime  # Библиотека для работы с датой и временем
 import threading   # Библиотека для обеспечения потокобезопасности
 import hashlib     # Библиотека для хэширования данных
 import secrets     # Библиотека для генерации безопасных случайных чисел
+import time        # Библиотека для измерения длительности операций
+from collections import OrderedDict  # Упорядоченный словарь для LRU кэша текстов
+from .compression import MessageCompressor, CompressedText  # Сжатие текстов сообщений
+from .retention import ArchiveStore  # Архивные сегменты "холодных" сообщений
+from .storage import StorageBackend, SQLiteFileBackend, TimedConnection  # Хранилища базы
+from .sketch import LatencySketch  # Скетчи квантилей времени ответа
+from .metrics import Histogram  # Длительность фиксации транзакций
 
 class ChatCache:
     """
@@ -16,9 +24,56 @@ class ChatCache:
     - Форматированный вывод истории
     - Очистку истории
     - Хранение аутентификационных данных (ключ, PIN)
+    - Раздельное хранение нескольких бесед (conversations) и переключение между ними
+    - Опциональное сжатие длинных текстов сообщений (zlib/zstd с обученным словарем)
+    - Перенос старых сообщений в архивные сегменты и инкрементальную очистку файла базы
+    - Опциональную дедупликацию повторяющихся текстов (таблица blobs со счетчиком ссылок)
+    - Единую запись хода (сообщение и метрики в одной строке, одна транзакция)
+    - Онлайн-копирование базы без остановки приложения (SQLite backup API)
+    - Ветвление бесед: сообщения образуют дерево (parent_id), ветки делят общий префикс
     """
+
+    # Название беседы, в которую переносятся сообщения старых баз
+    DEFAULT_CONVERSATION_TITLE = "Основной чат"
+    # Название по умолчанию для новых бесед
+    NEW_CONVERSATION_TITLE = "Новый чат"
+    # Минимальная длина ответа AI (в символах), начиная с которой он сжимается
+    COMPRESS_MIN_LENGTH = 256
+    # Минимальная длина сообщения пользователя для сжатия (короткие вопросы не сжимаются)
+    COMPRESS_USER_MIN_LENGTH = 1024
+    # Максимальное количество сообщений в одном архивном сегменте
+    ARCHIVE_SEGMENT_ROWS = 5000
+    # Минимальная длина текста для дедупликации (короткие тексты дешевле хранить на месте)
+    DEDUP_MIN_LENGTH = 64
+    # Количество "горячих" текстов в LRU кэше дедупликации
+    BLOB_CACHE_SIZE = 512
+    # Время ожидания освобождения блокировки записи (в секундах), прежде чем
+    # SQLite вернет ошибку "database is locked"
+    BUSY_TIMEOUT = 10.0
+    # Класс соединений SQLite (демон хранилища подставляет соединение с пакетными транзакциями)
+    connection_factory = TimedConnection
+    # Границы корзин гистограммы длительности фиксации транзакций (секунды)
+    COMMIT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+    # Максимальный разрыв (в секундах) между записью сообщения и записью аналитики,
+    # при котором старые строки analytics_messages считаются одним ходом с сообщением
+    TURN_MATCH_WINDOW = 10
+    # Этапы хода (в секундах; tokens_per_second - токены ответа за время провайдера):
+    # ожидание в очереди, соединение, время сервера до первого байта ответа
+    # (не до первого токена - ответ не потоковый), загрузка тела,
+    # разбор JSON, запись в базу и отрисовка ответа
+    STAGE_COLUMNS = ('queue_time', 'connect_time', 'first_byte_time', 'download_time',
+                     'parse_time', 'persist_time', 'render_time', 'tokens_per_second')
+    # Расход хода: токены запроса и ответа, стоимость в долларах
+    COST_COLUMNS = ('prompt_tokens', 'completion_tokens', 'cost')
+    # Все дополнительные метрики хода (колонки messages и analytics_messages)
+    TURN_METRIC_COLUMNS = STAGE_COLUMNS + COST_COLUMNS
+    # Интервалы сводных таблиц аналитики: имя -> формат начала интервала для strftime
+    ROLLUP_GRANULARITIES = {
+        'hour': '%Y-%m-%d %H:00:00',
+        'day': '%Y-%m-%d 00:00:00',
+    }
     
-    def __init__(self):
+    def __init__(self, compression=None, dedup=None, db_name=None, backend=None):
         """
         Инициализация системы кэширования.
         
@@ -26,9 +81,29 @@ class ChatCache:
         - Файл базы данных SQLite
         - Потокобезопасное хранилище соединений
         - Необходимые таблицы в базе данных
+
+        Args:
+            compression (str, optional): Алгоритм сжатия сообщений ('zlib' или 'zstd').
+                По умолчанию берется из переменной окружения CACHE_COMPRESSION;
+                если она не задана - сообщения хранятся без сжатия
+            dedup (bool, optional): Хранить ли длинные тексты в таблице blobs по хэшу
+                содержимого. По умолчанию берется из переменной окружения CACHE_DEDUP
+            db_name (str, optional): Путь к файлу SQLite базы данных (сокращение
+                для backend=SQLiteFileBackend(db_name))
+            backend (StorageBackend, optional): Хранилище базы. По умолчанию
+                выбирается переменными окружения CACHE_BACKEND и CACHE_DB_PATH
         """
-        # Имя файла SQLite базы данных
-        self.db_name = 'chat_cache.db'
+        # Хранилище базы и его расположение (абсолютный путь для файловых хранилищ)
+        if backend is None:
+            backend = SQLiteFileBackend(db_name) if db_name else StorageBackend.from_env()
+        self.backend = backend
+        self.db_name = backend.location
+
+        # Длительность commit() соединений кэша (публикуется через register_metrics)
+        self.commit_latency = Histogram(
+            'chat_cache_commit_seconds', 'Длительность фиксации транзакций базы',
+            buckets=self.COMMIT_LATENCY_BUCKETS
+        )
         
         # Создание потокобезопасного хранилища соединений
         # Каждый поток будет иметь свое собственное соединение с базой
@@ -37,120 +112,2286 @@ class ChatCache:
         # Создание необходимых таблиц при инициализации
         self.create_tables()
 
-    def get_connection(self):
+        # Архив "холодных" сообщений (по умолчанию - рядом с файлом базы)
+        self.archive = ArchiveStore(self.backend.get_archive_dir())
+
+        # Настройка сжатия. Распаковка возможна всегда, даже при выключенном
+        # сжатии новых сообщений, поэтому компрессор создается в любом случае
+        compression = compression or os.getenv("CACHE_COMPRESSION") or None
+        self.compression_enabled = compression is not None
+        self.compressor = MessageCompressor(
+            compression or 'zlib',
+            dictionary_loader=self._load_compression_dictionary
+        )
+        if self.compression_enabled:
+            self._activate_latest_dictionary()
+
+        # Настройка дедупликации и LRU кэша "горячих" текстов.
+        # Чтение ссылок на blobs работает всегда, независимо от настройки
+        if dedup is None:
+            dedup = os.getenv("CACHE_DEDUP", "").lower() in ('1', 'true', 'yes')
+        self.dedup_enabled = bool(dedup)
+        self._blob_cache = OrderedDict()
+        self._blob_cache_lock = threading.Lock()  # Кэш используется и фоновыми потоками
+
+        # Длительности этапов, известные после сохранения хода (update_turn_timings):
+        # ID хода -> длительности; записываются транзакцией следующего хода
+        self._pending_timings = {}
+        self._pending_timings_lock = threading.Lock()
+
+        # Текущая (открытая) беседа; история загружается лениво,
+        # только когда интерфейс запрашивает сообщения этой беседы
+        self.current_conversation_id = self.get_or_create_default_conversation()
+
+    def get_connection(self):
+        """
+        Получение соединения с базой данных для текущего потока.
+        
+        Returns:
+            sqlite3.Connection: Объект соединения с базой данных
+            
+        Note:
+            Каждый поток получает свое собственное соединение,
+            что обеспечивает потокобезопасность работы с базой.
+        """
+        # Проверяем, есть ли уже соединение в текущем потоке
+        if not hasattr(self.local, 'connection'):
+            # Если соединения нет - создаем новое. При занятой другим процессом
+            # базе запись ждет до BUSY_TIMEOUT секунд вместо немедленной ошибки
+            self.local.connection = self.backend.connect(
+                self.BUSY_TIMEOUT, factory=self.connection_factory
+            )
+            # Внешние ключи в SQLite включаются отдельно для каждого соединения
+            self.local.connection.execute('PRAGMA foreign_keys = ON')
+            if isinstance(self.local.connection, TimedConnection):
+                self.local.connection.commit_latency = self.commit_latency
+        return self.local.connection
+
+    def register_metrics(self, registry):
+        """
+        Публикация метрик базы: длительность фиксации транзакций и размер базы.
+
+        Args:
+            registry (MetricsRegistry): Реестр метрик
+        """
+        registry.register(self.commit_latency)
+        registry.gauge('chat_cache_size_bytes', 'Размер базы (с учетом журнала WAL)',
+                       callback=self.get_database_size)
+
+    def get_database_size(self):
+        """
+        Размер базы в байтах: страницы, видимые с учетом журнала WAL.
+
+        Returns:
+            int: Размер базы
+        """
+        conn = self.get_connection()
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
+
+    def create_tables(self):
+        """
+        Создание необходимых таблиц в базе данных.
+        
+        Создает таблицу conversations (беседы) и таблицу messages
+        со следующими полями:
+        - id: уникальный идентификатор сообщения
+        - model: идентификатор использованной модели
+        - user_message: текст сообщения пользователя
+        - ai_response: ответ AI модели
+        - timestamp: время создания сообщения
+        - tokens_used: количество использованных токенов
+        - conversation_id: беседа, к которой относится сообщение
+        - message_length, response_time: метрики хода (заполняются save_turn)
+        - parent_id: предыдущий ход в ветке беседы (дерево ходов)
+        """
+        # Создаем новое соединение с базой
+        conn = self.backend.connect(self.BUSY_TIMEOUT)
+        cursor = conn.cursor()
+
+        # Режим инкрементальной очистки: освобожденные страницы возвращаются
+        # небольшими шагами (PRAGMA incremental_vacuum) вместо полного VACUUM.
+        # Для уже существующей базы режим вступает в силу только после VACUUM
+        cursor.execute('PRAGMA auto_vacuum')
+        needs_vacuum = cursor.fetchone()[0] != 2
+        if needs_vacuum:
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        
+        # SQL запросы для создания таблиц
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,  -- Уникальный ID беседы
+                title TEXT NOT NULL,                  -- Название беседы
+                created_at DATETIME,                  -- Время создания
+                head_id INTEGER                       -- Последний ход текущей ветки
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,  -- Уникальный ID сообщения
+                model TEXT,                           -- Идентификатор модели
+                user_message TEXT,                    -- Текст от пользователя
+                ai_response TEXT,                     -- Ответ от AI
+                timestamp DATETIME,                   -- Время создания
+                tokens_used INTEGER,                  -- Использовано токенов
+                conversation_id INTEGER               -- Беседа, которой принадлежит сообщение
+                    REFERENCES conversations(id) ON DELETE CASCADE,
+                user_message_ref BLOB,                -- Хэш текста пользователя в blobs (при дедупликации)
+                ai_response_ref BLOB,                 -- Хэш ответа AI в blobs (при дедупликации)
+                message_length INTEGER,               -- Длина сообщения пользователя (метрика хода)
+                response_time FLOAT,                  -- Время ответа в секундах (метрика хода)
+                parent_id INTEGER                     -- Предыдущий ход ветки (NULL - корень)
+            )
+        ''')
+
+        # Миграция баз, созданных до появления бесед: добавляем колонку
+        # и переносим все старые сообщения в одну беседу по умолчанию
+        if not self._column_exists(cursor, 'messages', 'conversation_id'):
+            cursor.execute('''
+                ALTER TABLE messages ADD COLUMN conversation_id INTEGER
+                    REFERENCES conversations(id) ON DELETE CASCADE
+            ''')
+        cursor.execute('SELECT COUNT(*) FROM messages WHERE conversation_id IS NULL')
+        if cursor.fetchone()[0]:
+            cursor.execute(
+                'INSERT INTO conversations (title, created_at) VALUES (?, ?)',
+                (self.DEFAULT_CONVERSATION_TITLE, datetime.now())
+            )
+            cursor.execute(
+                'UPDATE messages SET conversation_id = ? WHERE conversation_id IS NULL',
+                (cursor.lastrowid,)
+            )
+
+        # Миграция баз, созданных до появления дедупликации
+        for column in ('user_message_ref', 'ai_response_ref'):
+            if not self._column_exists(cursor, 'messages', column):
+                cursor.execute(f'ALTER TABLE messages ADD COLUMN {column} BLOB')
+
+        # Тексты, адресуемые по содержимому: хэш -> текст (или сжатые данные).
+        # refcount - количество ссылок из messages, поддерживается триггерами
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash BLOB PRIMARY KEY,             -- BLAKE2b-128 от текста
+                data,                              -- Текст или сжатые данные
+                refcount INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+
+        # Триггеры счетчика ссылок срабатывают при любом изменении messages
+        # (в том числе при каскадном удалении беседы и архивации),
+        # блоб без ссылок удаляется вместе с последним сообщением
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_blobs_insert
+            AFTER INSERT ON messages
+            WHEN NEW.user_message_ref IS NOT NULL OR NEW.ai_response_ref IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.user_message_ref;
+                UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.ai_response_ref;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_blobs_delete
+            AFTER DELETE ON messages
+            WHEN OLD.user_message_ref IS NOT NULL OR OLD.ai_response_ref IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.user_message_ref;
+                UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.ai_response_ref;
+                DELETE FROM blobs
+                WHERE hash IN (OLD.user_message_ref, OLD.ai_response_ref) AND refcount <= 0;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_blobs_update
+            AFTER UPDATE OF user_message_ref, ai_response_ref ON messages
+            BEGIN
+                UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.user_message_ref;
+                UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.ai_response_ref;
+                UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.user_message_ref;
+                UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.ai_response_ref;
+                DELETE FROM blobs
+                WHERE hash IN (OLD.user_message_ref, OLD.ai_response_ref) AND refcount <= 0;
+            END
+        ''')
+
+        # Индекс для выборки сообщений одной беседы в хронологическом порядке:
+        # открытие беседы читает только ее строки, без полного сканирования
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_conversation
+            ON messages (conversation_id, timestamp)
+        ''')
+
+        # Миграция к дереву ходов: сообщения существующих бесед выстраиваются
+        # в одну ветку по времени, ее последний ход становится текущим
+        if not self._column_exists(cursor, 'conversations', 'head_id'):
+            cursor.execute('ALTER TABLE conversations ADD COLUMN head_id INTEGER')
+        if not self._column_exists(cursor, 'messages', 'parent_id'):
+            cursor.execute('ALTER TABLE messages ADD COLUMN parent_id INTEGER')
+            cursor.execute('''
+                SELECT id, LAG(id) OVER (PARTITION BY conversation_id ORDER BY timestamp, id)
+                FROM messages
+            ''')
+            cursor.executemany(
+                'UPDATE messages SET parent_id = ? WHERE id = ?',
+                [(parent_id, row_id) for row_id, parent_id in cursor.fetchall() if parent_id is not None]
+            )
+            cursor.execute('''
+                UPDATE conversations SET head_id = (
+                    SELECT id FROM messages
+                    WHERE conversation_id = conversations.id
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT 1
+                )
+            ''')
+
+        # Индекс для поиска продолжений хода (листья дерева).
+        # Подъем к корню идет по первичному ключу id
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_parent
+            ON messages (parent_id)
+        ''')
+
+        # Метрики, не связанные с сохраненным сообщением: строки старых баз,
+        # не нашедшие пары при миграции, и метрики удаленных сообщений
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analytics_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME,
+                model TEXT,
+                message_length INTEGER,
+                response_time FLOAT,
+                tokens_used INTEGER
+            )
+        ''')
+
+        # Миграция к единой записи хода: метрики переносятся в messages
+        if not self._column_exists(cursor, 'messages', 'response_time'):
+            cursor.execute('ALTER TABLE messages ADD COLUMN message_length INTEGER')
+            cursor.execute('ALTER TABLE messages ADD COLUMN response_time FLOAT')
+            self._merge_analytics_into_messages(cursor)
+
+        # Миграция: длительности этапов и расход хода. Триггер переноса метрик
+        # и представление analytics_turns пересоздаются с новыми колонками
+        metrics_added = False
+        for table in ('messages', 'analytics_messages'):
+            for column in self.TURN_METRIC_COLUMNS:
+                if not self._column_exists(cursor, table, column):
+                    column_type = 'INTEGER' if column.endswith('_tokens') else 'REAL'
+                    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+                    metrics_added = True
+        if metrics_added:
+            cursor.execute('DROP TRIGGER IF EXISTS trg_messages_detach_metrics')
+            cursor.execute('DROP VIEW IF EXISTS analytics_turns')
+        stage_columns = ', '.join(self.TURN_METRIC_COLUMNS)
+        old_stage_values = ', '.join(f'OLD.{column}' for column in self.TURN_METRIC_COLUMNS)
+
+        # При удалении хода (очистка истории, удаление беседы, архивация)
+        # его метрики сохраняются в analytics_messages под тем же ID,
+        # поэтому статистика не меняется (как и до объединения таблиц)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_detach_metrics
+            AFTER DELETE ON messages
+            WHEN OLD.response_time IS NOT NULL
+            BEGIN
+                INSERT OR IGNORE INTO analytics_messages
+                    (id, timestamp, model, message_length, response_time, tokens_used, {stage_columns})
+                VALUES (OLD.id, OLD.timestamp, OLD.model, OLD.message_length,
+                        OLD.response_time, OLD.tokens_used, {old_stage_values});
+            END
+        ''')
+
+        # Представление совместимости: все метрики в прежнем формате
+        # analytics_messages. ID ходов совпадают с ID сообщений
+        cursor.execute(f'''
+            CREATE VIEW IF NOT EXISTS analytics_turns AS
+            SELECT id, timestamp, model, message_length, response_time, tokens_used, {stage_columns}
+            FROM messages
+            WHERE response_time IS NOT NULL
+            UNION ALL
+            SELECT id, timestamp, model, message_length, response_time, tokens_used, {stage_columns}
+            FROM analytics_messages
+        ''')
+
+        # Покрывающий индекс по ходам с метриками: сводка по моделям при запуске
+        # (get_model_usage) читает только индекс, не затрагивая тексты сообщений
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_turn_usage
+            ON messages (model, tokens_used)
+            WHERE response_time IS NOT NULL
+        ''')
+
+        # Сводные таблицы аналитики по часам и дням: счетчики обновляются
+        # триггерами при каждой записи метрик, запросы за период читают
+        # по строке на интервал вместо всех ходов
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_rollups'")
+        needs_backfill = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analytics_rollups (
+                granularity TEXT NOT NULL,         -- 'hour' или 'day'
+                bucket TEXT NOT NULL,              -- Начало интервала (ГГГГ-ММ-ДД ЧЧ:00:00)
+                model TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,  -- Количество ходов
+                tokens INTEGER NOT NULL DEFAULT 0, -- Сумма токенов
+                latency_sum REAL NOT NULL DEFAULT 0,     -- Сумма времени ответа
+                latency_sq_sum REAL NOT NULL DEFAULT 0,  -- Сумма квадратов времени ответа
+                errors INTEGER NOT NULL DEFAULT 0, -- Количество ошибок API
+                cost REAL NOT NULL DEFAULT 0,      -- Стоимость в долларах
+                PRIMARY KEY (granularity, bucket, model)
+            ) WITHOUT ROWID
+        ''')
+        # Миграция: стоимость в сводных таблицах (триггеры пересоздаются ниже).
+        # Стоимость уже сохраненных ходов переносится из их метрик
+        if not self._column_exists(cursor, 'analytics_rollups', 'cost'):
+            cursor.execute('ALTER TABLE analytics_rollups ADD COLUMN cost REAL NOT NULL DEFAULT 0')
+            cursor.execute('DROP TRIGGER IF EXISTS trg_messages_rollup')
+            cursor.execute('DROP TRIGGER IF EXISTS trg_analytics_rollup')
+            for granularity, bucket_format in self.ROLLUP_GRANULARITIES.items():
+                cursor.execute(f'''
+                    INSERT INTO analytics_rollups (granularity, bucket, model, cost)
+                    SELECT '{granularity}', strftime('{bucket_format}', timestamp), COALESCE(model, ''),
+                           SUM(cost)
+                    FROM analytics_turns
+                    WHERE timestamp IS NOT NULL AND cost IS NOT NULL
+                    GROUP BY 2, 3
+                    ON CONFLICT (granularity, bucket, model) DO UPDATE SET cost = excluded.cost
+                ''')
+        if needs_backfill:
+            # Заполнение по уже сохраненным метрикам. Ошибки API не сохраняются
+            # вместе с ходами, поэтому errors учитываются только с момента создания
+            # сводных таблиц (record_error), для более ранних интервалов - 0
+            for granularity, bucket_format in self.ROLLUP_GRANULARITIES.items():
+                cursor.execute(f'''
+                    INSERT INTO analytics_rollups
+                        (granularity, bucket, model, count, tokens, latency_sum, latency_sq_sum, cost)
+                    SELECT '{granularity}', strftime('{bucket_format}', timestamp), COALESCE(model, ''),
+                           COUNT(*), COALESCE(SUM(tokens_used), 0), COALESCE(SUM(response_time), 0),
+                           COALESCE(SUM(response_time * response_time), 0), COALESCE(SUM(cost), 0)
+                    FROM analytics_turns
+                    WHERE timestamp IS NOT NULL
+                    GROUP BY 2, 3
+                ''')
+
+        # Миграция: признак отдельной записи метрик. Раньше такие записи
+        # отличались отрицательным ID, теперь их ID берутся из последовательности
+        # сообщений (save_analytics), чтобы экспорт по возрастанию ID их не пропускал
+        if not self._column_exists(cursor, 'analytics_messages', 'standalone'):
+            cursor.execute('ALTER TABLE analytics_messages ADD COLUMN standalone INTEGER NOT NULL DEFAULT 0')
+            cursor.execute('UPDATE analytics_messages SET standalone = 1 WHERE id < 0')
+            cursor.execute('DROP TRIGGER IF EXISTS trg_analytics_rollup')
+
+        # Метрики учитываются при записи хода (messages) и отдельной записи
+        # метрик (analytics_messages, standalone = 1). Остальные строки
+        # analytics_messages - метрики удаленных ходов, они уже учтены
+        rollup_updates = ''.join(f'''
+                INSERT INTO analytics_rollups
+                    (granularity, bucket, model, count, tokens, latency_sum, latency_sq_sum, cost)
+                VALUES ('{granularity}', strftime('{bucket_format}', NEW.timestamp), COALESCE(NEW.model, ''),
+                        1, COALESCE(NEW.tokens_used, 0), NEW.response_time, NEW.response_time * NEW.response_time,
+                        COALESCE(NEW.cost, 0))
+                ON CONFLICT (granularity, bucket, model) DO UPDATE SET
+                    count = count + 1,
+                    tokens = tokens + excluded.tokens,
+                    latency_sum = latency_sum + excluded.latency_sum,
+                    latency_sq_sum = latency_sq_sum + excluded.latency_sq_sum,
+                    cost = cost + excluded.cost;'''
+            for granularity, bucket_format in self.ROLLUP_GRANULARITIES.items()
+        )
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_rollup
+            AFTER INSERT ON messages
+            WHEN NEW.response_time IS NOT NULL AND NEW.timestamp IS NOT NULL
+            BEGIN{rollup_updates}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_analytics_rollup
+            AFTER INSERT ON analytics_messages
+            WHEN NEW.standalone AND NEW.response_time IS NOT NULL AND NEW.timestamp IS NOT NULL
+            BEGIN{rollup_updates}
+            END
+        ''')
+
+        # Суммы длительностей этапов хода за всю историю: средние для диалога
+        # аналитики читаются по строке на этап, а не по всем ходам. Длительности
+        # записи и отрисовки дописываются позже (update_turn_timings), поэтому
+        # суммы обновляются и при изменении хода
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stage_totals'")
+        needs_stage_backfill = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stage_totals (
+                stage TEXT PRIMARY KEY,            -- Колонка из STAGE_COLUMNS
+                total REAL NOT NULL DEFAULT 0,     -- Сумма значений
+                count INTEGER NOT NULL DEFAULT 0   -- Количество ходов с измерением
+            ) WITHOUT ROWID
+        ''')
+        if needs_stage_backfill:
+            cursor.execute(f'''
+                SELECT {', '.join(f'COALESCE(SUM({column}), 0), COUNT({column})' for column in self.STAGE_COLUMNS)}
+                FROM analytics_turns
+            ''')
+            row = cursor.fetchone()
+            cursor.executemany(
+                'INSERT INTO stage_totals (stage, total, count) VALUES (?, ?, ?)',
+                [(column, row[2 * i], row[2 * i + 1]) for i, column in enumerate(self.STAGE_COLUMNS)]
+            )
+
+        def stage_changes(old=False):
+            """Обновление сумм этапов по значениям NEW (за вычетом OLD при изменении хода)"""
+            changes = []
+            for column in self.STAGE_COLUMNS:
+                total = f'COALESCE(NEW.{column}, 0)'
+                count = f'(NEW.{column} IS NOT NULL)'
+                if old:
+                    total += f' - COALESCE(OLD.{column}, 0)'
+                    count += f' - (OLD.{column} IS NOT NULL)'
+                changes.append(f"SELECT '{column}' AS stage, {total} AS total, {count} AS count")
+            return f'''
+                INSERT INTO stage_totals (stage, total, count)
+                SELECT stage, total, count FROM ({' UNION ALL '.join(changes)})
+                WHERE total != 0 OR count != 0
+                ON CONFLICT (stage) DO UPDATE SET
+                    total = total + excluded.total,
+                    count = count + excluded.count;'''
+
+        # Как и в сводных таблицах, метрики удаленных ходов уже учтены
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_stage_totals
+            AFTER INSERT ON messages
+            WHEN NEW.response_time IS NOT NULL
+            BEGIN{stage_changes()}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_stage_totals_update
+            AFTER UPDATE OF {', '.join(self.STAGE_COLUMNS)} ON messages
+            WHEN NEW.response_time IS NOT NULL
+            BEGIN{stage_changes(old=True)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_analytics_stage_totals
+            AFTER INSERT ON analytics_messages
+            WHEN NEW.standalone
+            BEGIN{stage_changes()}
+            END
+        ''')
+
+        # Расход по беседам: счетчики в строке беседы обновляются триггерами
+        # при записи, удалении и изменении сообщений, поэтому сводка расходов
+        # по беседам не обращается к сообщениям
+        if not self._column_exists(cursor, 'conversations', 'cost'):
+            for column, column_type in (('turns', 'INTEGER'), ('prompt_tokens', 'INTEGER'),
+                                        ('completion_tokens', 'INTEGER'), ('cost', 'REAL')):
+                cursor.execute(f'ALTER TABLE conversations ADD COLUMN {column} {column_type} NOT NULL DEFAULT 0')
+            cursor.execute('''
+                UPDATE conversations SET (turns, prompt_tokens, completion_tokens, cost) = (
+                    SELECT COUNT(*), COALESCE(SUM(prompt_tokens), 0),
+                           COALESCE(SUM(completion_tokens), 0), COALESCE(SUM(cost), 0)
+                    FROM messages
+                    WHERE conversation_id = conversations.id
+                )
+            ''')
+
+        def conversation_change(row, sign):
+            """Изменение счетчиков беседы строки row (NEW или OLD) со знаком sign"""
+            return f'''
+                UPDATE conversations SET
+                    turns = turns {sign} 1,
+                    prompt_tokens = prompt_tokens {sign} COALESCE({row}.prompt_tokens, 0),
+                    completion_tokens = completion_tokens {sign} COALESCE({row}.completion_tokens, 0),
+                    cost = cost {sign} COALESCE({row}.cost, 0)
+                WHERE id = {row}.conversation_id;'''
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_conversation_insert
+            AFTER INSERT ON messages
+            BEGIN{conversation_change('NEW', '+')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_conversation_delete
+            AFTER DELETE ON messages
+            BEGIN{conversation_change('OLD', '-')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_messages_conversation_update
+            AFTER UPDATE OF conversation_id, prompt_tokens, completion_tokens, cost ON messages
+            BEGIN{conversation_change('OLD', '-')}{conversation_change('NEW', '+')}
+            END
+        ''')
+
+        # Скетчи распределения времени ответа (квантили p50/p95/p99)
+        # по тем же интервалам, что и сводные таблицы
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'latency_sketches'")
+        needs_sketch_backfill = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS latency_sketches (
+                granularity TEXT NOT NULL,         -- 'hour' или 'day'
+                bucket TEXT NOT NULL,              -- Начало интервала
+                model TEXT NOT NULL,
+                data BLOB NOT NULL,                -- LatencySketch.to_bytes()
+                PRIMARY KEY (granularity, bucket, model)
+            ) WITHOUT ROWID
+        ''')
+        if needs_sketch_backfill:
+            self._backfill_latency_sketches(cursor)
+
+        # Цены моделей (долларов за токен), полученные из списка моделей API
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS model_pricing (
+                model TEXT PRIMARY KEY,
+                prompt_price REAL NOT NULL,        -- Цена токена запроса
+                completion_price REAL NOT NULL,    -- Цена токена ответа
+                updated_at DATETIME
+            )
+        ''')
+
+        # Базовые уровни метрик для обнаружения отклонений (AnomalyDetector):
+        # экспоненциально взвешенные среднее и дисперсия по часам суток (season = -1 - без учета часа)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metric_baselines (
+                metric TEXT NOT NULL,
+                season INTEGER NOT NULL,
+                mean REAL NOT NULL,
+                variance REAL NOT NULL,
+                count INTEGER NOT NULL,            -- Количество учтенных значений
+                updated_at DATETIME,
+                PRIMARY KEY (metric, season)
+            )
+        ''')
+
+        # Словари сжатия, обученные на истории пользователя.
+        # Словари не удаляются: по ID из заголовка распаковываются старые данные
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS compression_dicts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                algorithm TEXT NOT NULL,           -- Алгоритм (zlib/zstd)
+                data BLOB NOT NULL,                -- Содержимое словаря
+                created_at DATETIME
+            )
+        ''')
+
+        # Каталог архивных сегментов: позволяет искать только в сегментах
+        # с подходящим диапазоном времени
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive_segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,                -- Имя файла сегмента в директории архива
+                min_timestamp DATETIME,            -- Время самого старого сообщения
+                max_timestamp DATETIME,            -- Время самого нового сообщения
+                row_count INTEGER,                 -- Количество сообщений в сегменте
+                created_at DATETIME
+            )
+        ''')
+
+        # Отметки инкрементального экспорта: ID последней выгруженной строки
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS export_state (
+                name TEXT PRIMARY KEY,             -- Имя выгрузки (таблица и формат)
+                last_id INTEGER NOT NULL,          -- ID последней выгруженной строки
+                updated_at DATETIME
+            )
+        ''')
+
+        # Создание таблицы для хранения аутентификационных данных
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS auth_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                api_key TEXT NOT NULL,             -- API ключ в открытом виде
+                pin TEXT NOT NULL,                 -- PIN-код (хэшированный)
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        conn.commit()  # Сохранение изменений в базе
+        if needs_vacuum:
+            conn.execute('VACUUM')  # Однократное применение режима auto_vacuum
+        # Режим журнала задает хранилище (для файловых баз - WAL)
+        self.backend.initialize(conn)
+        conn.close()   # Закрытие соединения
+
+    @staticmethod
+    def _column_exists(cursor, table, column):
+        """
+        Проверка наличия колонки в таблице (используется при миграциях схемы).
+
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+            table (str): Имя таблицы
+            column (str): Имя колонки
+
+        Returns:
+            bool: True если колонка уже существует
+        """
+        cursor.execute(f'PRAGMA table_info({table})')
+        return any(row[1] == column for row in cursor.fetchall())
+
+    def _merge_analytics_into_messages(self, cursor):
+        """
+        Миграция: объединение строк analytics_messages с сообщениями.
+
+        Раньше каждый ход записывался дважды - в messages и в analytics_messages -
+        без связи между строками. Строка аналитики записывалась сразу после
+        сообщения той же модели, поэтому ей сопоставляется последнее сообщение
+        этой модели, сохраненное не раньше чем за TURN_MATCH_WINDOW секунд.
+        Метрики сопоставленных строк переносятся в messages, сами строки удаляются.
+
+        Оставшиеся строки получают отрицательные ID, чтобы не пересекаться
+        с ID сообщений в представлении analytics_turns.
+
+        Args:
+            cursor (sqlite3.Cursor): Курсор транзакции create_tables()
+        """
+        def parse(value):
+            return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+        # Сообщения и строки аналитики каждой модели в хронологическом порядке
+        messages = {}
+        cursor.execute('SELECT id, model, timestamp FROM messages WHERE timestamp IS NOT NULL ORDER BY timestamp')
+        for row_id, model, timestamp in cursor.fetchall():
+            messages.setdefault(model, []).append((parse(timestamp), row_id))
+
+        cursor.execute('''
+            SELECT id, model, timestamp, message_length, response_time, tokens_used
+            FROM analytics_messages
+            WHERE timestamp IS NOT NULL
+            ORDER BY timestamp
+        ''')
+        updates = []
+        matched = []
+        positions = {}
+        for row_id, model, timestamp, message_length, response_time, tokens_used in cursor.fetchall():
+            candidates = messages.get(model, [])
+            timestamp = parse(timestamp)
+            # Указатель на последнее сообщение, сохраненное не позже строки аналитики
+            position = positions.get(model, 0)
+            while position < len(candidates) and candidates[position][0] <= timestamp:
+                position += 1
+            positions[model] = position
+            if position == 0:
+                continue
+            message_time, message_id = candidates[position - 1]
+            if (timestamp - message_time).total_seconds() > self.TURN_MATCH_WINDOW:
+                continue
+            # Каждое сообщение сопоставляется не более чем одной строке аналитики
+            candidates[position - 1] = (message_time, None)
+            if message_id is None:
+                continue
+            updates.append((message_length, response_time, tokens_used, message_id))
+            matched.append((row_id,))
+
+        cursor.executemany('''
+            UPDATE messages SET message_length = ?, response_time = ?, tokens_used = COALESCE(tokens_used, ?)
+            WHERE id = ?
+        ''', updates)
+        cursor.executemany('DELETE FROM analytics_messages WHERE id = ?', matched)
+        cursor.execute('UPDATE analytics_messages SET id = -id WHERE id > 0')
+
+        # ID строк аналитики изменились: следующий экспорт начинается заново
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'export_state'")
+        if cursor.fetchone():
+            cursor.execute("DELETE FROM export_state WHERE name LIKE 'analytics_messages.%'")
+
+    def _backfill_latency_sketches(self, cursor):
+        """
+        Построение скетчей времени ответа по уже сохраненным метрикам (однократно).
+
+        Args:
+            cursor (sqlite3.Cursor): Курсор транзакции create_tables
+        """
+        sketches = {}
+        for granularity, bucket_format in self.ROLLUP_GRANULARITIES.items():
+            cursor.execute('''
+                SELECT strftime(?, timestamp), COALESCE(model, ''), response_time
+                FROM analytics_turns
+                WHERE timestamp IS NOT NULL AND response_time IS NOT NULL
+            ''', (bucket_format,))
+            for bucket, model, response_time in cursor:
+                key = (granularity, bucket, model)
+                if key not in sketches:
+                    sketches[key] = LatencySketch()
+                sketches[key].add(response_time)
+        cursor.executemany(
+            'INSERT INTO latency_sketches (granularity, bucket, model, data) VALUES (?, ?, ?, ?)',
+            [(*key, sketch.to_bytes()) for key, sketch in sketches.items()]
+        )
+
+    def _load_compression_dictionary(self, dict_id):
+        """
+        Загрузка словаря сжатия из базы по его ID.
+
+        Args:
+            dict_id (int): ID словаря из заголовка сжатых данных
+
+        Returns:
+            bytes: Содержимое словаря
+
+        Raises:
+            ValueError: Если словарь не найден
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('SELECT data FROM compression_dicts WHERE id = ?', (dict_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Словарь сжатия {dict_id} не найден")
+        return row[0]
+
+    def _activate_latest_dictionary(self):
+        """
+        Выбор последнего обученного словаря текущего алгоритма для сжатия новых данных.
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('''
+            SELECT id, data FROM compression_dicts
+            WHERE algorithm = ?
+            ORDER BY id DESC
+            LIMIT 1
+        ''', (self.compressor.algorithm,))
+        row = cursor.fetchone()
+        if row:
+            self.compressor.set_dictionary(row[0], row[1])
+
+    def _encode_text(self, text, min_length):
+        """
+        Подготовка текста к записи: сжатие, если оно включено и текст достаточно длинный.
+
+        Args:
+            text (str): Исходный текст
+            min_length (int): Минимальная длина для сжатия
+
+        Returns:
+            str | bytes: Исходный текст или сжатые данные
+        """
+        if not self.compression_enabled or text is None or len(text) < min_length:
+            return text
+        blob = self.compressor.compress(text)
+        # Сжатие не всегда выгодно (очень короткие или уже "плотные" тексты)
+        if len(blob) >= len(text.encode('utf-8')):
+            return text
+        return blob
+
+    def _decode_text(self, value):
+        """
+        Преобразование значения из базы в текст.
+
+        Сжатые данные не распаковываются сразу: возвращается ленивая
+        обертка CompressedText, которая распакуется при отображении или экспорте.
+
+        Args:
+            value (str | bytes | None): Значение колонки
+
+        Returns:
+            str | CompressedText | None: Текст сообщения
+        """
+        if MessageCompressor.is_compressed(value):
+            return CompressedText(value, self.compressor)
+        return value
+
+    def _store_text(self, cursor, text, compress_min_length):
+        """
+        Подготовка текста сообщения к записи с учетом дедупликации.
+
+        Длинный текст при включенной дедупликации записывается в blobs
+        (только если такого содержимого там еще нет), а сообщение хранит
+        лишь его хэш. Счетчик ссылок увеличивает триггер на messages.
+
+        Args:
+            cursor (sqlite3.Cursor): Курсор транзакции, в которой пишется сообщение
+            text (str): Текст сообщения
+            compress_min_length (int): Минимальная длина для сжатия
+
+        Returns:
+            tuple: (значение для колонки текста, хэш для колонки *_ref)
+        """
+        if not self.dedup_enabled or text is None or len(text) < self.DEDUP_MIN_LENGTH:
+            return self._encode_text(text, compress_min_length), None
+
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        cursor.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,))
+        if cursor.fetchone() is None:
+            cursor.execute(
+                'INSERT INTO blobs (hash, data, refcount) VALUES (?, ?, 0) ON CONFLICT(hash) DO NOTHING',
+                (digest, self._encode_text(text, compress_min_length))
+            )
+        return None, digest
+
+    def _prefetch_blobs(self, refs):
+        """
+        Разрешение хэшей в тексты через LRU кэш.
+
+        Отсутствующие в кэше тексты читаются одним запросом.
+
+        Args:
+            refs: Итерируемый набор хэшей (None пропускаются)
+
+        Returns:
+            dict: Хэш -> текст (str или ленивый CompressedText)
+        """
+        resolved = {}
+        missing = []
+        with self._blob_cache_lock:
+            for ref in refs:
+                if ref is None or ref in resolved:
+                    continue
+                if ref in self._blob_cache:
+                    self._blob_cache.move_to_end(ref)
+                    resolved[ref] = self._blob_cache[ref]
+                else:
+                    missing.append(ref)
+
+        if missing:
+            missing = list(dict.fromkeys(missing))
+            cursor = self.get_connection().cursor()
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                cursor.execute(
+                    f'SELECT hash, data FROM blobs WHERE hash IN ({",".join("?" * len(chunk))})',
+                    chunk
+                )
+                for ref, data in cursor.fetchall():
+                    resolved[ref] = self._decode_text(data)
+
+            # Добавление прочитанных текстов в кэш с вытеснением самых старых
+            with self._blob_cache_lock:
+                for ref in missing:
+                    if ref in resolved:
+                        self._blob_cache[ref] = resolved[ref]
+                while len(self._blob_cache) > self.BLOB_CACHE_SIZE:
+                    self._blob_cache.popitem(last=False)
+
+        return resolved
+
+    def _message_text(self, value, ref, blobs):
+        """
+        Текст сообщения из колонки текста или из blobs по хэшу.
+
+        Args:
+            value: Значение колонки текста
+            ref (bytes): Значение колонки *_ref
+            blobs (dict): Результат _prefetch_blobs()
+
+        Returns:
+            str | CompressedText | None: Текст сообщения
+        """
+        if ref is not None:
+            return blobs.get(ref)
+        return self._decode_text(value)
+
+    def train_compression_dictionary(self, sample_limit=2000):
+        """
+        Обучение нового словаря сжатия на последних сообщениях пользователя.
+
+        Args:
+            sample_limit (int): Количество последних сообщений для выборки
+
+        Returns:
+            int: ID нового словаря или None, если данных для обучения недостаточно
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT user_message, ai_response, user_message_ref, ai_response_ref FROM messages
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (sample_limit,))
+        rows = cursor.fetchall()
+        blobs = self._prefetch_blobs(ref for row in rows for ref in row[2:])
+
+        # Сжатые значения распаковываются, чтобы словарь учился на реальном тексте
+        samples = []
+        for user_message, ai_response, user_ref, ai_ref in rows:
+            for value in (self._message_text(user_message, user_ref, blobs),
+                          self._message_text(ai_response, ai_ref, blobs)):
+                if value:
+                    samples.append(str(value))
+
+        dictionary = self.compressor.train_dictionary(samples)
+        if not dictionary:
+            return None
+
+        cursor.execute('''
+            INSERT INTO compression_dicts (algorithm, data, created_at)
+            VALUES (?, ?, ?)
+        ''', (self.compressor.algorithm, dictionary, datetime.now()))
+        conn.commit()
+
+        self.compressor.set_dictionary(cursor.lastrowid, dictionary)
+        return cursor.lastrowid
+
+    def get_storage_report(self):
+        """
+        Отчет о размере хранимых сообщений.
+
+        Returns:
+            dict: Словарь с размерами:
+                - file_size: размер файла базы в байтах
+                - payload_size: суммарный размер текстов сообщений в байтах
+                - compressed_rows: количество сообщений со сжатыми полями
+                - total_rows: общее количество сообщений
+                - blob_count: количество уникальных текстов в blobs
+                - blob_refs: количество ссылок на них из сообщений
+        """
+        cursor = self.get_connection().cursor()
+
+        cursor.execute('PRAGMA page_count')
+        page_count = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_size')
+        page_size = cursor.fetchone()[0]
+
+        # CAST(... AS BLOB) дает размер в байтах и для текста, и для BLOB
+        cursor.execute('''
+            SELECT
+                COALESCE(SUM(LENGTH(CAST(user_message AS BLOB))), 0)
+                    + COALESCE(SUM(LENGTH(CAST(ai_response AS BLOB))), 0),
+                SUM(typeof(user_message) = 'blob' OR typeof(ai_response) = 'blob'),
+                COUNT(*)
+            FROM messages
+        ''')
+        payload_size, compressed_rows, total_rows = cursor.fetchone()
+
+        # Тексты, вынесенные в blobs, учитываются один раз
+        cursor.execute('''
+            SELECT COALESCE(SUM(LENGTH(CAST(data AS BLOB)) + LENGTH(hash)), 0),
+                   COUNT(*), COALESCE(SUM(refcount), 0)
+            FROM blobs
+        ''')
+        blob_size, blob_count, blob_refs = cursor.fetchone()
+
+        return {
+            'file_size': page_count * page_size,
+            'payload_size': payload_size + blob_size,
+            'compressed_rows': compressed_rows or 0,
+            'total_rows': total_rows,
+            'blob_count': blob_count,
+            'blob_refs': blob_refs
+        }
+
+    def compress_existing(self, batch_size=500, vacuum=True):
+        """
+        Миграция: сжатие уже сохраненных сообщений.
+
+        Если словаря еще нет, он предварительно обучается на истории.
+        Строки обрабатываются пачками, каждая пачка - отдельная транзакция,
+        чтобы не держать блокировку базы надолго.
+
+        Args:
+            batch_size (int): Количество строк в одной транзакции
+            vacuum (bool): Выполнить ли VACUUM для возврата места на диске
+
+        Returns:
+            dict: Отчет {'before': ..., 'after': ..., 'rows_compressed': int},
+                  где before/after - результаты get_storage_report(),
+                  rows_compressed - количество сжатых строк messages и blobs
+
+        Raises:
+            ValueError: Если сжатие выключено
+        """
+        if not self.compression_enabled:
+            raise ValueError("Сжатие выключено: укажите алгоритм в ChatCache(compression=...)")
+
+        before = self.get_storage_report()
+        if not self.compressor.current_dict_id:
+            self.train_compression_dictionary()
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        last_id = 0
+        rows_compressed = 0
+
+        while True:
+            # Выборка следующей пачки еще не сжатых строк по первичному ключу
+            cursor.execute('''
+                SELECT id, user_message, ai_response FROM messages
+                WHERE id > ? AND (typeof(user_message) = 'text' OR typeof(ai_response) = 'text')
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for row_id, user_message, ai_response in rows:
+                new_user = user_message if isinstance(user_message, bytes) else \
+                    self._encode_text(user_message, self.COMPRESS_USER_MIN_LENGTH)
+                new_ai = ai_response if isinstance(ai_response, bytes) else \
+                    self._encode_text(ai_response, self.COMPRESS_MIN_LENGTH)
+                if new_user is not user_message or new_ai is not ai_response:
+                    updates.append((new_user, new_ai, row_id))
+            last_id = rows[-1][0]
+
+            cursor.executemany(
+                'UPDATE messages SET user_message = ?, ai_response = ? WHERE id = ?',
+                updates
+            )
+            conn.commit()
+            rows_compressed += len(updates)
+
+        # Сжатие текстов, вынесенных в blobs (обход по первичному ключу hash)
+        last_hash = b''
+        while True:
+            cursor.execute('''
+                SELECT hash, data FROM blobs
+                WHERE hash > ? AND typeof(data) = 'text'
+                ORDER BY hash
+                LIMIT ?
+            ''', (last_hash, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            updates = []
+            for digest, data in rows:
+                encoded = self._encode_text(data, self.COMPRESS_MIN_LENGTH)
+                if encoded is not data:
+                    updates.append((encoded, digest))
+            last_hash = rows[-1][0]
+            cursor.executemany('UPDATE blobs SET data = ? WHERE hash = ?', updates)
+            conn.commit()
+            rows_compressed += len(updates)
+        with self._blob_cache_lock:
+            self._blob_cache.clear()
+
+        # Освобожденные страницы возвращаются файловой системе только после VACUUM
+        if vacuum:
+            conn.execute('VACUUM')
+
+        return {
+            'before': before,
+            'after': self.get_storage_report(),
+            'rows_compressed': rows_compressed
+        }
+
+    def deduplicate_existing(self, batch_size=500, vacuum=True):
+        """
+        Миграция: перенос длинных текстов уже сохраненных сообщений в blobs.
+
+        Одинаковые тексты (например, повторно отправленные вопросы или
+        ответы, вставленные в несколько бесед) после миграции хранятся
+        один раз. Строки обрабатываются пачками, каждая пачка - отдельная транзакция.
+
+        Args:
+            batch_size (int): Количество строк в одной транзакции
+            vacuum (bool): Выполнить ли VACUUM для возврата места на диске
+
+        Returns:
+            dict: Отчет {'before': ..., 'after': ..., 'rows_deduplicated': int},
+                  где before/after - результаты get_storage_report()
+
+        Raises:
+            ValueError: Если дедупликация выключена
+        """
+        if not self.dedup_enabled:
+            raise ValueError("Дедупликация выключена: укажите ChatCache(dedup=True)")
+
+        before = self.get_storage_report()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        last_id = 0
+        rows_deduplicated = 0
+
+        while True:
+            # Выборка следующей пачки строк, где хотя бы один текст хранится на месте
+            cursor.execute('''
+                SELECT id, user_message, ai_response FROM messages
+                WHERE id > ? AND (user_message IS NOT NULL OR ai_response IS NOT NULL)
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            for row_id, user_message, ai_response in rows:
+                user_message = self._decode_text(user_message)
+                ai_response = self._decode_text(ai_response)
+                user_value, user_ref = self._store_text(
+                    cursor, str(user_message) if user_message is not None else None,
+                    self.COMPRESS_USER_MIN_LENGTH)
+                ai_value, ai_ref = self._store_text(
+                    cursor, str(ai_response) if ai_response is not None else None,
+                    self.COMPRESS_MIN_LENGTH)
+                if user_ref is None and ai_ref is None:
+                    continue
+                # Короткий текст остается на месте, длинный заменяется хэшем;
+                # refcount пересчитывает триггер обновления ссылок
+                cursor.execute('''
+                    UPDATE messages
+                    SET user_message = CASE WHEN ? IS NULL THEN user_message ELSE NULL END,
+                        ai_response = CASE WHEN ? IS NULL THEN ai_response ELSE NULL END,
+                        user_message_ref = COALESCE(?, user_message_ref),
+                        ai_response_ref = COALESCE(?, ai_response_ref)
+                    WHERE id = ?
+                ''', (user_ref, ai_ref, user_ref, ai_ref, row_id))
+                rows_deduplicated += 1
+            last_id = rows[-1][0]
+            conn.commit()
+
+        if vacuum:
+            conn.execute('VACUUM')
+
+        return {
+            'before': before,
+            'after': self.get_storage_report(),
+            'rows_deduplicated': rows_deduplicated
+        }
+
+    def _select_cold_message_ids(self, cursor, policy):
+        """
+        Поиск сообщений, не попадающих под политику хранения.
+
+        Args:
+            cursor (sqlite3.Cursor): Курсор открытого соединения
+            policy (RetentionPolicy): Политика хранения
+
+        Returns:
+            list: Отсортированный список ID "холодных" сообщений
+        """
+        cold_ids = set()
+
+        cutoff = policy.cutoff()
+        if cutoff is not None:
+            cursor.execute('SELECT id FROM messages WHERE timestamp < ?', (cutoff,))
+            cold_ids.update(row[0] for row in cursor.fetchall())
+
+        if policy.max_rows is not None:
+            # Нумерация сообщений внутри группы от новых к старым
+            group_column = 'conversation_id' if policy.scope == 'conversation' else 'model'
+            cursor.execute(f'''
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY {group_column}
+                        ORDER BY timestamp DESC, id DESC
+                    ) AS position
+                    FROM messages
+                )
+                WHERE position > ?
+            ''', (policy.max_rows,))
+            cold_ids.update(row[0] for row in cursor.fetchall())
+
+        return sorted(cold_ids)
+
+    def apply_retention(self, policy):
+        """
+        Перенос "холодных" сообщений в архивные сегменты.
+
+        Для каждой пачки сообщений сначала на диск записывается сегмент,
+        затем в одной транзакции строки удаляются из базы и сегмент
+        регистрируется в каталоге. При ошибке транзакция откатывается,
+        а записанный сегмент удаляется.
+
+        Дерево ходов остается связным: оставшиеся в базе ходы, предком
+        которых было архивированное сообщение, и указатели веток бесед
+        (head_id) переводятся на ближайшего оставшегося предка (NULL, если
+        вся цепочка до корня архивирована). Архивная запись хранит
+        parent_id, поэтому исходное дерево восстанавливается по архиву.
+
+        Args:
+            policy (RetentionPolicy): Политика хранения
+
+        Returns:
+            dict: {'archived_rows': int, 'segments': list} - количество
+                  перенесенных сообщений и пути новых сегментов
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cold_ids = self._select_cold_message_ids(cursor, policy)
+        segments = []
+
+        for start in range(0, len(cold_ids), self.ARCHIVE_SEGMENT_ROWS):
+            batch = cold_ids[start:start + self.ARCHIVE_SEGMENT_ROWS]
+            placeholders = ','.join('?' * len(batch))
+
+            cursor.execute(f'''
+                SELECT id, conversation_id, model, user_message, ai_response, timestamp, tokens_used,
+                       user_message_ref, ai_response_ref, parent_id
+                FROM messages
+                WHERE id IN ({placeholders})
+                ORDER BY timestamp
+            ''', batch)
+            rows = cursor.fetchall()
+            blobs = self._prefetch_blobs(ref for row in rows for ref in row[7:9])
+
+            # В архив попадает распакованный текст: сегмент сжимается целиком
+            records = []
+            for row in rows:
+                user_message = self._message_text(row[3], row[7], blobs)
+                ai_response = self._message_text(row[4], row[8], blobs)
+                records.append({
+                    "id": row[0],
+                    "conversation_id": row[1],
+                    "model": row[2],
+                    "user_message": str(user_message) if user_message is not None else None,
+                    "ai_response": str(ai_response) if ai_response is not None else None,
+                    "timestamp": row[5],
+                    "tokens_used": row[6],
+                    "parent_id": row[9]
+                })
+            if not records:
+                continue
+
+            # Ближайший предок вне пачки. Пачки идут по возрастанию ID, а предок
+            # старше потомка, поэтому предки из прошлых пачек уже не встречаются
+            parents = {row[0]: row[9] for row in rows}
+
+            def live_ancestor(message_id):
+                while message_id in parents:
+                    message_id = parents[message_id]
+                return message_id
+
+            path = self.archive.write_segment(records)
+            try:
+                cursor.execute(f'''
+                    SELECT id, parent_id FROM messages
+                    WHERE parent_id IN ({placeholders}) AND id NOT IN ({placeholders})
+                ''', batch + batch)
+                cursor.executemany('UPDATE messages SET parent_id = ? WHERE id = ?',
+                                   [(live_ancestor(parent_id), row_id) for row_id, parent_id in cursor.fetchall()])
+                cursor.execute(f'SELECT id, head_id FROM conversations WHERE head_id IN ({placeholders})', batch)
+                cursor.executemany('UPDATE conversations SET head_id = ? WHERE id = ?',
+                                   [(live_ancestor(head_id), row_id) for row_id, head_id in cursor.fetchall()])
+                cursor.execute(f'DELETE FROM messages WHERE id IN ({placeholders})', batch)
+                cursor.execute('''
+                    INSERT INTO archive_segments (path, min_timestamp, max_timestamp, row_count, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (os.path.basename(path), records[0]["timestamp"], records[-1]["timestamp"],
+                      len(records), datetime.now()))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                self.archive.remove_segment(path)
+                raise
+            segments.append(path)
+
+        return {
+            'archived_rows': len(cold_ids),
+            'segments': segments
+        }
+
+    def search_archive(self, query, conversation_id=None, model=None, start=None, end=None, limit=100):
+        """
+        Поиск сообщений в архиве.
+
+        Args:
+            query (str): Подстрока для поиска (без учета регистра)
+            conversation_id (int, optional): Ограничение поиска беседой
+            model (str, optional): Ограничение поиска моделью
+            start (datetime, optional): Начало интервала времени
+            end (datetime, optional): Конец интервала времени
+            limit (int): Максимальное количество результатов
+
+        Returns:
+            list: Найденные записи, начиная с самых новых сегментов
+        """
+        cursor = self.get_connection().cursor()
+
+        # Отбор сегментов по пересечению интервалов времени
+        cursor.execute('''
+            SELECT path FROM archive_segments
+            WHERE (? IS NULL OR max_timestamp >= ?)
+              AND (? IS NULL OR min_timestamp <= ?)
+            ORDER BY id DESC
+        ''', (start, start, end, end))
+        paths = [os.path.join(self.archive.directory, row[0]) for row in cursor.fetchall()]
+
+        return self.archive.search(query, paths, conversation_id=conversation_id, model=model, limit=limit)
+
+    def backup(self, dest, pages_per_step=256, sleep=0.005, progress=None):
+        """
+        Онлайн-копирование базы через SQLite backup API.
+
+        Копирование идет шагами по pages_per_step страниц; между шагами
+        блокировка чтения снимается на sleep секунд, поэтому запись сообщений
+        из интерфейса продолжается. Если база изменилась во время копирования,
+        SQLite сам перезапускает копирование, и снимок всегда согласован.
+        Копия пишется во временный файл и переименовывается после завершения.
+
+        Args:
+            dest (str): Путь к файлу копии
+            pages_per_step (int): Количество страниц за один шаг
+            sleep (float): Пауза между шагами в секундах
+            progress: Колбэк progress(copied_pages, total_pages) после каждого шага
+
+        Returns:
+            dict: {'path': str, 'pages': int, 'bytes': int,
+                   'duration': float (секунды), 'throughput': float (байт/с)}
+        """
+        tmp_path = dest + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        def on_step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+
+        started = time.perf_counter()
+        target = sqlite3.connect(tmp_path)
+        try:
+            self.get_connection().backup(target, pages=pages_per_step, progress=on_step, sleep=sleep)
+            pages = target.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            target.close()
+        os.replace(tmp_path, dest)
+        duration = time.perf_counter() - started
+
+        size = os.path.getsize(dest)
+        return {
+            'path': dest,
+            'pages': pages,
+            'bytes': size,
+            'duration': duration,
+            'throughput': size / duration if duration > 0 else 0.0
+        }
+
+    @staticmethod
+    def verify_backup(path):
+        """
+        Проверка целостности копии базы.
+
+        Копия открывается только для чтения; выполняется PRAGMA integrity_check
+        и проверяется наличие основных таблиц.
+
+        Args:
+            path (str): Путь к файлу копии
+
+        Returns:
+            dict: {'ok': bool, 'errors': list} - результат и список проблем
+        """
+        errors = []
+        try:
+            conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                result = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+                if result != ['ok']:
+                    errors.extend(result)
+                tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                for table in ('conversations', 'messages', 'analytics_messages'):
+                    if table not in tables:
+                        errors.append(f"Нет таблицы {table}")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            errors.append(str(e))
+        return {'ok': not errors, 'errors': errors}
+
+    def get_freelist_count(self):
+        """
+        Количество свободных страниц в файле базы.
+
+        Returns:
+            int: Число страниц, которые можно вернуть файловой системе
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('PRAGMA freelist_count')
+        return cursor.fetchone()[0]
+
+    def incremental_vacuum(self, pages=64):
+        """
+        Возврат части свободных страниц файловой системе.
+
+        Шаг ограничен количеством страниц, поэтому блокировка базы
+        держится недолго и его можно выполнять в периоды простоя.
+
+        Args:
+            pages (int): Максимальное количество освобождаемых страниц
+
+        Returns:
+            int: Количество оставшихся свободных страниц
+        """
+        conn = self.get_connection()
+        # execute() выполняет только первый шаг прагмы (одну страницу),
+        # executescript() доводит ее до конца
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        return self.get_freelist_count()
+
+    def compact_log(self):
+        """
+        Слияние журнала записи с базой (для хранилища с журналом, см. LogStructuredBackend).
+
+        Returns:
+            int: Количество перенесенных страниц (0 - слияние не требовалось)
+        """
+        return self.backend.compact(self.get_connection())
+
+    def get_or_create_default_conversation(self):
+        """
+        Определение беседы, открываемой при запуске и после удаления текущей.
+
+        Returns:
+            int: ID беседы с самой свежей активностью или ID новой беседы,
+                 если в базе еще нет ни одной
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Последняя активность - время последнего сообщения или создания беседы
+        cursor.execute('''
+            SELECT c.id
+            FROM conversations c
+            ORDER BY COALESCE(
+                (SELECT MAX(m.timestamp) FROM messages m WHERE m.conversation_id = c.id),
+                c.created_at
+            ) DESC
+            LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        return self.create_conversation(self.DEFAULT_CONVERSATION_TITLE)
+
+    def create_conversation(self, title=None):
+        """
+        Создание новой беседы.
+
+        Args:
+            title (str, optional): Название беседы. По умолчанию - "Новый чат"
+
+        Returns:
+            int: ID созданной беседы
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'INSERT INTO conversations (title, created_at) VALUES (?, ?)',
+            (title or self.NEW_CONVERSATION_TITLE, datetime.now())
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+    def list_conversations(self):
+        """
+        Получение списка бесед для боковой панели.
+
+        Количество сообщений и время последней активности считаются
+        одним агрегирующим запросом по индексу idx_messages_conversation.
+
+        Returns:
+            list: Список словарей, отсортированных по последней активности:
+                {
+                    "id": int,               # ID беседы
+                    "title": str,            # Название беседы
+                    "message_count": int,    # Количество сообщений
+                    "last_activity": str     # Время последнего сообщения (или создания)
+                }
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT
+                c.id,
+                c.title,
+                COUNT(m.id) AS message_count,
+                COALESCE(MAX(m.timestamp), c.created_at) AS last_activity
+            FROM conversations c
+            LEFT JOIN messages m ON m.conversation_id = c.id
+            GROUP BY c.id
+            ORDER BY last_activity DESC
+        ''')
+        return [
+            {
+                "id": row[0],
+                "title": row[1],
+                "message_count": row[2],
+                "last_activity": row[3]
+            }
+            for row in cursor.fetchall()
+        ]
+
+    def rename_conversation(self, conversation_id, title):
+        """
+        Переименование беседы.
+
+        Args:
+            conversation_id (int): ID беседы
+            title (str): Новое название
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'UPDATE conversations SET title = ? WHERE id = ?',
+            (title, conversation_id)
+        )
+        conn.commit()
+
+    def switch_conversation(self, conversation_id):
+        """
+        Переключение текущей беседы.
+
+        Сообщения беседы при этом не читаются - они загружаются
+        позже через get_chat_history, когда их нужно показать.
+
+        Args:
+            conversation_id (int): ID беседы, которую нужно открыть
+
+        Raises:
+            ValueError: Если беседа с таким ID не существует
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT 1 FROM conversations WHERE id = ?', (conversation_id,))
+        if cursor.fetchone() is None:
+            raise ValueError(f"Беседа {conversation_id} не найдена")
+        self.current_conversation_id = conversation_id
+
+    def delete_conversation(self, conversation_id):
+        """
+        Удаление беседы вместе со всеми ее сообщениями.
+
+        Если удаляется текущая беседа, открывается самая свежая
+        из оставшихся (или создается новая).
+
+        Args:
+            conversation_id (int): ID удаляемой беседы
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Сообщения удаляются каскадно через внешний ключ
+        cursor.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
+        conn.commit()
+
+        if conversation_id == self.current_conversation_id:
+            self.current_conversation_id = self.get_or_create_default_conversation()
+
+    def _insert_message(self, cursor, model, user_message, ai_response, tokens_used, conversation_id,
+                        message_length=None, response_time=None, metrics=None):
+        """
+        Вставка хода в конец текущей ветки беседы.
+
+        Новый ход ссылается на текущий последний ход (head_id беседы)
+        и сам становится последним. Вызывающий код выполняет commit.
+        metrics - дополнительные метрики хода (ключи из TURN_METRIC_COLUMNS).
+
+        Returns:
+            tuple: (ID сообщения, время записи)
+        """
+        conversation_id = conversation_id or self.current_conversation_id
+        timestamp = datetime.now()
+
+        # Тексты сохраняются на месте или как ссылки на blobs (при дедупликации)
+        user_value, user_ref = self._store_text(cursor, user_message, self.COMPRESS_USER_MIN_LENGTH)
+        ai_value, ai_ref = self._store_text(cursor, ai_response, self.COMPRESS_MIN_LENGTH)
+
+        metrics = metrics or {}
+        stages = [column for column in self.TURN_METRIC_COLUMNS if metrics.get(column) is not None]
+        stage_columns = ''.join(f', {column}' for column in stages)
+        cursor.execute(f'''
+            INSERT INTO messages (model, user_message, ai_response, timestamp, tokens_used, conversation_id,
+                                  user_message_ref, ai_response_ref, message_length, response_time, parent_id
+                                  {stage_columns})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, (SELECT head_id FROM conversations WHERE id = ?)
+                    {', ?' * len(stages)})
+        ''', (model, user_value, ai_value, timestamp, tokens_used, conversation_id,
+              user_ref, ai_ref, message_length, response_time, conversation_id,
+              *(metrics[column] for column in stages)))
+        message_id = cursor.lastrowid
+        cursor.execute('UPDATE conversations SET head_id = ? WHERE id = ?', (message_id, conversation_id))
+        return message_id, timestamp
+
+    def save_message(self, model, user_message, ai_response, tokens_used, conversation_id=None):
+        """
+        Сохранение нового сообщения в базу данных.
+
+        Сообщение добавляется в конец текущей ветки беседы.
+
+        Args:
+            model (str): Идентификатор использованной модели
+            user_message (str): Текст сообщения пользователя
+            ai_response (str): Ответ AI модели
+            tokens_used (int): Количество использованных токенов
+            conversation_id (int, optional): ID беседы. По умолчанию - текущая беседа
+        """
+        conn = self.get_connection()  # Получение соединения для текущего потока
+        cursor = conn.cursor()
+        self._insert_message(cursor, model, user_message, ai_response, tokens_used, conversation_id)
+        conn.commit()  # Сохранение изменений
+
+    def save_turn(self, model, user_message, ai_response, tokens_used, response_time, conversation_id=None,
+                  timings=None, usage=None):
+        """
+        Сохранение хода диалога вместе с его метриками.
+
+        Сообщение и метрики записываются одной строкой messages в одной
+        транзакции, поэтому метрики всегда можно связать с сообщением по ID.
+        Ход добавляется в конец текущей ветки беседы. В той же транзакции
+        время ответа добавляется в скетчи квантилей и записываются отложенные
+        длительности этапов предыдущих ходов (update_turn_timings), поэтому
+        ход стоит одной фиксации.
+
+        Args:
+            model (str): Идентификатор использованной модели
+            user_message (str): Текст сообщения пользователя
+            ai_response (str): Ответ AI модели
+            tokens_used (int): Количество использованных токенов
+            response_time (float): Время ответа в секундах
+            conversation_id (int, optional): ID беседы. По умолчанию - текущая беседа
+            timings (dict, optional): Длительности этапов хода (ключи из STAGE_COLUMNS)
+            usage (dict, optional): Расход хода (ключи из COST_COLUMNS)
+
+        Returns:
+            tuple: (ID сообщения, время записи)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        result = self._insert_message(cursor, model, user_message, ai_response, tokens_used, conversation_id,
+                                      len(user_message or ''), response_time, {**(timings or {}), **(usage or {})})
+        if response_time is not None:
+            self._add_latency_sample(cursor, model, response_time, result[1])
+        self._write_pending_timings(cursor)
+        conn.commit()
+        return result
+
+    def update_turn_timings(self, message_id, timings):
+        """
+        Учет длительностей этапов, известных только после сохранения хода
+        (запись в базу, отрисовка ответа).
+
+        Отдельная фиксация ради двух чисел удвоила бы количество записей
+        на ход, поэтому длительности откладываются и записываются
+        транзакцией следующего хода (save_turn) или при обслуживании
+        базы (flush_turn_timings).
+
+        Args:
+            message_id (int): ID хода
+            timings (dict): Длительности этапов (ключи из STAGE_COLUMNS)
+        """
+        stages = {column: timings[column] for column in self.STAGE_COLUMNS if timings.get(column) is not None}
+        if not stages:
+            return
+        with self._pending_timings_lock:
+            self._pending_timings.setdefault(message_id, {}).update(stages)
+
+    def _write_pending_timings(self, cursor):
+        """Запись отложенных длительностей этапов (вызывающий код выполняет commit)"""
+        with self._pending_timings_lock:
+            pending, self._pending_timings = self._pending_timings, {}
+        for message_id, stages in pending.items():
+            cursor.execute(
+                f"UPDATE messages SET {', '.join(f'{column} = ?' for column in stages)} WHERE id = ?",
+                (*stages.values(), message_id)
+            )
+        return len(pending)
+
+    def flush_turn_timings(self):
+        """
+        Запись отложенных длительностей этапов без нового хода
+        (при обслуживании базы в простое).
+
+        Returns:
+            int: Количество обновленных ходов
+        """
+        with self._pending_timings_lock:
+            if not self._pending_timings:
+                return 0
+        conn = self.get_connection()
+        updated = self._write_pending_timings(conn.cursor())
+        conn.commit()
+        return updated
+
+    def get_stage_averages(self):
+        """
+        Средние длительности этапов хода по всем ходам, где они измерены
+        (из сумм stage_totals, без обхода ходов).
+
+        Returns:
+            dict: Колонка из STAGE_COLUMNS -> среднее (None, если измерений нет);
+                  'turns' - количество ходов с измерениями
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('SELECT stage, total, count FROM stage_totals')
+        totals = {stage: (total, count) for stage, total, count in cursor.fetchall()}
+        averages = {'turns': totals.get('first_byte_time', (0, 0))[1]}
+        for column in self.STAGE_COLUMNS:
+            total, count = totals.get(column, (0, 0))
+            averages[column] = total / count if count else None
+        return averages
+
+    def save_model_pricing(self, pricing):
+        """
+        Сохранение цен моделей (кэш между запусками и при недоступности API).
+
+        Args:
+            pricing (dict): model -> {'prompt': цена токена запроса, 'completion': цена токена ответа} в долларах
+        """
+        conn = self.get_connection()
+        now = datetime.now()
+        conn.executemany(
+            'INSERT OR REPLACE INTO model_pricing (model, prompt_price, completion_price, updated_at) VALUES (?, ?, ?, ?)',
+            [(model, price['prompt'], price['completion'], now) for model, price in pricing.items()]
+        )
+        conn.commit()
+
+    def get_model_pricing(self):
+        """
+        Сохраненные цены моделей.
+
+        Returns:
+            dict: model -> {'prompt': float, 'completion': float}
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('SELECT model, prompt_price, completion_price FROM model_pricing')
+        return {model: {'prompt': prompt, 'completion': completion} for model, prompt, completion in cursor.fetchall()}
+
+    def save_metric_baselines(self, baselines):
+        """
+        Сохранение базовых уровней метрик (между запусками приложения).
+
+        Args:
+            baselines (list): Кортежи (metric, season, mean, variance, count)
+        """
+        conn = self.get_connection()
+        now = datetime.now()
+        conn.executemany(
+            'INSERT OR REPLACE INTO metric_baselines (metric, season, mean, variance, count, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(*baseline, now) for baseline in baselines]
+        )
+        conn.commit()
+
+    def get_metric_baselines(self):
         """
-        Получение соединения с базой данных для текущего потока.
-        
+        Сохраненные базовые уровни метрик.
+
         Returns:
-            sqlite3.Connection: Объект соединения с базой данных
-            
-        Note:
-            Каждый поток получает свое собственное соединение,
-            что обеспечивает потокобезопасность работы с базой.
+            list: Кортежи (metric, season, mean, variance, count)
         """
-        # Проверяем, есть ли уже соединение в текущем потоке
-        if not hasattr(self.local, 'connection'):
-            # Если соединения нет - создаем новое
-            self.local.connection = sqlite3.connect(self.db_name)
-        return self.local.connection
+        cursor = self.get_connection().cursor()
+        cursor.execute('SELECT metric, season, mean, variance, count FROM metric_baselines')
+        return [tuple(row) for row in cursor.fetchall()]
 
-    def create_tables(self):
+    def get_average_completion_tokens(self, model):
         """
-        Создание необходимых таблиц в базе данных.
-        
-        Создает таблицу messages со следующими полями:
-        - id: уникальный идентификатор сообщения
-        - model: идентификатор использованной модели
-        - user_message: текст сообщения пользователя
-        - ai_response: ответ AI модели
-        - timestamp: время создания сообщения
-        - tokens_used: количество использованных токенов
+        Среднее количество токенов ответа модели (по последним ходам).
+
+        Args:
+            model (str): Идентификатор модели
+
+        Returns:
+            float: Среднее количество токенов (0 - ходов с учетом токенов нет)
         """
-        # Создаем новое соединение с базой
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        # SQL запросы для создания таблиц
+        cursor = self.get_connection().cursor()
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,  -- Уникальный ID сообщения
-                model TEXT,                           -- Идентификатор модели
-                user_message TEXT,                    -- Текст от пользователя
-                ai_response TEXT,                     -- Ответ от AI
-                timestamp DATETIME,                   -- Время создания
-                tokens_used INTEGER                   -- Использовано токенов
+            SELECT COALESCE(AVG(completion_tokens), 0) FROM (
+                SELECT completion_tokens FROM messages
+                WHERE model = ? AND completion_tokens IS NOT NULL
+                ORDER BY id DESC LIMIT 100
             )
-        ''')
-        
+        ''', (model,))
+        return cursor.fetchone()[0]
+
+    def get_conversation_costs(self):
+        """
+        Расходы по беседам (стоимость и токены сохраненных ходов).
+
+        Счетчики хранятся в строках бесед и обновляются триггерами,
+        поэтому сообщения не читаются.
+
+        Returns:
+            list: Словари id, title, turns, prompt_tokens, completion_tokens, cost
+                  в порядке убывания стоимости
+        """
+        cursor = self.get_connection().cursor()
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS analytics_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME,
-                model TEXT,
-                message_length INTEGER,
-                response_time FLOAT,
-                tokens_used INTEGER
-            )
+            SELECT id, title, turns, prompt_tokens, completion_tokens, cost
+            FROM conversations
+            WHERE turns > 0
+            ORDER BY cost DESC
         ''')
+        return [
+            {'id': conversation_id, 'title': title, 'turns': turns, 'prompt_tokens': prompt_tokens,
+             'completion_tokens': completion_tokens, 'cost': cost}
+            for conversation_id, title, turns, prompt_tokens, completion_tokens, cost in cursor.fetchall()
+        ]
 
-        # Создание таблицы для хранения аутентификационных данных
+    def get_total_cost(self):
+        """
+        Суммарная стоимость всех ходов (из сводной таблицы по дням).
+
+        Returns:
+            float: Стоимость в долларах
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT COALESCE(SUM(cost), 0) FROM analytics_rollups WHERE granularity = 'day'")
+        return cursor.fetchone()[0]
+
+    def _branch_rows(self, cursor, head_id, limit=None):
+        """
+        Ходы ветки от head_id к корню (рекурсивный CTE по parent_id).
+
+        Каждый шаг - поиск по первичному ключу, поэтому стоимость зависит
+        только от глубины ветки, а не от размера беседы.
+
+        Args:
+            cursor (sqlite3.Cursor): Курсор
+            head_id (int): Последний ход ветки
+            limit (int, optional): Максимальное количество ходов (от head_id)
+
+        Returns:
+            list: Строки (id, model, user_message, ai_response, timestamp, tokens_used,
+                  user_message_ref, ai_response_ref, parent_id), новые сначала
+        """
+        if head_id is None:
+            return []
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS auth_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                api_key TEXT NOT NULL,             -- API ключ в открытом виде
-                pin TEXT NOT NULL,                 -- PIN-код (хэшированный)
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            WITH RECURSIVE branch(id, depth) AS (
+                SELECT ?, 0
+                UNION ALL
+                SELECT m.parent_id, b.depth + 1
+                FROM messages m JOIN branch b ON m.id = b.id
+                WHERE m.parent_id IS NOT NULL AND (? IS NULL OR b.depth + 1 < ?)
             )
-        ''')
-        
-        conn.commit()  # Сохранение изменений в базе
-        conn.close()   # Закрытие соединения
+            SELECT m.id, m.model, m.user_message, m.ai_response, m.timestamp, m.tokens_used,
+                   m.user_message_ref, m.ai_response_ref, m.parent_id
+            FROM branch b JOIN messages m ON m.id = b.id
+            ORDER BY b.depth
+        ''', (head_id, limit, limit))
+        return cursor.fetchall()
 
-    def save_message(self, model, user_message, ai_response, tokens_used):
+    def get_head(self, conversation_id=None):
         """
-        Сохранение нового сообщения в базу данных.
-        
+        Последний ход текущей ветки беседы.
+
         Args:
-            model (str): Идентификатор использованной модели
-            user_message (str): Текст сообщения пользователя
-            ai_response (str): Ответ AI модели
-            tokens_used (int): Количество использованных токенов
+            conversation_id (int, optional): ID беседы. По умолчанию - текущая беседа
+
+        Returns:
+            int: ID сообщения или None, если ветка пуста
         """
-        conn = self.get_connection()  # Получение соединения для текущего потока
-        cursor = conn.cursor()
-        
-        # Вставка новой записи в таблицу messages
+        cursor = self.get_connection().cursor()
+        cursor.execute('SELECT head_id FROM conversations WHERE id = ?',
+                       (conversation_id or self.current_conversation_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def get_ancestry(self, message_id):
+        """
+        Путь от корня дерева до хода (контекст ветки).
+
+        Args:
+            message_id (int): ID хода
+
+        Returns:
+            list: ID ходов от корня до message_id включительно
+        """
+        cursor = self.get_connection().cursor()
+        return [row[0] for row in reversed(self._branch_rows(cursor, message_id))]
+
+    def list_branches(self, conversation_id=None):
+        """
+        Список веток беседы (ходы без продолжений - листья дерева).
+
+        Args:
+            conversation_id (int, optional): ID беседы. По умолчанию - текущая беседа
+
+        Returns:
+            list: Словари с ключами head_id, timestamp, user_message (текст последнего хода),
+                  is_current; новые ветки сначала
+        """
+        conversation_id = conversation_id or self.current_conversation_id
+        cursor = self.get_connection().cursor()
         cursor.execute('''
-            INSERT INTO messages (model, user_message, ai_response, timestamp, tokens_used)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (model, user_message, ai_response, datetime.now(), tokens_used))
-        conn.commit()  # Сохранение изменений
+            SELECT m.id, m.timestamp, m.user_message, m.user_message_ref
+            FROM messages m
+            WHERE m.conversation_id = ?
+              AND NOT EXISTS (SELECT 1 FROM messages c WHERE c.parent_id = m.id)
+            ORDER BY m.timestamp DESC, m.id DESC
+        ''', (conversation_id,))
+        rows = cursor.fetchall()
+        blobs = self._prefetch_blobs(row[3] for row in rows)
+        head_id = self.get_head(conversation_id)
+        return [
+            {
+                "head_id": row_id,
+                "timestamp": timestamp,
+                "user_message": self._message_text(user_message, user_ref, blobs),
+                "is_current": row_id == head_id
+            }
+            for row_id, timestamp, user_message, user_ref in rows
+        ]
+
+    def switch_branch(self, head_id):
+        """
+        Переключение беседы на ветку, заканчивающуюся ходом head_id.
+
+        Args:
+            head_id (int): ID хода
+
+        Raises:
+            ValueError: Если хода не существует
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT conversation_id FROM messages WHERE id = ?', (head_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Сообщение {head_id} не найдено")
+        cursor.execute('UPDATE conversations SET head_id = ? WHERE id = ?', (head_id, row[0]))
+        conn.commit()
+
+    def fork_from(self, message_id):
+        """
+        Подготовка новой ветки для редактирования хода.
+
+        Текущим становится ход, предшествующий message_id: следующий
+        сохраненный ход начнет новую ветку рядом с message_id. Ходы
+        исходной ветки не копируются и не удаляются - ветки делят общий префикс.
+
+        Args:
+            message_id (int): ID редактируемого хода
+
+        Returns:
+            int: ID нового последнего хода (None - ветка начинается с корня)
+
+        Raises:
+            ValueError: Если хода не существует
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT conversation_id, parent_id FROM messages WHERE id = ?', (message_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Сообщение {message_id} не найдено")
+        conversation_id, parent_id = row
+        cursor.execute('UPDATE conversations SET head_id = ? WHERE id = ?', (parent_id, conversation_id))
+        conn.commit()
+        return parent_id
 
-    def get_chat_history(self, limit=50):
+    def get_chat_history(self, limit=50, conversation_id=None):
         """
         Получение последних сообщений из истории чата.
         
         Args:
             limit (int): Максимальное количество возвращаемых сообщений
+            conversation_id (int, optional): ID беседы. По умолчанию - текущая беседа
             
         Returns:
-            list: Список кортежей с данными сообщений, отсортированных
-                 по времени в обратном порядке (новые сначала)
+            list: Список кортежей с данными сообщений текущей ветки беседы
+                 в обратном порядке (новые сначала).
+                 Сжатые тексты возвращаются как CompressedText и
+                 распаковываются только при отображении
         """
         conn = self.get_connection()  # Получение соединения для текущего потока
         cursor = conn.cursor()
-        
-        # Получение последних сообщений с ограничением по количеству
-        cursor.execute('''
-            SELECT * FROM messages 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        ''', (limit,))
-        return cursor.fetchall()  # Возврат всех найденных записей
+
+        # Подъем от последнего хода ветки к корню с ограничением по количеству
+        rows = self._branch_rows(cursor, self.get_head(conversation_id), limit)
+        blobs = self._prefetch_blobs(ref for row in rows for ref in row[6:8])
+        return [
+            (row_id, model,
+             self._message_text(user_message, user_ref, blobs),
+             self._message_text(ai_response, ai_ref, blobs),
+             timestamp, tokens_used)
+            for row_id, model, user_message, ai_response, timestamp, tokens_used, user_ref, ai_ref, _ in rows
+        ]
+
+    def count_messages(self, conversation_id=None):
+        """
+        Количество сообщений в беседе или во всей базе.
+
+        Args:
+            conversation_id (int, optional): ID беседы. По умолчанию - все беседы
+
+        Returns:
+            int: Количество сообщений
+        """
+        cursor = self.get_connection().cursor()
+        if conversation_id is None:
+            cursor.execute('SELECT COUNT(*) FROM messages')
+        else:
+            cursor.execute('SELECT COUNT(*) FROM messages WHERE conversation_id = ?', (conversation_id,))
+        return cursor.fetchone()[0]
+
+    def iter_messages(self, conversation_id=None, batch_size=1000):
+        """
+        Постраничный обход сообщений в порядке ID.
+
+        Каждая пачка читается отдельным коротким запросом по первичному
+        ключу (WHERE id > последний_ID), поэтому обход не держит блокировку
+        чтения на все время экспорта и использует постоянный объем памяти.
+
+        Args:
+            conversation_id (int, optional): ID беседы. По умолчанию - все беседы
+            batch_size (int): Количество сообщений в пачке
+
+        Yields:
+            list: Пачка словарей с данными сообщений (тексты распакованы)
+        """
+        cursor = self.get_connection().cursor()
+        last_id = 0
+
+        while True:
+            cursor.execute('''
+                SELECT m.id, m.conversation_id, c.title, m.timestamp, m.model,
+                       m.user_message, m.ai_response, m.tokens_used,
+                       m.user_message_ref, m.ai_response_ref, m.parent_id
+                FROM messages m
+                LEFT JOIN conversations c ON c.id = m.conversation_id
+                WHERE m.id > ? AND (? IS NULL OR m.conversation_id = ?)
+                ORDER BY m.id
+                LIMIT ?
+            ''', (last_id, conversation_id, conversation_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+
+            blobs = self._prefetch_blobs(ref for row in rows for ref in row[8:10])
+            batch = []
+            for row in rows:
+                user_message = self._message_text(row[5], row[8], blobs)
+                ai_response = self._message_text(row[6], row[9], blobs)
+                batch.append({
+                    "id": row[0],
+                    "conversation_id": row[1],
+                    "conversation_title": row[2],
+                    "timestamp": row[3],
+                    "model": row[4],
+                    "user_message": str(user_message) if user_message is not None else None,
+                    "ai_response": str(ai_response) if ai_response is not None else None,
+                    "tokens_used": row[7],
+                    "parent_id": row[10]
+                })
+            yield batch
+            last_id = rows[-1][0]
+
+    def import_messages(self, records, conversation_id=None, conversation_map=None, message_map=None):
+        """
+        Массовая вставка сообщений одной транзакцией.
+
+        Дерево ходов восстанавливается по полю parent_id записей; записи
+        без этого поля (старые выгрузки) добавляются в конец текущей ветки
+        беседы. Последний вставленный ход каждой беседы становится текущим.
+
+        Args:
+            records (list): Словари в формате iter_messages()
+            conversation_id (int, optional): Беседа для всех сообщений.
+                По умолчанию беседы создаются по conversation_id/conversation_title записей
+            conversation_map (dict, optional): Соответствие ID бесед источника и
+                локальных ID; дополняется новыми беседами (общий между пачками одного импорта)
+            message_map (dict, optional): Соответствие ID сообщений источника и
+                локальных ID (общий между пачками одного импорта)
+
+        Returns:
+            int: Количество вставленных сообщений
+        """
+        if conversation_map is None:
+            conversation_map = {}
+        if message_map is None:
+            message_map = {}
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        created_sources = []  # Беседы, созданные в этой транзакции
+
+        try:
+            rows = []
+            for record in records:
+                target_id = conversation_id
+                if target_id is None:
+                    source_id = record.get("conversation_id")
+                    if source_id not in conversation_map:
+                        # Новая беседа создается в той же транзакции, что и сообщения
+                        cursor.execute(
+                            'INSERT INTO conversations (title, created_at) VALUES (?, ?)',
+                            (record.get("conversation_title") or self.NEW_CONVERSATION_TITLE, datetime.now())
+                        )
+                        conversation_map[source_id] = cursor.lastrowid
+                        created_sources.append(source_id)
+                    target_id = conversation_map[source_id]
+
+                user_value, user_ref = self._store_text(
+                    cursor, record.get("user_message"), self.COMPRESS_USER_MIN_LENGTH)
+                ai_value, ai_ref = self._store_text(
+                    cursor, record.get("ai_response"), self.COMPRESS_MIN_LENGTH)
+                rows.append((
+                    record.get("model"),
+                    user_value,
+                    ai_value,
+                    record.get("timestamp"),
+                    record.get("tokens_used"),
+                    target_id,
+                    user_ref,
+                    ai_ref
+                ))
+
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM messages')
+            max_id = cursor.fetchone()[0]
+            cursor.executemany('''
+                INSERT INTO messages (model, user_message, ai_response, timestamp, tokens_used, conversation_id,
+                                      user_message_ref, ai_response_ref)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+            # В одной транзакции ID вставленных строк идут подряд в порядке записей
+            cursor.execute('SELECT id FROM messages WHERE id > ? ORDER BY id', (max_id,))
+            new_ids = [row[0] for row in cursor.fetchall()]
+            heads = {}
+            parents = []
+            for record, row, new_id in zip(records, rows, new_ids):
+                target_id = row[5]
+                if target_id not in heads:
+                    heads[target_id] = self.get_head(target_id)
+                if "parent_id" in record:
+                    parent_id = message_map.get(record["parent_id"])
+                else:
+                    parent_id = heads[target_id]
+                if record.get("id") is not None:
+                    message_map[record["id"]] = new_id
+                heads[target_id] = new_id
+                parents.append((parent_id, new_id))
+            cursor.executemany('UPDATE messages SET parent_id = ? WHERE id = ?', parents)
+            cursor.executemany('UPDATE conversations SET head_id = ? WHERE id = ?',
+                               [(head_id, target_id) for target_id, head_id in heads.items()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Откаченные беседы и сообщения не должны использоваться следующими пачками
+            for source_id in created_sources:
+                conversation_map.pop(source_id, None)
+            for record in records:
+                message_map.pop(record.get("id"), None)
+            raise
+        return len(rows)
+
+    def import_message_batch(self, records, conversation_id=None, conversation_map=None, message_map=None):
+        """
+        Импорт пачки сообщений с возвратом новых соответствий ID.
+
+        То же, что import_messages, но соответствия передаются и возвращаются
+        списками пар (ID источника, локальный ID): так пачки одного импорта
+        связываются и через демон хранилища, где аргументы копируются через
+        JSON и изменения словарей не возвращаются вызывающему коду.
+
+        Args:
+            records (list): Словари в формате iter_messages()
+            conversation_id (int, optional): Беседа для всех сообщений
+            conversation_map (list, optional): Пары бесед из предыдущих пачек импорта
+            message_map (list, optional): Пары сообщений из предыдущих пачек
+                (достаточно родителей записей этой пачки)
+
+        Returns:
+            dict: rows - количество вставленных сообщений, conversations и
+                  messages - новые пары соответствий бесед и сообщений
+        """
+        conversations = dict(conversation_map or [])
+        messages = dict(message_map or [])
+        known_conversations = dict(conversations)
+        known_messages = dict(messages)
+        rows = self.import_messages(records, conversation_id, conversations, messages)
+        return {
+            'rows': rows,
+            'conversations': [[source_id, local_id] for source_id, local_id in conversations.items()
+                              if known_conversations.get(source_id) != local_id],
+            'messages': [[source_id, local_id] for source_id, local_id in messages.items()
+                         if known_messages.get(source_id) != local_id],
+        }
+
+    def get_export_watermark(self, name):
+        """
+        Получение отметки инкрементального экспорта.
+
+        Args:
+            name (str): Имя выгрузки
+
+        Returns:
+            int: ID последней выгруженной строки (None, если выгрузок еще не было)
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('SELECT last_id FROM export_state WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def set_export_watermark(self, name, last_id):
+        """
+        Сохранение отметки инкрементального экспорта.
+
+        Args:
+            name (str): Имя выгрузки
+            last_id (int): ID последней выгруженной строки
+        """
+        conn = self.get_connection()
+        conn.execute('''
+            INSERT INTO export_state (name, last_id, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id, updated_at = excluded.updated_at
+        ''', (name, last_id, datetime.now()))
+        conn.commit()
+
+    def iter_export_rows(self, table, after_id=None, batch_size=50000):
+        """
+        Постраничный обход строк для колоночного экспорта.
+
+        Args:
+            table (str): 'analytics_messages' (метрики ходов из представления
+                analytics_turns) или 'messages' (только метаданные)
+            after_id (int, optional): Выгружать строки с ID больше этого значения.
+                По умолчанию - все строки (ID метрик старых баз отрицательные).
+                ID ходов и отдельных записей метрик берутся из одной
+                возрастающей последовательности, поэтому новые строки всегда
+                идут после отметки
+            batch_size (int): Количество строк в пачке
+
+        Yields:
+            list: Пачка кортежей в порядке колонок схемы AnalyticsExporter.schema()
+        """
+        cursor = self.get_connection().cursor()
+        last_id = after_id if after_id is not None else -2 ** 63
+
+        while True:
+            if table == 'analytics_messages':
+                cursor.execute('''
+                    SELECT id, timestamp, model, message_length, response_time, tokens_used
+                    FROM analytics_turns
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, batch_size))
+                rows = cursor.fetchall()
+            else:
+                # Для сжатых и вынесенных в blobs текстов длина считается
+                # по распакованному тексту
+                cursor.execute('''
+                    SELECT id, conversation_id, timestamp, model, tokens_used,
+                           CASE WHEN typeof(user_message) = 'blob' THEN user_message ELSE LENGTH(user_message) END,
+                           CASE WHEN typeof(ai_response) = 'blob' THEN ai_response ELSE LENGTH(ai_response) END,
+                           user_message_ref, ai_response_ref
+                    FROM messages
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, batch_size))
+                raw_rows = cursor.fetchall()
+                blobs = self._prefetch_blobs(ref for row in raw_rows for ref in row[7:])
+                rows = []
+                for row in raw_rows:
+                    lengths = []
+                    for value, ref in ((row[5], row[7]), (row[6], row[8])):
+                        if ref is not None or isinstance(value, bytes):
+                            text = self._message_text(value, ref, blobs)
+                            value = len(str(text)) if text is not None else None
+                        lengths.append(value)
+                    rows.append(row[:5] + tuple(lengths))
+
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
 
     def save_analytics(self, timestamp, model, message_length, response_time, tokens_used):
         """
-        Сохранение данных аналитики в базу данных.
+        Сохранение метрик, не связанных с сообщением.
+
+        Метрики хода с сообщением сохраняет save_turn(). Отдельные записи
+        получают ID из последовательности сообщений (AUTOINCREMENT messages):
+        ID не пересекаются с ID сообщений в представлении analytics_turns и
+        возрастают вместе с ними, поэтому инкрементальный экспорт выгружает
+        новые записи. Время ответа добавляется в скетчи квантилей в той же
+        транзакции.
         
         Args:
             timestamp (datetime): Время создания записи
@@ -162,16 +2403,177 @@ class ChatCache:
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        # Следующий ID сообщений резервируется за записью метрик
+        cursor.execute("UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'messages'")
+        if not cursor.rowcount:
+            cursor.execute('''
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT 'messages', MAX(COALESCE((SELECT MAX(id) FROM messages), 0),
+                                       COALESCE((SELECT MAX(id) FROM analytics_messages), 0)) + 1
+            ''')
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'messages'")
+        row_id = cursor.fetchone()[0]
+
         cursor.execute('''
             INSERT INTO analytics_messages 
-            (timestamp, model, message_length, response_time, tokens_used)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (timestamp, model, message_length, response_time, tokens_used))
+            (id, timestamp, model, message_length, response_time, tokens_used, standalone)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+        ''', (row_id, timestamp, model, message_length, response_time, tokens_used))
+        if response_time is not None:
+            self._add_latency_sample(cursor, model, response_time, timestamp)
+        conn.commit()
+
+    def record_error(self, model, timestamp=None):
+        """
+        Учет ошибки API в сводных таблицах аналитики.
+
+        Args:
+            model (str): Идентификатор модели
+            timestamp (datetime, optional): Время ошибки. По умолчанию - текущее
+        """
+        timestamp = timestamp or datetime.now()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        for granularity, bucket_format in self.ROLLUP_GRANULARITIES.items():
+            cursor.execute('''
+                INSERT INTO analytics_rollups (granularity, bucket, model, errors)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT (granularity, bucket, model) DO UPDATE SET errors = errors + 1
+            ''', (granularity, timestamp.strftime(bucket_format), model or ''))
+        conn.commit()
+
+    def add_latency_sample(self, model, response_time, timestamp=None):
+        """
+        Добавление времени ответа в скетчи часа и дня.
+
+        save_turn и save_analytics добавляют время ответа сами; метод
+        нужен для значений, не связанных с записью хода.
+
+        Args:
+            model (str): Идентификатор модели
+            response_time (float): Время ответа в секундах
+            timestamp (datetime, optional): Время хода. По умолчанию - текущее
+        """
+        conn = self.get_connection()
+        self._add_latency_sample(conn.cursor(), model, response_time, timestamp or datetime.now())
         conn.commit()
 
+    def _add_latency_sample(self, cursor, model, response_time, timestamp):
+        """Обновление скетчей часа и дня в текущей транзакции (вызывающий код выполняет commit)"""
+        for granularity, bucket_format in self.ROLLUP_GRANULARITIES.items():
+            key = (granularity, timestamp.strftime(bucket_format), model or '')
+            cursor.execute(
+                'SELECT data FROM latency_sketches WHERE granularity = ? AND bucket = ? AND model = ?', key
+            )
+            row = cursor.fetchone()
+            sketch = LatencySketch.from_bytes(row[0]) if row else LatencySketch()
+            sketch.add(response_time)
+            cursor.execute(
+                'INSERT OR REPLACE INTO latency_sketches (granularity, bucket, model, data) VALUES (?, ?, ?, ?)',
+                (*key, sketch.to_bytes())
+            )
+
+    def get_latency_sketches(self, granularity='day', start=None, end=None, model=None):
+        """
+        Чтение сериализованных скетчей времени ответа за период.
+
+        Args:
+            granularity (str): 'hour' или 'day'
+            start (datetime, optional): Начало периода (интервал, содержащий start, включается)
+            end (datetime, optional): Конец периода (включаются интервалы, начавшиеся раньше end)
+            model (str, optional): Только указанная модель
+
+        Returns:
+            list: Словари bucket (datetime), model, data (bytes, см. LatencySketch.from_bytes)
+
+        Raises:
+            ValueError: Если указан неизвестный интервал
+        """
+        if granularity not in self.ROLLUP_GRANULARITIES:
+            raise ValueError(f"Неизвестный интервал: {granularity}")
+        query = 'SELECT bucket, model, data FROM latency_sketches WHERE granularity = ?'
+        params = [granularity]
+        if start is not None:
+            query += ' AND bucket >= ?'
+            params.append(start.strftime(self.ROLLUP_GRANULARITIES[granularity]))
+        if end is not None:
+            query += ' AND bucket < ?'
+            params.append(end.strftime('%Y-%m-%d %H:%M:%S'))
+        if model is not None:
+            query += ' AND model = ?'
+            params.append(model)
+        query += ' ORDER BY bucket, model'
+
+        cursor = self.get_connection().cursor()
+        cursor.execute(query, params)
+        return [
+            {'bucket': datetime.strptime(bucket, '%Y-%m-%d %H:%M:%S'), 'model': row_model, 'data': data}
+            for bucket, row_model, data in cursor.fetchall()
+        ]
+
+    def get_rollups(self, granularity='hour', start=None, end=None, model=None):
+        """
+        Чтение сводной статистики по интервалам.
+
+        Запрос читает по строке на интервал и модель, поэтому время ответа
+        зависит от длины периода, а не от количества ходов в нем.
+
+        Args:
+            granularity (str): 'hour' или 'day'
+            start (datetime, optional): Начало периода (интервал, содержащий start, включается)
+            end (datetime, optional): Конец периода (включаются интервалы, начавшиеся раньше end)
+            model (str, optional): Только указанная модель
+
+        Returns:
+            list: Словари bucket (datetime), model, count, tokens, latency_sum,
+                  latency_sq_sum, errors, cost в порядке времени
+
+        Raises:
+            ValueError: Если указан неизвестный интервал
+        """
+        if granularity not in self.ROLLUP_GRANULARITIES:
+            raise ValueError(f"Неизвестный интервал: {granularity}")
+        bucket_format = self.ROLLUP_GRANULARITIES[granularity]
+
+        query = '''
+            SELECT bucket, model, count, tokens, latency_sum, latency_sq_sum, errors, cost
+            FROM analytics_rollups
+            WHERE granularity = ?
+        '''
+        params = [granularity]
+        if start is not None:
+            query += ' AND bucket >= ?'
+            params.append(start.strftime(bucket_format))
+        if end is not None:
+            query += ' AND bucket < ?'
+            params.append(end.strftime('%Y-%m-%d %H:%M:%S'))
+        if model is not None:
+            query += ' AND model = ?'
+            params.append(model)
+        query += ' ORDER BY bucket, model'
+
+        cursor = self.get_connection().cursor()
+        cursor.execute(query, params)
+        return [
+            {
+                'bucket': datetime.strptime(bucket, '%Y-%m-%d %H:%M:%S'),
+                'model': row_model,
+                'count': count,
+                'tokens': tokens,
+                'latency_sum': latency_sum,
+                'latency_sq_sum': latency_sq_sum,
+                'errors': errors,
+                'cost': cost
+            }
+            for bucket, row_model, count, tokens, latency_sum, latency_sq_sum, errors, cost in cursor.fetchall()
+        ]
+
     def get_analytics_history(self):
         """
         Получение всей истории аналитики.
+
+        Читает представление analytics_turns: метрики ходов из messages
+        и отдельные записи analytics_messages.
         
         Returns:
             list: Список записей аналитики
@@ -181,11 +2583,38 @@ class ChatCache:
         
         cursor.execute('''
             SELECT timestamp, model, message_length, response_time, tokens_used
-            FROM analytics_messages
+            FROM analytics_turns
             ORDER BY timestamp ASC
         ''')
         return cursor.fetchall()
 
+    def get_model_usage(self):
+        """
+        Сводка использования моделей за всю историю.
+
+        Количество ходов и сумма токенов считаются в SQL (GROUP BY),
+        поэтому время и память не зависят от объема истории.
+
+        Returns:
+            dict: model -> {'count': int, 'tokens': int}
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('''
+            SELECT model, SUM(count), SUM(tokens)
+            FROM (
+                SELECT model, COUNT(*) AS count, COALESCE(SUM(tokens_used), 0) AS tokens
+                FROM messages
+                WHERE response_time IS NOT NULL
+                GROUP BY model
+                UNION ALL
+                SELECT model, COUNT(*), COALESCE(SUM(tokens_used), 0)
+                FROM analytics_messages
+                GROUP BY model
+            )
+            GROUP BY model
+        ''')
+        return {model: {'count': count, 'tokens': tokens} for model, count, tokens in cursor.fetchall()}
+
     def save_auth_data(self, api_key, pin):
         """
         Сохранение аутентификационных данных (API ключ и PIN).
@@ -290,29 +2719,42 @@ class ChatCache:
         if hasattr(self.local, 'connection'):
             self.local.connection.close()  # Закрытие соединения
             
-    def clear_history(self):
+    def clear_history(self, conversation_id=None):
         """
-        Очистка всей истории сообщений.
+        Очистка истории сообщений беседы.
         
-        Удаляет все записи из таблицы messages,
-        эффективно очищая всю историю чата.
+        Удаляет записи из таблицы messages, относящиеся к указанной
+        (по умолчанию - текущей) беседе. Остальные беседы не затрагиваются.
+
+        Args:
+            conversation_id (int, optional): ID беседы. По умолчанию - текущая беседа
         """
         conn = self.get_connection()  # Получение соединения
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM messages')  # Удаление всех записей
+        cursor.execute(
+            'DELETE FROM messages WHERE conversation_id = ?',  # Удаление записей беседы
+            (conversation_id or self.current_conversation_id,)
+        )
+        cursor.execute(
+            'UPDATE conversations SET head_id = NULL WHERE id = ?',  # Ветка беседы пуста
+            (conversation_id or self.current_conversation_id,)
+        )
         conn.commit()  # Сохранение изменений
 
-    def get_formatted_history(self):
+    def get_formatted_history(self, conversation_id=None):
         """
         Получение отформатированной истории диалога.
+
+        Args:
+            conversation_id (int, optional): ID беседы. По умолчанию - текущая беседа
         
         Returns:
-            list: Список словарей с данными сообщений в формате:
+            list: Список словарей с данными сообщений текущей ветки в формате:
                 {
                     "id": int,              # ID сообщения
                     "model": str,           # Использованная модель
-                    "user_message": str,    # Сообщение пользователя
-                    "ai_response": str,     # Ответ AI
+                    "user_message": str,    # Сообщение пользователя (или CompressedText)
+                    "ai_response": str,     # Ответ AI (или CompressedText)
                     "timestamp": datetime,  # Время создания
                     "tokens_used": int      # Использовано токенов
                 }
@@ -320,27 +2762,18 @@ class ChatCache:
         conn = self.get_connection()  # Получение соединения
         cursor = conn.cursor()
         
-        # Получение всех сообщений, отсортированных по времени
-        cursor.execute('''
-            SELECT 
-                id,
-                model,
-                user_message,
-                ai_response,
-                timestamp,
-                tokens_used
-            FROM messages 
-            ORDER BY timestamp ASC
-        ''')
-        
+        # Получение всех ходов текущей ветки от корня к последнему
+        rows = list(reversed(self._branch_rows(cursor, self.get_head(conversation_id))))
+        blobs = self._prefetch_blobs(ref for row in rows for ref in row[6:8])
+
         # Формирование списка словарей с данными сообщений
         history = []
-        for row in cursor.fetchall():
+        for row in rows:
             history.append({
                 "id": row[0],              # ID сообщения
                 "model": row[1],           # Использованная модель
-                "user_message": row[2],    # Сообщение пользователя
-                "ai_response": row[3],     # Временная метка
+                "user_message": self._message_text(row[2], row[6], blobs),  # Сообщение пользователя
+                "ai_response": self._message_text(row[3], row[7], blobs),   # Ответ AI
                 "timestamp": row[4],       # Временная метка
                 "tokens_used": row[5]      # Использовано токенов
             })
@@ -0,0 +1,156 @@
+# Импорт необходимых библиотек
+from array import array  # Компактные числовые столбцы
+from collections.abc import Sequence  # Интерфейс списка для построчного представления
+from datetime import datetime  # Преобразование временных меток
+
+# Векторные вычисления статистики (numpy в requirements.txt); без пакета,
+# например в урезанной сборке, статистика считается обходом массивов
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class SessionStore(Sequence):
+    """
+    Колоночное хранилище метрик сообщений в памяти.
+
+    Каждое поле хранится отдельным массивом array: время - секунды эпохи
+    (double), модель - номер в таблице имен моделей, длина сообщения, время
+    ответа и токены - числа. Запись занимает около 30 байт вместо нескольких
+    сотен у словаря с datetime. Добавление амортизированно O(1).
+
+    Для совместимости хранилище ведет себя как список словарей:
+    store[i], срезы и обход создают словари строк по требованию.
+    Статистика считается векторно через NumPy (если пакет установлен),
+    иначе - обходом массивов.
+    """
+
+    # Поля строки в порядке столбцов
+    FIELDS = ('timestamp', 'model', 'message_length', 'response_time', 'tokens_used')
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.model_ids = array('I')
+        self.message_lengths = array('q')
+        self.response_times = array('d')
+        self.tokens = array('q')
+        self.models = []       # Номер модели -> имя
+        self._model_index = {}  # Имя -> номер модели
+
+    def _intern(self, model):
+        """Номер модели в таблице имен (новые имена добавляются)"""
+        model_id = self._model_index.get(model)
+        if model_id is None:
+            model_id = self._model_index[model] = len(self.models)
+            self.models.append(model)
+        return model_id
+
+    def append(self, timestamp, model, message_length, response_time, tokens_used):
+        """
+        Добавление записи.
+
+        Args:
+            timestamp (datetime): Время записи
+            model (str): Идентификатор модели
+            message_length (int): Длина сообщения в символах
+            response_time (float): Время ответа в секундах
+            tokens_used (int): Количество токенов
+        """
+        self.timestamps.append(timestamp.timestamp())
+        self.model_ids.append(self._intern(model))
+        self.message_lengths.append(message_length or 0)
+        self.response_times.append(response_time or 0.0)
+        self.tokens.append(tokens_used or 0)
+
+    def clear(self):
+        """Удаление всех записей"""
+        self.__init__()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _row(self, i):
+        return {
+            'timestamp': datetime.fromtimestamp(self.timestamps[i]),
+            'model': self.models[self.model_ids[i]],
+            'message_length': self.message_lengths[i],
+            'response_time': self.response_times[i],
+            'tokens_used': self.tokens[i]
+        }
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Индекс записи вне диапазона")
+        return self._row(index)
+
+    def nbytes(self):
+        """Объем памяти, занятый столбцами (без таблицы имен моделей)"""
+        return sum(
+            column.itemsize * len(column)
+            for column in (self.timestamps, self.model_ids, self.message_lengths, self.response_times, self.tokens)
+        )
+
+    def summary(self, since=None):
+        """
+        Статистика по моделям.
+
+        Args:
+            since (datetime, optional): Учитывать только записи не раньше этого времени
+
+        Returns:
+            dict: model -> {'count', 'tokens', 'avg_response_time', 'max_response_time'}
+        """
+        if numpy is not None:
+            return self._summary_numpy(since)
+
+        sums = {}
+        threshold = since.timestamp() if since else None
+        for i in range(len(self)):
+            if threshold is not None and self.timestamps[i] < threshold:
+                continue
+            total = sums.setdefault(self.model_ids[i], [0, 0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += self.tokens[i]
+            total[2] += self.response_times[i]
+            total[3] = max(total[3], self.response_times[i])
+        return {
+            self.models[model_id]: {
+                'count': count,
+                'tokens': tokens,
+                'avg_response_time': latency / count,
+                'max_response_time': max_latency
+            }
+            for model_id, (count, tokens, latency, max_latency) in sums.items()
+        }
+
+    def _summary_numpy(self, since):
+        """Статистика по моделям векторными операциями NumPy (без копирования столбцов)"""
+        if not len(self):
+            return {}
+        model_ids = numpy.frombuffer(self.model_ids, dtype=numpy.uint32)
+        tokens = numpy.frombuffer(self.tokens, dtype=numpy.int64)
+        latency = numpy.frombuffer(self.response_times, dtype=numpy.float64)
+        if since is not None:
+            mask = numpy.frombuffer(self.timestamps, dtype=numpy.float64) >= since.timestamp()
+            model_ids, tokens, latency = model_ids[mask], tokens[mask], latency[mask]
+
+        size = len(self.models)
+        counts = numpy.bincount(model_ids, minlength=size)
+        token_sums = numpy.bincount(model_ids, weights=tokens, minlength=size)
+        latency_sums = numpy.bincount(model_ids, weights=latency, minlength=size)
+        latency_max = numpy.zeros(size)
+        numpy.maximum.at(latency_max, model_ids, latency)
+        return {
+            self.models[model_id]: {
+                'count': int(counts[model_id]),
+                'tokens': int(token_sums[model_id]),
+                'avg_response_time': float(latency_sums[model_id] / counts[model_id]),
+                'max_response_time': float(latency_max[model_id])
+            }
+            for model_id in numpy.nonzero(counts)[0]
+        }
@@ -0,0 +1,268 @@
+# Импорт необходимых библиотек
+import zlib        # Стандартная библиотека сжатия (deflate) с поддержкой словарей
+import struct      # Библиотека для упаковки заголовка сжатых данных
+from collections import Counter  # Подсчет частоты фрагментов при обучении словаря
+
+# Опциональная зависимость: zstd сжимает лучше и быстрее, но не обязателен
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CompressedText:
+    """
+    Ленивая обертка над сжатым текстом из базы данных.
+
+    Распаковка выполняется только при первом обращении к тексту
+    (отображение сообщения или экспорт), результат запоминается.
+    Ведет себя как строка при выводе через str() и при сравнении.
+
+    Args:
+        blob (bytes): Сжатые данные с заголовком MessageCompressor
+        compressor (MessageCompressor): Объект, умеющий распаковать данные
+    """
+    __slots__ = ('_blob', '_compressor', '_text')
+
+    def __init__(self, blob: bytes, compressor):
+        self._blob = blob
+        self._compressor = compressor
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        """Распакованный текст (распаковка при первом обращении)"""
+        if self._text is None:
+            self._text = self._compressor.decompress(self._blob)
+            self._blob = None  # Сжатые данные больше не нужны
+        return self._text
+
+    @property
+    def is_loaded(self) -> bool:
+        """Был ли текст уже распакован"""
+        return self._text is not None
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded else f'{len(self._blob)} bytes'
+        return f'<CompressedText {state}>'
+
+    def __eq__(self, other):
+        if isinstance(other, CompressedText):
+            return self.text == other.text
+        return self.text == other
+
+    def __hash__(self):
+        return hash(self.text)
+
+
+class MessageCompressor:
+    """
+    Сжатие текстов сообщений для хранения в SQLite в виде BLOB.
+
+    Поддерживает:
+    - zlib (стандартная библиотека) с предустановленным словарем (zdict)
+    - zstd (пакет zstandard, если установлен) с обученным словарем
+
+    Формат сжатых данных: заголовок MAGIC + алгоритм (1 байт) +
+    ID словаря (4 байта, 0 - без словаря) + сжатые данные.
+    Заголовок позволяет хранить сжатые и несжатые строки в одной колонке
+    и распаковывать данные, сжатые старыми словарями.
+
+    Args:
+        algorithm (str): 'zlib' или 'zstd'
+        level (int, optional): Уровень сжатия. По умолчанию - стандартный для алгоритма
+        dictionary_loader: Функция, возвращающая байты словаря по его ID
+                           (используется для словарей, которых еще нет в памяти)
+
+    Raises:
+        ValueError: Если алгоритм неизвестен или zstandard не установлен
+    """
+
+    # Префикс, которым начинаются все сжатые значения
+    MAGIC = b'\x00CZ'
+    # Коды алгоритмов в заголовке
+    ALGORITHMS = {'zlib': 1, 'zstd': 2}
+    # Полный размер заголовка в байтах
+    HEADER_SIZE = len(MAGIC) + 5
+    # Размер словаря по умолчанию (zlib использует не более 32 КБ)
+    DEFAULT_DICT_SIZE = 32 * 1024
+
+    def __init__(self, algorithm='zlib', level=None, dictionary_loader=None):
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"Неизвестный алгоритм сжатия: {algorithm}")
+        if algorithm == 'zstd' and zstandard is None:
+            raise ValueError("Для сжатия zstd необходимо установить пакет zstandard")
+
+        self.algorithm = algorithm
+        self.level = level if level is not None else (6 if algorithm == 'zlib' else 3)
+        self.dictionary_loader = dictionary_loader
+
+        # Загруженные словари: ID -> байты словаря
+        self.dictionaries = {}
+        # ID словаря, используемого для сжатия новых данных (0 - без словаря)
+        self.current_dict_id = 0
+
+        # Кэш объектов zstd, привязанных к словарям
+        self._zstd_compressors = {}
+        self._zstd_decompressors = {}
+
+    @classmethod
+    def is_compressed(cls, value) -> bool:
+        """
+        Проверка, является ли значение из базы сжатыми данными.
+
+        Args:
+            value: Значение колонки (str, bytes или None)
+
+        Returns:
+            bool: True если значение сжато MessageCompressor
+        """
+        return isinstance(value, bytes) and value[:len(cls.MAGIC)] == cls.MAGIC
+
+    def set_dictionary(self, dict_id: int, data: bytes, make_current=True):
+        """
+        Регистрация словаря сжатия.
+
+        Args:
+            dict_id (int): ID словаря в базе данных
+            data (bytes): Содержимое словаря
+            make_current (bool): Использовать ли словарь для новых данных
+        """
+        self.dictionaries[dict_id] = data
+        if make_current:
+            self.current_dict_id = dict_id
+
+    def _get_dictionary(self, dict_id: int) -> bytes:
+        """Получение словаря по ID с подгрузкой через dictionary_loader"""
+        if dict_id not in self.dictionaries:
+            if self.dictionary_loader is None:
+                raise ValueError(f"Словарь сжатия {dict_id} не загружен")
+            self.dictionaries[dict_id] = self.dictionary_loader(dict_id)
+        return self.dictionaries[dict_id]
+
+    def compress(self, text: str) -> bytes:
+        """
+        Сжатие текста текущим алгоритмом и словарем.
+
+        Args:
+            text (str): Исходный текст
+
+        Returns:
+            bytes: Сжатые данные с заголовком
+        """
+        data = text.encode('utf-8')
+        dict_id = self.current_dict_id
+        algorithm_code = self.ALGORITHMS[self.algorithm]
+
+        if self.algorithm == 'zstd':
+            compressor = self._zstd_compressors.get(dict_id)
+            if compressor is None:
+                dict_data = zstandard.ZstdCompressionDict(self._get_dictionary(dict_id)) if dict_id else None
+                compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+                self._zstd_compressors[dict_id] = compressor
+            payload = compressor.compress(data)
+        else:
+            # Сырой deflate (wbits=-15) без заголовка и контрольной суммы zlib
+            if dict_id:
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15,
+                                              zdict=self._get_dictionary(dict_id))
+            else:
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+
+        return self.MAGIC + struct.pack('>BI', algorithm_code, dict_id) + payload
+
+    def decompress(self, blob: bytes) -> str:
+        """
+        Распаковка данных, сжатых любым поддерживаемым алгоритмом и словарем.
+
+        Args:
+            blob (bytes): Сжатые данные с заголовком
+
+        Returns:
+            str: Исходный текст
+
+        Raises:
+            ValueError: Если данные повреждены или алгоритм недоступен
+        """
+        if not self.is_compressed(blob):
+            raise ValueError("Данные не являются сжатым сообщением")
+
+        algorithm_code, dict_id = struct.unpack('>BI', blob[len(self.MAGIC):self.HEADER_SIZE])
+        payload = blob[self.HEADER_SIZE:]
+
+        if algorithm_code == self.ALGORITHMS['zstd']:
+            if zstandard is None:
+                raise ValueError("Для распаковки zstd необходимо установить пакет zstandard")
+            decompressor = self._zstd_decompressors.get(dict_id)
+            if decompressor is None:
+                dict_data = zstandard.ZstdCompressionDict(self._get_dictionary(dict_id)) if dict_id else None
+                decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+                self._zstd_decompressors[dict_id] = decompressor
+            data = decompressor.decompress(payload)
+        elif algorithm_code == self.ALGORITHMS['zlib']:
+            if dict_id:
+                decompressor = zlib.decompressobj(-15, zdict=self._get_dictionary(dict_id))
+            else:
+                decompressor = zlib.decompressobj(-15)
+            data = decompressor.decompress(payload) + decompressor.flush()
+        else:
+            raise ValueError(f"Неизвестный код алгоритма сжатия: {algorithm_code}")
+
+        return data.decode('utf-8')
+
+    def train_dictionary(self, samples, dict_size=None):
+        """
+        Обучение словаря на истории пользователя.
+
+        Для zstd используется встроенный алгоритм обучения zstandard.
+        Для zlib словарь собирается из наиболее частых строк сообщений:
+        zlib ищет совпадения в конце словаря, поэтому самые полезные
+        фрагменты располагаются ближе к концу.
+
+        Args:
+            samples (list): Список текстов для обучения
+            dict_size (int, optional): Максимальный размер словаря в байтах
+
+        Returns:
+            bytes: Содержимое словаря или None, если данных для обучения мало
+        """
+        dict_size = dict_size or self.DEFAULT_DICT_SIZE
+        encoded = [s.encode('utf-8') for s in samples if s]
+        if len(encoded) < 2:
+            return None
+
+        if self.algorithm == 'zstd':
+            try:
+                return zstandard.train_dictionary(dict_size, encoded).as_bytes()
+            except zstandard.ZstdError:
+                # zstd требует достаточного объема выборки
+                return None
+
+        # Подсчет строк, повторяющихся в разных сообщениях
+        line_counts = Counter()
+        for sample in encoded:
+            line_counts.update(set(line.strip() for line in sample.splitlines() if len(line.strip()) >= 8))
+
+        # Оценка пользы фрагмента: сколько байт он сэкономит во всей выборке
+        repeated = [(count * len(line), line) for line, count in line_counts.items() if count > 1]
+        repeated.sort()
+
+        # Самые полезные фрагменты попадают в конец словаря
+        chunks = []
+        total = 0
+        for _, line in reversed(repeated):
+            if total + len(line) + 1 > dict_size:
+                continue
+            chunks.append(line)
+            total += len(line) + 1
+        chunks.reverse()
+
+        # При малом количестве повторов дополняем словарь хвостами сообщений
+        if total < dict_size // 4:
+            tail = b'\n'.join(encoded)[-(dict_size - total):]
+            return tail + b'\n' + b'\n'.join(chunks)
+        return b'\n'.join(chunks)
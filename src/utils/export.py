@@ -0,0 +1,315 @@
+# Импорт необходимых библиотек
+import gzip        # Библиотека для сжатия экспортируемых файлов
+import json        # Библиотека для работы с JSON форматом (NDJSON)
+import os          # Библиотека для работы с файлами
+from datetime import datetime  # Библиотека для работы с датой и временем
+
+# Опциональная зависимость для колоночного экспорта (Parquet / Arrow IPC)
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class HistoryExporter:
+    """
+    Потоковый экспорт и импорт истории чата в формате NDJSON.
+
+    NDJSON - одна JSON запись на строку. Такой формат можно писать и читать
+    построчно, поэтому память не зависит от размера истории. Файлы с
+    расширением .gz автоматически сжимаются/распаковываются gzip.
+
+    Методы рассчитаны на выполнение в фоновом потоке: они принимают
+    колбэк прогресса и событие отмены (threading.Event).
+
+    Args:
+        cache (ChatCache): Экземпляр класса кэширования
+    """
+
+    # Количество сообщений, читаемых из базы за один запрос при экспорте
+    EXPORT_BATCH_SIZE = 1000
+    # Количество сообщений в одной транзакции при импорте
+    IMPORT_BATCH_SIZE = 5000
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    @staticmethod
+    def _open(path, mode):
+        """Открытие файла с прозрачным gzip сжатием для путей *.gz"""
+        if path.endswith('.gz'):
+            return gzip.open(path, mode + 't', encoding='utf-8')
+        return open(path, mode, encoding='utf-8')
+
+    def export_ndjson(self, path, conversation_id=None, progress=None, cancel_event=None):
+        """
+        Экспорт сообщений в NDJSON файл.
+
+        Сообщения читаются из базы пачками по EXPORT_BATCH_SIZE и сразу
+        записываются в файл. Запись идет во временный файл, который
+        переименовывается только после успешного завершения.
+
+        Args:
+            path (str): Путь к файлу (*.ndjson или *.ndjson.gz)
+            conversation_id (int, optional): Экспорт одной беседы. По умолчанию - все беседы
+            progress: Колбэк progress(done, total), вызывается после каждой пачки
+            cancel_event (threading.Event, optional): Событие отмены экспорта
+
+        Returns:
+            dict: {'path': str, 'rows': int, 'cancelled': bool}
+        """
+        total = self.cache.count_messages(conversation_id)
+        tmp_path = path + '.tmp' + ('.gz' if path.endswith('.gz') else '')
+        rows = 0
+        cancelled = False
+
+        try:
+            with self._open(tmp_path, 'w') as f:
+                for batch in self.cache.iter_messages(conversation_id, batch_size=self.EXPORT_BATCH_SIZE):
+                    if cancel_event is not None and cancel_event.is_set():
+                        cancelled = True
+                        break
+                    for record in batch:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str))
+                        f.write('\n')
+                    rows += len(batch)
+                    if progress:
+                        progress(rows, total)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # При отмене частичный файл не сохраняется
+        if cancelled:
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+
+        return {'path': path, 'rows': rows, 'cancelled': cancelled}
+
+    def _read_records(self, path):
+        """
+        Построчное чтение записей NDJSON файла.
+
+        Args:
+            path (str): Путь к файлу
+
+        Yields:
+            dict: Запись сообщения
+        """
+        with self._open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def import_ndjson(self, path, conversation_id=None, progress=None, cancel_event=None):
+        """
+        Импорт сообщений из NDJSON файла.
+
+        Записи вставляются через executemany пачками по IMPORT_BATCH_SIZE,
+        каждая пачка - одна транзакция.
+
+        Args:
+            path (str): Путь к файлу (*.ndjson или *.ndjson.gz)
+            conversation_id (int, optional): Импорт всех сообщений в одну беседу.
+                По умолчанию для каждой беседы из файла создается новая беседа
+            progress: Колбэк progress(done, total), total всегда None (размер файла заранее неизвестен)
+            cancel_event (threading.Event, optional): Событие отмены импорта.
+                Уже вставленные пачки при отмене сохраняются
+
+        Returns:
+            dict: {'rows': int, 'cancelled': bool}
+        """
+        # Соответствие ID бесед и сообщений из файла и созданных локально
+        conversation_map = {}
+        message_map = {}
+        batch = []
+        rows = 0
+        cancelled = False
+
+        for record in self._read_records(path):
+            batch.append(record)
+            if len(batch) >= self.IMPORT_BATCH_SIZE:
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                    batch = []
+                    break
+                rows += self.cache.import_messages(batch, conversation_id, conversation_map, message_map)
+                batch = []
+                if progress:
+                    progress(rows, None)
+
+        if batch:
+            rows += self.cache.import_messages(batch, conversation_id, conversation_map, message_map)
+            if progress:
+                progress(rows, None)
+
+        return {'rows': rows, 'cancelled': cancelled}
+
+
+class AnalyticsExporter:
+    """
+    Колоночный экспорт аналитики в Parquet или Arrow IPC для офлайн-анализа.
+
+    Каждый запуск дописывает в директорию набора данных новый файл-часть
+    (part-00001.parquet, part-00002.parquet, ...) только с теми строками,
+    которые появились после предыдущего экспорта. Отметка последней
+    выгруженной строки хранится в базе (таблица export_state).
+    Директорию целиком можно открыть как один набор данных
+    (pyarrow.dataset, pandas, DuckDB, Spark).
+
+    Данные читаются из базы пачками и пишутся по мере чтения:
+    одна пачка - одна группа строк (row group) в Parquet.
+
+    Args:
+        cache (ChatCache): Экземпляр класса кэширования
+        directory (str): Корневая директория для наборов данных
+
+    Raises:
+        ValueError: Если пакет pyarrow не установлен
+    """
+
+    # Поддерживаемые таблицы и форматы
+    TABLES = ('analytics_messages', 'messages')
+    FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+    # Количество строк в одной группе строк (и в одной пачке чтения из базы)
+    ROW_GROUP_SIZE = 50000
+
+    def __init__(self, cache, directory=os.path.join("exports", "analytics")):
+        if pyarrow is None:
+            raise ValueError("Для колоночного экспорта необходимо установить пакет pyarrow")
+        self.cache = cache
+        self.directory = directory
+
+    @staticmethod
+    def schema(table):
+        """
+        Типизированная схема выгружаемой таблицы.
+
+        Args:
+            table (str): 'analytics_messages' или 'messages'
+
+        Returns:
+            pyarrow.Schema: Схема набора данных
+        """
+        pa = pyarrow
+        if table == 'analytics_messages':
+            return pa.schema([
+                ('id', pa.int64()),
+                ('timestamp', pa.timestamp('us')),
+                ('model', pa.dictionary(pa.int32(), pa.string())),
+                ('message_length', pa.int32()),
+                ('response_time', pa.float64()),
+                ('tokens_used', pa.int64()),
+            ])
+        # Для messages выгружаются только метаданные, без текстов
+        return pa.schema([
+            ('id', pa.int64()),
+            ('conversation_id', pa.int64()),
+            ('timestamp', pa.timestamp('us')),
+            ('model', pa.dictionary(pa.int32(), pa.string())),
+            ('tokens_used', pa.int64()),
+            ('user_message_length', pa.int32()),
+            ('ai_response_length', pa.int32()),
+        ])
+
+    @staticmethod
+    def _parse_timestamp(value):
+        """Преобразование временной метки SQLite в datetime"""
+        if value is None or isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(value)
+
+    def _next_part_path(self, table, fmt):
+        """Путь для следующего файла-части набора данных"""
+        table_dir = os.path.join(self.directory, table)
+        os.makedirs(table_dir, exist_ok=True)
+        extension = self.FORMATS[fmt]
+        numbers = [
+            int(name[len('part-'):-len(extension)])
+            for name in os.listdir(table_dir)
+            if name.startswith('part-') and name.endswith(extension)
+        ]
+        return os.path.join(table_dir, f"part-{max(numbers, default=0) + 1:05d}{extension}")
+
+    def export(self, table='analytics_messages', fmt='parquet', incremental=True, progress=None):
+        """
+        Выгрузка новых строк таблицы в файл-часть набора данных.
+
+        Args:
+            table (str): 'analytics_messages' или 'messages' (метаданные)
+            fmt (str): 'parquet' или 'arrow' (Arrow IPC)
+            incremental (bool): Выгружать только строки после предыдущего экспорта.
+                При False выгружается вся таблица (отметка все равно обновляется)
+            progress: Колбэк progress(done), вызывается после каждой группы строк
+
+        Returns:
+            dict: {'path': str или None, 'rows': int} - путь к новому файлу
+                  (None, если новых строк нет) и количество строк
+
+        Raises:
+            ValueError: Если таблица или формат не поддерживаются
+        """
+        if table not in self.TABLES:
+            raise ValueError(f"Неподдерживаемая таблица: {table}")
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Неподдерживаемый формат: {fmt}")
+
+        pa = pyarrow
+        schema = self.schema(table)
+        state_name = f"{table}.{fmt}"
+        after_id = self.cache.get_export_watermark(state_name) if incremental else None
+
+        path = None
+        tmp_path = None
+        writer = None
+        rows = 0
+        last_id = after_id
+
+        try:
+            for batch in self.cache.iter_export_rows(table, after_id, batch_size=self.ROW_GROUP_SIZE):
+                # Формирование колонок пачки
+                columns = {name: [] for name in schema.names}
+                for record in batch:
+                    for name, value in zip(schema.names, record):
+                        columns[name].append(value)
+                columns['timestamp'] = [self._parse_timestamp(value) for value in columns['timestamp']]
+                record_batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+
+                # Файл создается только при наличии новых строк
+                if writer is None:
+                    path = self._next_part_path(table, fmt)
+                    tmp_path = path + '.tmp'
+                    if fmt == 'parquet':
+                        writer = pa.parquet.ParquetWriter(tmp_path, schema)
+                    else:
+                        writer = pa.ipc.new_file(tmp_path, schema)
+
+                if fmt == 'parquet':
+                    writer.write_batch(record_batch, row_group_size=self.ROW_GROUP_SIZE)
+                else:
+                    writer.write_batch(record_batch)
+
+                rows += len(batch)
+                last_id = batch[-1][0]
+                if progress:
+                    progress(rows)
+
+            if writer is not None:
+                writer.close()
+                writer = None
+                os.replace(tmp_path, path)
+        except Exception:
+            if writer is not None:
+                writer.close()
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # Отметка сдвигается только после успешной записи файла
+        if rows:
+            self.cache.set_export_watermark(state_name, last_id)
+
+        return {'path': path, 'rows': rows}
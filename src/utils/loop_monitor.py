@@ -0,0 +1,274 @@
+# Импорт необходимых библиотек
+import asyncio     # Контрольная задача в цикле событий
+import os          # Библиотека для работы с путями и переменными окружения
+import sys         # Стек потока цикла событий во время задержки
+import threading   # Сторожевой поток
+import time        # Монотонные метки времени
+from collections import deque  # Последние медленные обработчики
+from concurrent.futures import ThreadPoolExecutor  # Пул потоков по умолчанию цикла событий
+
+from .metrics import Counter, Histogram  # Метрики задержки цикла событий
+
+# Границы корзин задержки цикла событий (секунды)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """
+    Пул потоков с учетом загрузки: задачи в очереди и занятые потоки
+    считаются при постановке задачи (submit) и ее выполнении.
+
+    Args:
+        max_workers (int, optional): Предел потоков. По умолчанию - как у ThreadPoolExecutor
+        thread_name_prefix (str): Префикс имен потоков
+    """
+
+    def __init__(self, max_workers=None, thread_name_prefix=''):
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.max_workers = max_workers
+        self.queued = 0   # Задачи, ожидающие свободного потока
+        self.active = 0   # Задачи, выполняющиеся сейчас
+        self._counts_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._counts_lock:
+            self.queued += 1
+        try:
+            future = super().submit(self._run, fn, args, kwargs)
+        except BaseException:
+            with self._counts_lock:
+                self.queued -= 1
+            raise
+        # Отмененная до запуска задача не выполняется и уходит из очереди здесь
+        future.add_done_callback(self._cancelled)
+        return future
+
+    def _run(self, fn, args, kwargs):
+        """Выполнение задачи с учетом занятого потока"""
+        with self._counts_lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._counts_lock:
+                self.active -= 1
+
+    def _cancelled(self, future):
+        if future.cancelled():
+            with self._counts_lock:
+                self.queued -= 1
+
+    def stats(self):
+        """
+        Загрузка пула потоков.
+
+        Returns:
+            dict: queued - задачи в очереди, active - занятые потоки,
+                  max_workers - предел потоков
+        """
+        with self._counts_lock:
+            return {'queued': self.queued, 'active': self.active, 'max_workers': self.max_workers}
+
+
+class LoopMonitor:
+    """
+    Мониторинг задержки цикла событий asyncio и загрузки пулов потоков.
+
+    Обработчики интерфейса асинхронные и выполняются в цикле событий;
+    синхронная работа внутри них (SQLite, файлы, логирование) задерживает
+    цикл, и интерфейс перестает отвечать. Монитор измеряет это так:
+
+    - контрольная задача в цикле засыпает на interval секунд и измеряет,
+      насколько позже она проснулась (задержка цикла);
+    - сторожевой поток замечает, что контрольная задача не просыпается
+      дольше threshold, и снимает стек потока цикла событий - так
+      определяется обработчик, который держит цикл (самый внешний кадр
+      кода приложения) и строка, на которой он находится;
+    - задержки дольше threshold записываются в журнал и в список медленных
+      обработчиков, который PerformanceMonitor.check_health выводит как
+      предупреждения (add_health_check).
+
+    Для пула потоков по умолчанию (run_in_executor(None, ...)) монитор
+    устанавливает собственный CountingExecutor и публикует длину очереди
+    задач и количество занятых потоков; другие пулы приложения учитываются
+    через watch_executor.
+
+    Args:
+        interval (float): Период контрольной задачи в секундах
+        threshold (float): Задержка цикла, считающаяся медленным обработчиком (секунды)
+        window (float): Сколько секунд медленный обработчик остается в предупреждениях
+        logger (AppLogger, optional): Логгер для записи медленных обработчиков
+    """
+
+    # Код приложения - файлы в директории src (кроме самого монитора)
+    APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(self, interval=0.25, threshold=0.1, window=300, logger=None):
+        if interval <= 0 or threshold <= 0:
+            raise ValueError("Период и порог задержки цикла событий должны быть положительными")
+        self.interval = interval
+        self.threshold = threshold
+        self.window = window
+        self.logger = logger
+
+        self.lag = Histogram('event_loop_lag_seconds', 'Задержка цикла событий интерфейса', buckets=LAG_BUCKETS)
+        self.slow_callbacks = Counter('event_loop_slow_callbacks', 'Обработчики, задержавшие цикл событий дольше порога',
+                                      ('handler',))
+        self.max_lag = 0.0
+        self.recent = deque(maxlen=100)  # (время, обработчик, место, задержка)
+        self.executors = {}              # Имя -> CountingExecutor
+
+        self._loop_thread = None
+        self._beat = None                # Время последнего пробуждения контрольной задачи
+        self._stall = None               # Обработчик и место, снятые во время текущей задержки
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_env(cls, logger=None):
+        """
+        Создание монитора из переменных окружения.
+
+        Использует LOOP_HEARTBEAT_MS и LOOP_LAG_THRESHOLD_MS.
+
+        Returns:
+            LoopMonitor: Настроенный монитор
+        """
+        interval = os.getenv("LOOP_HEARTBEAT_MS")
+        threshold = os.getenv("LOOP_LAG_THRESHOLD_MS")
+        return cls(
+            interval=float(interval) / 1000 if interval else 0.25,
+            threshold=float(threshold) / 1000 if threshold else 0.1,
+            logger=logger
+        )
+
+    def watch_executor(self, name, executor):
+        """
+        Учет загрузки пула потоков.
+
+        Args:
+            name (str): Имя пула в метриках и статистике
+            executor (CountingExecutor): Пул потоков
+        """
+        self.executors[name] = executor
+
+    def get_executor_stats(self):
+        """Загрузка всех учитываемых пулов потоков: имя -> CountingExecutor.stats"""
+        return {name: executor.stats() for name, executor in self.executors.items()}
+
+    async def run(self):
+        """
+        Контрольная задача цикла событий (запускается через page.run_task).
+
+        Устанавливает учитываемый пул потоков по умолчанию для
+        run_in_executor(None, ...) и запускает сторожевой поток.
+        """
+        loop = asyncio.get_running_loop()
+        executor = CountingExecutor(thread_name_prefix="asyncio")
+        loop.set_default_executor(executor)
+        self.watch_executor('default', executor)
+
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name="LoopMonitor", daemon=True)
+        self._thread.start()
+
+        while not self._stop_event.is_set():
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(now - expected, 0.0)
+            self.lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                handler, location = self._stall or ('unknown', None)
+                self._report(handler, location, lag)
+            self._stall = None
+
+    def stop(self):
+        """Остановка контрольной задачи и сторожевого потока"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        """Сторожевой поток: снимок стека цикла событий, пока контрольная задача задержана"""
+        while not self._stop_event.wait(self.threshold / 2):
+            beat = self._beat
+            if self._stall is None and time.monotonic() - beat > self.interval + self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                stall = self._handler(frame)
+                # Контрольная задача могла проснуться во время снимка
+                if self._beat == beat:
+                    self._stall = stall
+
+    def _handler(self, frame):
+        """
+        Обработчик, выполняющийся в кадре frame.
+
+        Returns:
+            tuple: (самая внешняя функция приложения в стеке, 'файл:строка'
+                   самого внутреннего кадра приложения) или ('unknown', None)
+        """
+        outer = inner = None
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(self.APP_ROOT) and filename != __file__:
+                if inner is None:
+                    inner = f"{os.path.relpath(filename, self.APP_ROOT)}:{frame.f_lineno}"
+                outer = frame.f_code.co_name
+            frame = frame.f_back
+        return (outer, inner) if outer else ('unknown', None)
+
+    def _report(self, handler, location, lag):
+        """Учет медленного обработчика"""
+        self.slow_callbacks.inc(handler)
+        self.recent.append((time.time(), handler, location, lag))
+        if self.logger:
+            where = f" ({location})" if location else ""
+            self.logger.warning(f"Цикл событий задержан на {lag * 1000:.0f} мс: {handler}{where}")
+
+    def health_warnings(self):
+        """
+        Медленные обработчики за последние window секунд (для PerformanceMonitor.check_health).
+
+        Returns:
+            list: Текст предупреждений, по одному на обработчик (с наибольшей задержкой)
+        """
+        since = time.time() - self.window
+        worst = {}
+        for timestamp, handler, location, lag in list(self.recent):
+            if timestamp >= since and lag > worst.get(handler, (0, None))[0]:
+                worst[handler] = (lag, location)
+        warnings = [
+            f"Event loop blocked {lag * 1000:.0f} ms by {handler}" + (f" at {location}" if location else "")
+            for handler, (lag, location) in sorted(worst.items(), key=lambda item: -item[1][0])
+        ]
+        for name, stats in self.get_executor_stats().items():
+            if stats['queued']:
+                warnings.append(f"Executor {name} saturated: {stats['active']}/{stats['max_workers']} "
+                                f"workers busy, {stats['queued']} queued")
+        return warnings
+
+    def register_metrics(self, registry):
+        """
+        Публикация задержки цикла событий, медленных обработчиков и загрузки пулов потоков.
+
+        Args:
+            registry (MetricsRegistry): Реестр метрик
+        """
+        def executors(key):
+            return lambda: {(name,): stats[key] for name, stats in self.get_executor_stats().items()}
+
+        registry.register(self.lag)
+        registry.register(self.slow_callbacks)
+        registry.gauge('executor_queued_tasks', 'Задачи в очереди пула потоков', ('executor',),
+                       callback=executors('queued'))
+        registry.gauge('executor_active_workers', 'Занятые потоки пула', ('executor',),
+                       callback=executors('active'))
@@ -0,0 +1,234 @@
+# Импорт необходимых библиотек
+import gc          # Перепись объектов отслеживаемых классов
+import os          # Библиотека для работы с переменными окружения
+import threading   # Фоновый поток снимков
+import tracemalloc # Снимки выделений памяти по строкам кода
+from datetime import datetime  # Время последнего снимка
+
+
+class MemoryDiagnostics:
+    """
+    Диагностика роста памяти долго работающего приложения.
+
+    В режиме диагностики включается tracemalloc, и фоновый поток раз
+    в interval секунд:
+    - снимает снимок выделений и сравнивает его с предыдущим, записывая
+      в журнал top строк кода с наибольшим ростом;
+    - считает объекты отслеживаемых классов (track_type) и размеры
+      отслеживаемых коллекций (track_size) - история чата, данные сессии,
+      история метрик, диалоги страницы;
+    - сравнивает рост отслеживаемой памяти с момента запуска с бюджетом.
+
+    Превышение бюджета и рост коллекций попадают в предупреждения
+    health_warnings(), которые PerformanceMonitor.check_health добавляет
+    к своим проверкам.
+
+    tracemalloc замедляет выделение памяти, поэтому режим включается
+    только для диагностики (переменная MEMORY_DIAGNOSTICS_INTERVAL).
+
+    Args:
+        interval (float): Интервал снимков в секундах
+        growth_budget_mb (float): Допустимый рост отслеживаемой памяти с запуска (МБ)
+        top (int): Количество строк кода с наибольшим ростом в журнале
+        frames (int): Глубина стека, сохраняемая tracemalloc для каждого выделения
+        logger (AppLogger, optional): Логгер для записи результатов
+    """
+
+    # Выделения самих механизмов диагностики не учитываются
+    IGNORED_FILES = (tracemalloc.__file__, __file__, '<frozen importlib._bootstrap>',
+                     '<frozen importlib._bootstrap_external>', '<unknown>')
+
+    def __init__(self, interval=300, growth_budget_mb=50, top=10, frames=1, logger=None):
+        if interval <= 0:
+            raise ValueError("Интервал снимков памяти должен быть положительным")
+        self.interval = interval
+        self.growth_budget = growth_budget_mb * 1024 * 1024
+        self.top = top
+        self.frames = frames
+        self.logger = logger
+
+        self.types = {}      # Имя -> отслеживаемый класс
+        self.sizes = {}      # Имя -> функция, возвращающая размер коллекции
+        self.baseline_bytes = None
+        self.last_report = None
+        self._baseline_counts = {}
+        self._previous = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, logger=None):
+        """
+        Создание диагностики из переменных окружения.
+
+        Использует MEMORY_DIAGNOSTICS_INTERVAL (секунды; пусто - режим выключен),
+        MEMORY_GROWTH_BUDGET_MB и MEMORY_TRACE_FRAMES.
+
+        Returns:
+            MemoryDiagnostics: Диагностика или None, если режим выключен
+        """
+        interval = os.getenv("MEMORY_DIAGNOSTICS_INTERVAL")
+        if not interval:
+            return None
+        budget = os.getenv("MEMORY_GROWTH_BUDGET_MB")
+        frames = os.getenv("MEMORY_TRACE_FRAMES")
+        return cls(
+            interval=float(interval),
+            growth_budget_mb=float(budget) if budget else 50,
+            frames=int(frames) if frames else 1,
+            logger=logger
+        )
+
+    def track_type(self, cls):
+        """Учет количества живых объектов класса cls"""
+        self.types[cls.__name__] = cls
+
+    def track_size(self, name, size):
+        """
+        Учет размера коллекции.
+
+        Args:
+            name (str): Имя коллекции в отчете
+            size (callable): Функция без аргументов, возвращающая размер
+        """
+        self.sizes[name] = size
+
+    def _snapshot(self):
+        """Снимок выделений без выделений служебных модулей"""
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces([tracemalloc.Filter(False, path) for path in self.IGNORED_FILES])
+
+    def census(self):
+        """
+        Количество объектов отслеживаемых классов и размеры коллекций.
+
+        Returns:
+            dict: Имя -> количество (ошибка вычисления размера - None)
+        """
+        counts = {}
+        if self.types:
+            tracked = {cls: name for name, cls in self.types.items()}
+            counts = dict.fromkeys(self.types, 0)
+            for obj in gc.get_objects():
+                name = tracked.get(type(obj))
+                if name is not None:
+                    counts[name] += 1
+        for name, size in self.sizes.items():
+            try:
+                counts[name] = size()
+            except Exception:
+                counts[name] = None
+        return counts
+
+    def take_report(self):
+        """
+        Снимок, сравнение с предыдущим и перепись объектов.
+
+        Returns:
+            dict: timestamp, traced_bytes (отслеживаемая память), growth_bytes
+                  (рост с запуска), top_growth (строки кода: место, рост в байтах,
+                  рост числа блоков), census и census_growth (изменение с запуска)
+        """
+        snapshot = self._snapshot()
+        traced = tracemalloc.get_traced_memory()[0]
+        census = self.census()
+
+        top_growth = []
+        if self._previous is not None:
+            for stat in snapshot.compare_to(self._previous, 'lineno')[:self.top]:
+                if stat.size_diff <= 0:
+                    break
+                frame = stat.traceback[0]
+                top_growth.append({
+                    'location': f"{frame.filename}:{frame.lineno}",
+                    'size_diff': stat.size_diff,
+                    'count_diff': stat.count_diff,
+                })
+        self._previous = snapshot
+
+        with self._lock:
+            if self.baseline_bytes is None:
+                self.baseline_bytes = traced
+                self._baseline_counts = dict(census)
+            report = {
+                'timestamp': datetime.now(),
+                'traced_bytes': traced,
+                'growth_bytes': traced - self.baseline_bytes,
+                'top_growth': top_growth,
+                'census': census,
+                'census_growth': {
+                    name: count - self._baseline_counts[name]
+                    for name, count in census.items()
+                    if count is not None and self._baseline_counts.get(name) is not None
+                },
+            }
+            self.last_report = report
+        return report
+
+    def _log_report(self, report):
+        """Запись отчета в журнал"""
+        if not self.logger:
+            return
+        self.logger.info(
+            f"Память: отслеживается {report['traced_bytes'] / 1024 / 1024:.1f} МБ, "
+            f"рост с запуска {report['growth_bytes'] / 1024 / 1024:+.1f} МБ; "
+            + ", ".join(f"{name}: {count}" for name, count in report['census'].items())
+        )
+        for item in report['top_growth']:
+            self.logger.info(
+                f"Рост памяти: {item['location']} {item['size_diff'] / 1024:+.1f} КБ "
+                f"({item['count_diff']:+d} блоков)"
+            )
+        for warning in self.health_warnings():
+            self.logger.warning(warning)
+
+    def health_warnings(self):
+        """
+        Предупреждения по последнему отчету (для PerformanceMonitor.check_health).
+
+        Returns:
+            list: Текст предупреждений (пустой - рост в пределах бюджета)
+        """
+        with self._lock:
+            report = self.last_report
+        if report is None or report['growth_bytes'] <= self.growth_budget:
+            return []
+        growing = sorted(
+            ((name, growth) for name, growth in report['census_growth'].items() if growth > 0),
+            key=lambda item: item[1], reverse=True
+        )
+        details = ", ".join(f"{name} {growth:+d}" for name, growth in growing[:3])
+        warning = (f"Memory growth {report['growth_bytes'] / 1024 / 1024:.1f} MB exceeds budget "
+                   f"{self.growth_budget / 1024 / 1024:.0f} MB")
+        return [f"{warning} ({details})" if details else warning]
+
+    def _run(self):
+        """Цикл фонового потока: отчет раз в interval секунд"""
+        while True:
+            try:
+                self._log_report(self.take_report())
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Ошибка диагностики памяти: {e}")
+            if self._stop_event.wait(self.interval):
+                break
+
+    def start(self):
+        """Включение tracemalloc и запуск фоновых снимков"""
+        if self._thread and self._thread.is_alive():
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="MemoryDiagnostics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка снимков и tracemalloc"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        tracemalloc.stop()
+        self._previous = None
@@ -0,0 +1,361 @@
+# Импорт необходимых библиотек
+import bisect      # Поиск корзины гистограммы
+import math        # Бесконечная граница последней корзины
+import os          # Библиотека для работы с переменными окружения
+import re          # Проверка имен метрик
+import threading   # Потоковые части счетчиков и поток HTTP сервера
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Эндпоинт для сборщика метрик
+
+# Тип содержимого текстового формата OpenMetrics
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Допустимые имена метрик и меток
+_NAME_PATTERN = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+_LABEL_PATTERN = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+# Границы корзин гистограмм времени по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    """Значение образца в текстовом формате"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    value = float(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(value)
+
+
+def _escape(value, quote=True):
+    """Экранирование значения метки или текста справки"""
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+class Metric:
+    """
+    Базовый класс метрики.
+
+    Значения метрики либо накапливаются вызовами (inc, observe), либо
+    вычисляются функцией callback при каждом чтении - так публикуются
+    значения, которые приложение уже хранит, без дополнительной работы
+    при их изменении.
+
+    Накопление выполняется в частях, принадлежащих потокам: поток изменяет
+    только свой словарь, поэтому блокировки на горячем пути не нужны;
+    при чтении части складываются.
+
+    Args:
+        name (str): Имя метрики (без суффиксов _total, _bucket и т.п.)
+        documentation (str): Описание метрики
+        labels (tuple): Имена меток
+        callback (callable, optional): Функция, возвращающая значения при чтении
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"Недопустимое имя метрики: {name}")
+        for label in labels:
+            if not _LABEL_PATTERN.match(label) or label == 'le':
+                raise ValueError(f"Недопустимое имя метки: {label}")
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()  # Только при первом обращении потока
+
+    def _shard(self):
+        """Словарь значений текущего потока"""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(values)
+            return values
+
+    def _values(self):
+        """
+        Значения по наборам меток.
+
+        Returns:
+            dict: Кортеж значений меток -> значение
+        """
+        if self.callback is not None:
+            values = self.callback()
+            # Метрика без меток может вернуть одно число
+            return values if isinstance(values, dict) else {(): values}
+        total = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # list() копирует словарь целиком, не уступая GIL другим потокам
+            for key, value in list(shard.items()):
+                total[key] = self._merge(total.get(key), value)
+        return total
+
+    def _merge(self, total, value):
+        return value if total is None else total + value
+
+    def samples(self):
+        """
+        Образцы метрики для экспорта.
+
+        Returns:
+            list: Тройки (суффикс имени, словарь меток, значение)
+        """
+        return [
+            ('', dict(zip(self.labels, key)), value)
+            for key, value in sorted(self._values().items())
+        ]
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    type = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        """
+        Увеличение счетчика.
+
+        Args:
+            *label_values: Значения меток в порядке labels
+            amount (int | float): Неотрицательное приращение
+        """
+        values = self._shard()
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def samples(self):
+        return [('_total', labels, value) for _, labels, value in super().samples()]
+
+
+class Gauge(Metric):
+    """
+    Текущее значение (например, размер базы или очередь операций).
+
+    Обычно задается функцией callback; set() сохраняет значение, заданное явно.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels, callback)
+        self._current = {}
+
+    def set(self, value, *label_values):
+        """Установка значения для набора меток"""
+        self._current[label_values] = value
+
+    def _values(self):
+        if self.callback is not None:
+            return super()._values()
+        return dict(self._current)
+
+
+class Histogram(Metric):
+    """
+    Гистограмма распределения значений с фиксированными границами корзин.
+
+    Наблюдение - поиск корзины и увеличение счетчика в части текущего потока.
+    Функция callback возвращает для каждого набора меток пару
+    (количества по корзинам без накопления, включая корзину +Inf; сумма значений).
+
+    Args:
+        buckets (tuple): Возрастающие верхние границы корзин (без +Inf)
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), callback=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels, callback)
+        if list(buckets) != sorted(buckets) or not buckets:
+            raise ValueError("Границы корзин гистограммы должны возрастать")
+        self.buckets = tuple(float(bound) for bound in buckets)
+
+    def observe(self, value, *label_values):
+        """
+        Учет значения.
+
+        Args:
+            value (float): Наблюдаемое значение
+            *label_values: Значения меток в порядке labels
+        """
+        values = self._shard()
+        state = values.get(label_values)
+        if state is None:
+            # Счетчики корзин (последняя - +Inf) и сумма значений
+            state = values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def _merge(self, total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def samples(self):
+        result = []
+        for key, (counts, total) in sorted(self._values().items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                result.append(('_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            result.append(('_count', labels, cumulative))
+            result.append(('_sum', labels, total))
+        return result
+
+
+class MetricsRegistry:
+    """
+    Набор метрик приложения и их вывод в текстовом формате OpenMetrics.
+
+    Компоненты регистрируют свои метрики методами register_metrics(registry);
+    вычисление значений, заданных функциями, выполняется только при чтении.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Регистрация метрики.
+
+        Returns:
+            Metric: Зарегистрированная метрика
+
+        Raises:
+            ValueError: Если метрика с таким именем уже зарегистрирована
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=(), callback=None):
+        """Создание и регистрация счетчика"""
+        return self.register(Counter(name, documentation, labels, callback))
+
+    def gauge(self, name, documentation, labels=(), callback=None):
+        """Создание и регистрация текущего значения"""
+        return self.register(Gauge(name, documentation, labels, callback))
+
+    def histogram(self, name, documentation, labels=(), callback=None, buckets=DEFAULT_BUCKETS):
+        """Создание и регистрация гистограммы"""
+        return self.register(Histogram(name, documentation, labels, callback, buckets))
+
+    def render(self):
+        """
+        Все метрики в текстовом формате OpenMetrics.
+
+        Метрика, значения которой не удалось вычислить, выводится без образцов,
+        чтобы одна ошибка не лишала сборщик остальных метрик.
+
+        Returns:
+            str: Текст экспозиции, завершенный строкой '# EOF'
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation, quote=False)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            try:
+                samples = metric.samples()
+            except Exception:
+                continue
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{name}="{_escape(label)}"' for name, label in labels.items())
+                name = metric.name + suffix
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f"{name} {_format_value(value)}")
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Локальный HTTP эндпоинт /metrics для сборщика метрик (Prometheus и др.).
+
+    Сервер работает в фоновом потоке; каждый запрос обслуживается
+    в отдельном потоке и только читает метрики.
+
+    Args:
+        registry (MetricsRegistry): Публикуемые метрики
+        port (int): Порт (0 - любой свободный, фактический порт - в self.port)
+        host (str): Адрес прослушивания. По умолчанию - только локальные подключения
+    """
+
+    PATH = '/metrics'
+
+    def __init__(self, registry, port, host='127.0.0.1'):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._server = None
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, registry):
+        """
+        Создание сервера из переменных окружения.
+
+        Использует METRICS_PORT и METRICS_HOST.
+
+        Returns:
+            MetricsServer: Сервер или None, если порт не задан
+        """
+        port = os.getenv("METRICS_PORT")
+        if not port:
+            return None
+        return cls(registry, int(port), os.getenv("METRICS_HOST") or '127.0.0.1')
+
+    def start(self):
+        """Запуск HTTP сервера в фоновом потоке"""
+        if self._server is not None:
+            return
+        registry = self.registry
+        path = self.PATH
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != path:
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Запросы сборщика не записываются в журнал
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка HTTP сервера"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
@@ -1,9 +1,14 @@
 # Импорт необходимых библиотек
+import os          # Библиотека для работы с переменными окружения
+import re          # Ключ повторов предупреждения (текст без чисел)
 import psutil      # Библиотека для мониторинга системных ресурсов (CPU, память, потоки)
 import time        # Библиотека для работы с временными метками и измерения интервалов
+from array import array  # Предвыделенные столбцы кольцевого буфера замеров
 from datetime import datetime  # Библиотека для работы с датой и временем
 import threading   # Библиотека для работы с потоками
 
+from .anomaly import AnomalyDetector  # Отклонения метрик от выученного уровня
+
 class PerformanceMonitor:
     """
     Класс для мониторинга производительности приложения.
@@ -14,32 +19,192 @@ class PerformanceMonitor:
     - Количество активных потоков
     - Время работы приложения
     - Общее состояние системы
+    - Длительность и пропускную способность фоновых операций (например, резервного копирования)
+    - Отклонения метрик от выученного базового уровня (AnomalyDetector)
+
+    Замеры выполняет фоновый поток (start()) раз в interval секунд и пишет их
+    в кольцевой буфер из предвыделенных массивов на history_size замеров.
+    Суммы для средних значений обновляются при каждой записи, поэтому
+    get_metrics(), check_health() и get_average_metrics() только читают
+    готовые значения и не обращаются к системе.
+
+    Args:
+        interval (float): Интервал замеров фонового потока в секундах
+        history_size (int): Количество хранимых замеров
+        detector (AnomalyDetector, optional): Детектор отклонений; по умолчанию - с настройками по умолчанию
     """
-    
-    def __init__(self):
+
+    def __init__(self, interval=5.0, history_size=1000, detector=None):
         """
         Инициализация системы мониторинга производительности.
         
         Настраивает:
         - Время начала мониторинга
-        - Хранилище истории метрик
+        - Кольцевой буфер истории метрик
         - Отслеживание текущего процесса
         - Пороговые значения для метрик
         """
+        if history_size < 1:
+            raise ValueError("Размер истории метрик должен быть положительным")
         self.start_time = time.time()  # Сохранение времени запуска для расчета uptime
-        self.metrics_history = []      # Список для хранения истории метрик
         self.process = psutil.Process()  # Получение объекта текущего процесса
+        # Объем памяти системы не меняется: процент памяти считается без запроса к системе
+        self._total_memory = psutil.virtual_memory().total
+        self.interval = interval
+        self.history_size = history_size
+
+        # Кольцевой буфер: столбцы замеров, позиция следующей записи и количество замеров
+        self._timestamps = array('d', bytes(8 * history_size))
+        self._cpu = array('d', bytes(8 * history_size))
+        self._memory = array('d', bytes(8 * history_size))
+        self._threads = array('I', bytes(array('I').itemsize * history_size))
+        self._next = 0
+        self._size = 0
+        # Суммы значений в буфере для средних (обновляются при записи)
+        self._sums = [0.0, 0.0, 0]
+        self._history_lock = threading.Lock()  # Запись из фонового потока, чтение из интерфейса
+
+        self._thread = None
+        self._stop_event = threading.Event()
         
-        # Пороговые значения для определения проблем с производительностью
+        # Базовые уровни метрик процесса (и метрик API, которые передает Analytics)
+        self.detector = detector or AnomalyDetector()
+
+        # Фиксированные пороги: действуют, пока базовый уровень метрики не выучен
         self.thresholds = {
             'cpu_percent': 80.0,    # Максимально допустимый процент использования CPU
             'memory_percent': 75.0,  # Максимально допустимый процент использования памяти
             'thread_count': 50      # Максимально допустимое количество потоков
         }
 
+        # Статистика фоновых операций: имя операции -> счетчики
+        self.operations = {}
+        self._operations_lock = threading.Lock()  # Операции выполняются в фоновых потоках
+
+        # Дополнительные проверки состояния: функции, возвращающие список предупреждений
+        self.health_checks = []
+
+    @classmethod
+    def from_env(cls):
+        """
+        Создание монитора из переменных окружения.
+
+        Использует MONITOR_INTERVAL_SECONDS, MONITOR_HISTORY_SIZE и
+        настройки детектора отклонений (AnomalyDetector.from_env).
+
+        Returns:
+            PerformanceMonitor: Монитор (замеры раз в 5 секунд, 1000 замеров по умолчанию)
+        """
+        interval = os.getenv("MONITOR_INTERVAL_SECONDS")
+        history_size = os.getenv("MONITOR_HISTORY_SIZE")
+        return cls(
+            interval=float(interval) if interval else 5.0,
+            history_size=int(history_size) if history_size else 1000,
+            detector=AnomalyDetector.from_env()
+        )
+
+    def sample(self) -> dict:
+        """
+        Замер метрик процесса и запись в кольцевой буфер.
+
+        Вызывается фоновым потоком; без запущенного потока - при первом
+        обращении к get_metrics().
+
+        Returns:
+            dict: Замер (см. get_metrics) или словарь с ключом 'error'
+        """
+        try:
+            # oneshot: данные процесса читаются из системы один раз для всех метрик;
+            # num_threads() не перечисляет потоки, в отличие от threads()
+            with self.process.oneshot():
+                cpu_percent = self.process.cpu_percent()
+                memory_percent = self.process.memory_info().rss * 100.0 / self._total_memory
+                thread_count = self.process.num_threads()
+        except Exception as e:
+            # Возврат информации об ошибке при сборе метрик
+            return {
+                'error': str(e),
+                'timestamp': datetime.now()
+            }
+
+        # Обновление базовых уровней; отклонение проверяется в check_health
+        for metric, value in (('cpu_percent', cpu_percent), ('memory_percent', memory_percent),
+                              ('thread_count', thread_count)):
+            self.detector.observe(metric, value)
+
+        timestamp = time.time()
+        with self._history_lock:
+            i = self._next
+            if self._size == self.history_size:
+                # Вытесняемый замер вычитается из сумм
+                self._sums[0] -= self._cpu[i]
+                self._sums[1] -= self._memory[i]
+                self._sums[2] -= self._threads[i]
+            else:
+                self._size += 1
+            self._timestamps[i] = timestamp
+            self._cpu[i] = cpu_percent
+            self._memory[i] = memory_percent
+            self._threads[i] = thread_count
+            self._sums[0] += cpu_percent
+            self._sums[1] += memory_percent
+            self._sums[2] += thread_count
+            self._next = (i + 1) % self.history_size
+            if self._next == 0:
+                # Раз за оборот буфера суммы пересчитываются, чтобы не накапливалась ошибка округления
+                self._sums = [sum(self._cpu), sum(self._memory), sum(self._threads)]
+            return self._row(i)
+
+    def _row(self, i) -> dict:
+        """Замер из позиции i буфера в виде словаря"""
+        return {
+            'timestamp': datetime.fromtimestamp(self._timestamps[i]),
+            'cpu_percent': self._cpu[i],
+            'memory_percent': self._memory[i],
+            'thread_count': self._threads[i],
+            'uptime': self._timestamps[i] - self.start_time
+        }
+
+    @property
+    def metrics_history(self) -> list:
+        """
+        История замеров от старых к новым.
+
+        Returns:
+            list: Словари замеров (создаются при обращении)
+        """
+        with self._history_lock:
+            first = (self._next - self._size) % self.history_size
+            return [self._row((first + k) % self.history_size) for k in range(self._size)]
+
+    def _run(self):
+        """Цикл фонового потока: замер раз в interval секунд"""
+        while True:
+            self.sample()
+            if self._stop_event.wait(self.interval):
+                break
+
+    def start(self):
+        """Запуск фоновых замеров"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="PerformanceMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка фоновых замеров"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
     def get_metrics(self) -> dict:
         """
-        Получение текущих метрик производительности.
+        Получение последних метрик производительности.
+
+        Возвращает последний замер фонового потока; замер выполняется
+        на месте, только если в буфере еще нет ни одного замера.
         
         Returns:
             dict: Словарь с текущими метриками:
@@ -52,46 +217,34 @@ class PerformanceMonitor:
         Note:
             В случае ошибки возвращает словарь с ключом 'error'
         """
-        try:
-            # Сбор текущих метрик производительности
-            metrics = {
-                'timestamp': datetime.now(),              # Время замера
-                'cpu_percent': self.process.cpu_percent(),    # Загрузка CPU
-                'memory_percent': self.process.memory_percent(),  # Использование памяти
-                'thread_count': len(self.process.threads()),  # Количество потоков
-                'uptime': time.time() - self.start_time      # Время работы
-            }
-            
-            # Сохранение метрик в историю
-            self.metrics_history.append(metrics)
-            
-            # Ограничение размера истории последними 1000 записями
-            if len(self.metrics_history) > 1000:
-                self.metrics_history.pop(0)  # Удаление самой старой записи
-                
-            return metrics
-            
-        except Exception as e:
-            # Возврат информации об ошибке при сборе метрик
-            return {
-                'error': str(e),
-                'timestamp': datetime.now()
-            }
+        with self._history_lock:
+            if self._size:
+                return self._row((self._next - 1) % self.history_size)
+        return self.sample()
 
-    def check_health(self) -> dict:
+    def check_health(self, metrics: dict = None) -> dict:
         """
-        Проверка состояния системы на основе пороговых значений.
+        Проверка состояния системы по базовым уровням метрик.
         
-        Анализирует текущие метрики и сравнивает их с пороговыми значениями
-        для определения потенциальных проблем с производительностью.
+        Метрики, отклонившиеся от выученного уровня (AnomalyDetector), дают
+        предупреждения; пока уровень метрики не выучен, она сравнивается
+        с фиксированным порогом из thresholds. Повторные предупреждения об
+        отклонении одной метрики, как и повторы остальных предупреждений
+        (порогов и дополнительных проверок), попадают в alerts не чаще раза
+        в cooldown детектора.
+
+        Args:
+            metrics (dict, optional): Проверяемый замер. По умолчанию - последний замер
         
         Returns:
             dict: Словарь с информацией о состоянии системы:
                 - status: 'healthy', 'warning' или 'error'
                 - warnings: список предупреждений (если есть)
+                - alerts: предупреждения для оповещения (без повторов в пределах cooldown)
                 - timestamp: время проверки
         """
-        metrics = self.get_metrics()  # Получение текущих метрик
+        if metrics is None:
+            metrics = self.get_metrics()  # Получение текущих метрик
         
         # Проверка на наличие ошибок при сборе метрик
         if 'error' in metrics:
@@ -101,57 +254,158 @@ class PerformanceMonitor:
         health_status = {
             'status': 'healthy',     # Начальный статус - здоровый
             'warnings': [],          # Список для хранения предупреждений
+            'alerts': [],            # Предупреждения с ограничением частоты повторов
             'timestamp': metrics['timestamp']  # Время проверки
         }
         
-        # Проверка загрузки CPU
-        if metrics['cpu_percent'] > self.thresholds['cpu_percent']:
+        # Проверка загрузки CPU (фиксированный порог - пока уровень не выучен)
+        if not self.detector.is_learned('cpu_percent') and metrics['cpu_percent'] > self.thresholds['cpu_percent']:
             health_status['warnings'].append(
                 f"High CPU usage: {metrics['cpu_percent']}%"
             )
             health_status['status'] = 'warning'
             
         # Проверка использования памяти    
-        if metrics['memory_percent'] > self.thresholds['memory_percent']:
+        if not self.detector.is_learned('memory_percent') and metrics['memory_percent'] > self.thresholds['memory_percent']:
             health_status['warnings'].append(
                 f"High memory usage: {metrics['memory_percent']}%"
             )
             health_status['status'] = 'warning'
             
         # Проверка количества потоков    
-        if metrics['thread_count'] > self.thresholds['thread_count']:
+        if not self.detector.is_learned('thread_count') and metrics['thread_count'] > self.thresholds['thread_count']:
             health_status['warnings'].append(
                 f"High thread count: {metrics['thread_count']}"
             )
             health_status['status'] = 'warning'
+
+        # Дополнительные проверки (например, рост памяти в режиме диагностики)
+        for check in self.health_checks:
+            warnings = check()
+            if warnings:
+                health_status['warnings'].extend(warnings)
+                health_status['status'] = 'warning'
+
+        # Повтор того же предупреждения (с другими числами) оповещает не чаще раза в cooldown детектора
+        for warning in health_status['warnings']:
+            if self.detector.should_alert('warning:' + re.sub(r'\d+(\.\d+)?', '#', warning)):
+                health_status['alerts'].append(warning)
+
+        # Отклонения от базовых уровней (метрики процесса и API)
+        for anomaly in self.detector.get_anomalies():
+            warning = (
+                f"{anomaly['metric']} {anomaly['value']:.3g} above baseline "
+                f"{anomaly['mean']:.3g} ± {anomaly['std']:.2g} (z={anomaly['z']:.1f})"
+            )
+            health_status['warnings'].append(warning)
+            if self.detector.should_alert(anomaly['metric']):
+                health_status['alerts'].append(warning)
+            health_status['status'] = 'warning'
             
         return health_status
 
+    def add_health_check(self, check) -> None:
+        """
+        Добавление проверки к check_health.
+
+        Args:
+            check (callable): Функция без аргументов, возвращающая список предупреждений
+        """
+        self.health_checks.append(check)
+
     def get_average_metrics(self) -> dict:
         """
-        Расчет средних показателей за всю историю наблюдений.
+        Средние показатели по замерам в буфере.
         
         Вычисляет средние значения для:
         - Использования CPU
         - Использования памяти
         - Количества потоков
+
+        Суммы поддерживаются при записи замеров, поэтому расчет не зависит
+        от размера истории.
         
         Returns:
             dict: Словарь со средними значениями метрик или сообщением об ошибке
         """
+        with self._history_lock:
+            count = self._size
+            cpu_sum, memory_sum, threads_sum = self._sums
+
         # Проверка наличия данных для анализа
-        if not self.metrics_history:
+        if not count:
             return {"error": "No metrics available"}
             
-        # Расчет средних значений по всей истории метрик
-        avg_metrics = {
-            'avg_cpu': sum(m['cpu_percent'] for m in self.metrics_history) / len(self.metrics_history),
-            'avg_memory': sum(m['memory_percent'] for m in self.metrics_history) / len(self.metrics_history),
-            'avg_threads': sum(m['thread_count'] for m in self.metrics_history) / len(self.metrics_history),
-            'samples_count': len(self.metrics_history)  # Количество проанализированных замеров
+        return {
+            'avg_cpu': cpu_sum / count,
+            'avg_memory': memory_sum / count,
+            'avg_threads': threads_sum / count,
+            'samples_count': count  # Количество проанализированных замеров
         }
-        
-        return avg_metrics
+
+    def register_metrics(self, registry):
+        """
+        Публикация метрик процесса (по последнему замеру) и фоновых операций.
+
+        Args:
+            registry (MetricsRegistry): Реестр метрик
+        """
+        def latest(key, scale=1):
+            return lambda: self.get_metrics().get(key, float('nan')) * scale
+
+        def operations(key):
+            return lambda: {(name,): stats[key] for name, stats in self.get_operation_stats().items()}
+
+        registry.gauge('process_cpu_percent', 'Загрузка CPU процессом, %', callback=latest('cpu_percent'))
+        registry.gauge('process_resident_memory_bytes', 'Резидентная память процесса',
+                       callback=latest('memory_percent', self._total_memory / 100))
+        registry.gauge('process_threads', 'Количество потоков процесса', callback=latest('thread_count'))
+        registry.gauge('process_uptime_seconds', 'Время работы приложения', callback=latest('uptime'))
+        registry.counter('app_background_operations', 'Выполнения фоновых операций', ('operation',),
+                         callback=operations('count'))
+        registry.counter('app_background_operation_failures', 'Неудачные выполнения фоновых операций',
+                         ('operation',), callback=operations('failures'))
+
+    def record_operation(self, name: str, duration: float, size_bytes: int = None, ok: bool = True) -> None:
+        """
+        Учет выполнения фоновой операции.
+
+        Args:
+            name (str): Имя операции (например, 'backup')
+            duration (float): Длительность в секундах
+            size_bytes (int, optional): Объем обработанных данных в байтах
+            ok (bool): Успешно ли завершилась операция
+        """
+        with self._operations_lock:
+            stats = self.operations.setdefault(name, {
+                'count': 0,            # Количество выполнений
+                'failures': 0,         # Количество неудачных выполнений
+                'total_duration': 0.0, # Суммарная длительность
+                'total_bytes': 0,      # Суммарный объем данных
+                'last_duration': None, # Длительность последнего выполнения
+                'last_throughput': None,  # Пропускная способность последнего выполнения (байт/с)
+                'last_timestamp': None    # Время последнего выполнения
+            })
+            stats['count'] += 1
+            if not ok:
+                stats['failures'] += 1
+            stats['total_duration'] += duration
+            stats['last_duration'] = duration
+            stats['last_timestamp'] = datetime.now()
+            if size_bytes is not None:
+                stats['total_bytes'] += size_bytes
+                stats['last_throughput'] = size_bytes / duration if duration > 0 else None
+
+    def get_operation_stats(self) -> dict:
+        """
+        Получение статистики фоновых операций.
+
+        Returns:
+            dict: Имя операции -> счетчики (count, failures, total_duration,
+                  total_bytes, last_duration, last_throughput, last_timestamp)
+        """
+        with self._operations_lock:
+            return {name: dict(stats) for name, stats in self.operations.items()}
 
     def log_metrics(self, logger) -> None:
         """
@@ -159,13 +413,13 @@ class PerformanceMonitor:
         
         Записывает в лог:
         - Текущие значения метрик производительности
-        - Предупреждения о превышении пороговых значений
+        - Предупреждения о превышении порогов и отклонениях (с ограничением частоты)
         
         Args:
             logger: Объект логгера для записи информации
         """
-        metrics = self.get_metrics()   # Получение текущих метрик
-        health = self.check_health()   # Проверка состояния системы
+        metrics = self.get_metrics()        # Последний замер фонового потока
+        health = self.check_health(metrics)  # Проверка состояния по тому же замеру
         
         # Логирование текущих метрик производительности
         if 'error' not in metrics:
@@ -179,5 +433,5 @@ class PerformanceMonitor:
             
         # Логирование предупреждений при проблемах с производительностью
         if health['status'] == 'warning':
-            for warning in health['warnings']:
+            for warning in health['alerts']:
                 logger.warning(f"Performance warning: {warning}")
@@ -0,0 +1,225 @@
+# Импорт необходимых библиотек
+import os          # Библиотека для работы с файлами
+import sys         # Снимки стеков всех потоков
+import threading   # Поток профилировщика
+import zlib        # Стабильный цвет блока по имени функции
+from datetime import datetime  # Метка времени в именах файлов профиля
+from html import escape  # Экранирование имен функций в SVG
+
+
+class SamplingProfiler:
+    """
+    Выборочный профилировщик всех потоков приложения.
+
+    Фоновый поток раз в interval секунд снимает стеки всех потоков
+    (sys._current_frames) - интерфейса, пула потоков с запросами к API,
+    фоновых задач - и считает одинаковые стеки. Профилируемый код не
+    изменяется и не замедляется трассировкой вызовов; затраты - один
+    снимок стеков на интервал.
+
+    Результат записывается в директорию directory в двух видах:
+    свернутые стеки (profile-*.folded, формат flamegraph.pl / speedscope)
+    и готовый flame graph (profile-*.svg).
+
+    Args:
+        interval (float): Интервал снимков в секундах
+        directory (str): Директория для файлов профиля
+    """
+
+    # Префикс имен потоков профилировщика (их стеки не учитываются)
+    THREAD_PREFIX = "SamplingProfiler"
+
+    def __init__(self, interval=0.005, directory="logs"):
+        if interval <= 0:
+            raise ValueError("Интервал снимков профилировщика должен быть положительным")
+        self.interval = interval
+        self.directory = directory
+        self.stacks = {}     # Стек (кортеж кадров от корня) -> количество снимков
+        self.samples = 0
+        self._labels = {}    # Объект кода -> подпись кадра (кэш форматирования)
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def is_running(self):
+        """Выполняется ли сбор профиля"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _label(self, code):
+        """Подпись кадра: функция (файл:строка начала функции)"""
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self):
+        """Снимок стеков всех потоков, кроме потоков профилировщика"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if names.get(ident, '').startswith(self.THREAD_PREFIX):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            # Корень стека - имя потока, чтобы потоки различались на графике
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stack.reverse()
+            key = tuple(stack)
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def _run(self):
+        """Цикл фонового потока: снимок стеков раз в interval секунд"""
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        """Запуск сбора профиля (накопленные стеки сбрасываются)"""
+        if self.is_running:
+            raise ValueError("Профилировщик уже запущен")
+        self.stacks = {}
+        self.samples = 0
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Остановка сбора и запись файлов профиля.
+
+        Returns:
+            dict: 'folded' и 'svg' - пути к файлам, 'samples' - количество снимков
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        return self.save()
+
+    def capture(self, duration):
+        """
+        Сбор профиля в течение duration секунд (блокирует вызывающий поток).
+
+        Returns:
+            dict: Результат stop()
+        """
+        self.start()
+        self._stop_event.wait(duration)
+        return self.stop()
+
+    def capture_in_background(self, duration, on_done=None):
+        """
+        Сбор профиля в отдельном потоке.
+
+        Args:
+            duration (float): Длительность в секундах
+            on_done (callable, optional): Вызывается с результатом stop() или исключением
+        """
+        def run():
+            try:
+                result = self.capture(duration)
+            except Exception as e:
+                result = e
+            if on_done:
+                on_done(result)
+
+        threading.Thread(target=run, name="SamplingProfilerCapture", daemon=True).start()
+
+    def save(self):
+        """
+        Запись свернутых стеков и flame graph в directory.
+
+        Returns:
+            dict: 'folded' и 'svg' - пути к файлам, 'samples' - количество снимков
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}")
+        folded_path, svg_path = base + ".folded", base + ".svg"
+
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                # Разделитель кадров ';' не должен встречаться в подписях
+                f.write(';'.join(frame.replace(';', ',') for frame in stack))
+                f.write(f" {count}\n")
+        with open(svg_path, 'w', encoding='utf-8') as f:
+            title = f"Профиль {datetime.now():%Y-%m-%d %H:%M:%S}, снимков: {self.samples}, интервал {self.interval * 1000:g} мс"
+            f.write(render_flamegraph(self.stacks, title))
+        return {'folded': folded_path, 'svg': svg_path, 'samples': self.samples}
+
+
+def render_flamegraph(stacks, title="Flame graph", width=1200, row_height=16, min_width=0.3):
+    """
+    Построение flame graph в формате SVG.
+
+    Ширина блока пропорциональна количеству снимков, в которых функция
+    была в стеке; дочерние блоки (вызванные функции) расположены выше.
+    Подсказка блока показывает функцию, количество снимков и долю.
+
+    Args:
+        stacks (dict): Стек (кортеж кадров от корня) -> количество снимков
+        title (str): Заголовок графика
+        width (int): Ширина изображения в пикселях
+        row_height (int): Высота строки в пикселях
+        min_width (float): Блоки уже этой ширины (в пикселях) не выводятся
+
+    Returns:
+        str: Документ SVG
+    """
+    # Дерево вызовов: узел - [количество, дети]
+    root = [0, {}]
+    for stack, count in stacks.items():
+        root[0] += count
+        node = root
+        for frame in stack:
+            node = node[1].setdefault(frame, [0, {}])
+            node[0] += count
+
+    total = root[0] or 1
+    scale = (width - 20) / total
+    blocks = []
+    depth_max = 0
+    # Обход в глубину: (имя, узел, глубина, левая граница в снимках)
+    pending = []
+    x = 0
+    for name, child in sorted(root[1].items()):
+        pending.append((name, child, 0, x))
+        x += child[0]
+    while pending:
+        name, node, depth, left = pending.pop()
+        if node[0] * scale < min_width:
+            continue
+        blocks.append((name, node[0], depth, left))
+        depth_max = max(depth_max, depth)
+        x = left
+        for child_name, child in sorted(node[1].items()):
+            pending.append((child_name, child, depth + 1, x))
+            x += child[0]
+
+    height = (depth_max + 1) * row_height + 50
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="monospace" font-size="11">',
+        '<rect width="100%" height="100%" fill="#f8f8f8"/>',
+        f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="14">{escape(title)}</text>',
+    ]
+    for name, count, depth, left in blocks:
+        x = 10 + left * scale
+        y = height - 10 - (depth + 1) * row_height
+        block_width = count * scale
+        # Теплый цвет, стабильный для одной и той же функции
+        hue = zlib.crc32(name.encode('utf-8'))
+        color = f"rgb({205 + hue % 50},{80 + (hue >> 8) % 120},{(hue >> 16) % 60})"
+        tooltip = f"{name}: {count} ({count * 100 / total:.1f}%)"
+        lines.append(
+            f'<g><title>{escape(tooltip)}</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{block_width:.1f}" height="{row_height - 1}" fill="{color}" rx="2"/>'
+        )
+        # Подпись помещается, если блок шире нескольких символов (около 7 пикселей на символ)
+        chars = int((block_width - 6) / 7)
+        if chars >= 3:
+            label = name if len(name) <= chars else name[:chars - 2] + '..'
+            lines.append(f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{escape(label)}</text>')
+        lines.append('</g>')
+    lines.append('</svg>')
+    return '\n'.join(lines) + '\n'
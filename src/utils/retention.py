@@ -0,0 +1,236 @@
+# Импорт необходимых библиотек
+import os          # Библиотека для работы с файлами и переменными окружения
+import gzip        # Библиотека для сжатия архивных сегментов
+import json        # Библиотека для работы с JSON форматом (NDJSON сегменты)
+import stat        # Константы прав доступа к файлам
+import time        # Библиотека для работы с временными метками
+from datetime import datetime, timedelta  # Библиотека для работы с датой и временем
+
+
+class RetentionPolicy:
+    """
+    Политика хранения "горячих" сообщений в основной базе.
+
+    Сообщения, не попадающие под политику, переносятся в архив.
+    Ограничения можно комбинировать: сообщение становится "холодным",
+    если нарушено хотя бы одно из них.
+
+    Args:
+        max_age_days (int, optional): Максимальный возраст сообщения в днях
+        max_rows (int, optional): Максимальное количество сообщений в одной группе
+        scope (str): Группировка для max_rows: 'conversation' (беседа) или 'model' (модель)
+    """
+
+    # Допустимые варианты группировки для ограничения по количеству
+    SCOPES = ('conversation', 'model')
+
+    def __init__(self, max_age_days=None, max_rows=None, scope='conversation'):
+        if scope not in self.SCOPES:
+            raise ValueError(f"Неизвестная группировка политики хранения: {scope}")
+        self.max_age_days = max_age_days
+        self.max_rows = max_rows
+        self.scope = scope
+
+    @classmethod
+    def from_env(cls):
+        """
+        Создание политики из переменных окружения.
+
+        Использует RETENTION_MAX_AGE_DAYS, RETENTION_MAX_ROWS и RETENTION_SCOPE.
+
+        Returns:
+            RetentionPolicy: Политика хранения (без ограничений, если переменные не заданы)
+        """
+        max_age_days = os.getenv("RETENTION_MAX_AGE_DAYS")
+        max_rows = os.getenv("RETENTION_MAX_ROWS")
+        return cls(
+            max_age_days=int(max_age_days) if max_age_days else None,
+            max_rows=int(max_rows) if max_rows else None,
+            scope=os.getenv("RETENTION_SCOPE") or 'conversation'
+        )
+
+    @property
+    def is_enabled(self) -> bool:
+        """Задано ли хотя бы одно ограничение"""
+        return self.max_age_days is not None or self.max_rows is not None
+
+    def cutoff(self):
+        """
+        Граница возраста: сообщения старше нее считаются "холодными".
+
+        Returns:
+            datetime: Время отсечения или None, если ограничения по возрасту нет
+        """
+        if self.max_age_days is None:
+            return None
+        return datetime.now() - timedelta(days=self.max_age_days)
+
+
+class ArchiveStore:
+    """
+    Хранилище архивных сегментов сообщений.
+
+    Каждый сегмент - сжатый gzip файл в формате NDJSON (одна JSON запись на строку).
+    Сегменты только добавляются: после записи файл закрывается на запись
+    и больше не изменяется. Поиск выполняется потоковым чтением сегментов
+    без загрузки их целиком в память.
+
+    Args:
+        directory (str): Директория для хранения сегментов
+    """
+
+    # Шаблон имени файла сегмента
+    SEGMENT_TEMPLATE = "segment_{:06d}.ndjson.gz"
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _next_segment_path(self):
+        """Путь для следующего сегмента (номер на единицу больше максимального)"""
+        numbers = [
+            int(name.split('_')[1].split('.')[0])
+            for name in os.listdir(self.directory)
+            if name.startswith('segment_') and name.endswith('.ndjson.gz')
+        ]
+        return os.path.join(self.directory, self.SEGMENT_TEMPLATE.format(max(numbers, default=0) + 1))
+
+    def write_segment(self, records):
+        """
+        Запись нового сегмента.
+
+        Данные сначала пишутся во временный файл, сбрасываются на диск
+        и только затем атомарно переименовываются - частично записанный
+        сегмент никогда не появится под своим именем.
+
+        Args:
+            records (list): Список словарей с данными сообщений
+
+        Returns:
+            str: Путь к записанному сегменту
+        """
+        path = self._next_segment_path()
+        tmp_path = path + '.tmp'
+
+        with open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str).encode('utf-8'))
+                    f.write(b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        os.replace(tmp_path, path)
+        # Сегмент доступен только для чтения
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        return path
+
+    def read_segment(self, path):
+        """
+        Потоковое чтение записей сегмента.
+
+        Args:
+            path (str): Путь к сегменту
+
+        Yields:
+            dict: Запись сообщения
+        """
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def remove_segment(self, path):
+        """
+        Удаление сегмента (используется только для отката незавершенной архивации).
+
+        Args:
+            path (str): Путь к сегменту
+        """
+        if os.path.exists(path):
+            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+            os.remove(path)
+
+    def search(self, query, paths, conversation_id=None, model=None, limit=100):
+        """
+        Поиск по архивным сегментам.
+
+        Args:
+            query (str): Подстрока для поиска в тексте сообщения или ответа (без учета регистра)
+            paths (list): Пути сегментов, в которых выполняется поиск
+            conversation_id (int, optional): Ограничение поиска беседой
+            model (str, optional): Ограничение поиска моделью
+            limit (int): Максимальное количество результатов
+
+        Returns:
+            list: Найденные записи сообщений
+        """
+        query = (query or '').lower()
+        results = []
+        for path in paths:
+            for record in self.read_segment(path):
+                if conversation_id is not None and record.get('conversation_id') != conversation_id:
+                    continue
+                if model is not None and record.get('model') != model:
+                    continue
+                text = f"{record.get('user_message') or ''}\n{record.get('ai_response') or ''}".lower()
+                if query in text:
+                    results.append(record)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+
+class RetentionManager:
+    """
+    Фоновое обслуживание базы в периоды простоя приложения.
+
+    Выполняет по очереди небольшие шаги:
+    - перенос "холодных" сообщений в архив (не чаще заданного интервала)
+    - слияние журнала записи с базой (ChatCache.compact_log)
+    - инкрементальную очистку освобожденных страниц (PRAGMA incremental_vacuum)
+
+    Каждый шаг короткий, поэтому его можно выполнять между действиями пользователя.
+
+    Args:
+        cache (ChatCache): Экземпляр класса кэширования
+        policy (RetentionPolicy): Политика хранения
+        retention_interval (float): Минимальный интервал между архивациями в секундах
+        vacuum_pages (int): Количество страниц, освобождаемых за один шаг
+    """
+
+    def __init__(self, cache, policy, retention_interval=3600, vacuum_pages=64):
+        self.cache = cache
+        self.policy = policy
+        self.retention_interval = retention_interval
+        self.vacuum_pages = vacuum_pages
+        self.last_retention = 0.0
+
+    def run_idle_step(self) -> dict:
+        """
+        Выполнение одного шага обслуживания.
+
+        Returns:
+            dict: Описание выполненной работы:
+                - action: 'retention', 'compact', 'vacuum' или 'idle'
+                - остальные ключи зависят от действия
+        """
+        # Архивация выполняется не чаще retention_interval
+        if self.policy.is_enabled and time.time() - self.last_retention >= self.retention_interval:
+            self.last_retention = time.time()
+            result = self.cache.apply_retention(self.policy)
+            if result['archived_rows']:
+                return {'action': 'retention', **result}
+
+        # Слияние журнала записи с базой (для хранилища с журналом)
+        merged = self.cache.compact_log()
+        if merged:
+            return {'action': 'compact', 'merged_pages': merged}
+
+        # Небольшой шаг возврата свободных страниц
+        freelist = self.cache.get_freelist_count()
+        if freelist:
+            remaining = self.cache.incremental_vacuum(self.vacuum_pages)
+            return {'action': 'vacuum', 'freed_pages': freelist - remaining, 'remaining_pages': remaining}
+
+        return {'action': 'idle'}
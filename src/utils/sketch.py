@@ -0,0 +1,213 @@
+# Импорт необходимых библиотек
+import math        # Логарифмы для номеров корзин
+import struct      # Заголовок сериализованного скетча
+
+
+def _write_varint(out, value):
+    """Запись неотрицательного целого в формате varint (7 бит на байт)"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    """Чтение varint; возвращает (значение, новая позиция)"""
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    """Отображение знаковых целых в неотрицательные для varint"""
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+class LatencySketch:
+    """
+    Скетч распределения времени ответа для оценки квантилей (p50/p95/p99).
+
+    Значения раскладываются по логарифмическим корзинам (как в DDSketch):
+    корзина i содержит значения из (gamma^(i-1), gamma^i], поэтому оценка любого
+    квантиля отличается от точного значения не более чем на relative_accuracy.
+    Добавление значения - O(1), размер скетча зависит от разброса значений,
+    а не от их количества. Скетчи с одинаковой точностью объединяются сложением
+    счетчиков, поэтому скетчи интервалов, моделей и разных установок можно
+    сводить в один.
+
+    Args:
+        relative_accuracy (float): Допустимая относительная ошибка квантилей
+    """
+
+    # Формат заголовка: версия, точность, количество значений, min, max, нули
+    HEADER = struct.Struct('<BdQddQ')
+    VERSION = 1
+    # Значения меньше этого порога (в секундах) считаются нулевыми
+    MIN_VALUE = 1e-6
+
+    def __init__(self, relative_accuracy=0.01):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("Точность скетча должна быть в интервале (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}        # Номер корзины -> количество значений
+        self.zero_count = 0   # Значения меньше MIN_VALUE
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, count=1):
+        """
+        Добавление значения.
+
+        Args:
+            value (float): Время ответа в секундах (неотрицательное)
+            count (int): Сколько раз добавить значение
+        """
+        if value < self.MIN_VALUE:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """
+        Добавление значений другого скетча.
+
+        Args:
+            other (LatencySketch): Скетч с той же точностью
+
+        Raises:
+            ValueError: Если точность скетчей различается
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Объединять можно только скетчи с одинаковой точностью")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """
+        Оценка квантиля.
+
+        Args:
+            q (float): Уровень квантиля от 0 до 1 (0.95 - p95)
+
+        Returns:
+            float: Оценка квантиля или None для пустого скетча
+        """
+        if not self.count:
+            return None
+        if not 0 <= q <= 1:
+            raise ValueError("Уровень квантиля должен быть от 0 до 1")
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return self.min
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Середина корзины в логарифмической шкале дает ошибку не больше relative_accuracy
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def rank(self, value):
+        """
+        Оценка количества значений, не превышающих value.
+
+        Корзина учитывается целиком, если ее верхняя граница не больше value,
+        поэтому погрешность границы - не больше relative_accuracy.
+
+        Args:
+            value (float): Граница
+
+        Returns:
+            int: Количество значений
+        """
+        if value < self.MIN_VALUE:
+            return self.zero_count if value >= 0 else 0
+        limit = math.floor(math.log(value) / self._log_gamma + 1e-9)
+        return self.zero_count + sum(count for index, count in self.bins.items() if index <= limit)
+
+    def to_bytes(self):
+        """
+        Компактная сериализация: заголовок и пары (шаг номера корзины, счетчик) в varint.
+
+        Returns:
+            bytes: Сериализованный скетч
+        """
+        out = bytearray(self.HEADER.pack(
+            self.VERSION, self.relative_accuracy, self.count,
+            self.min if self.count else 0.0, self.max if self.count else 0.0, self.zero_count
+        ))
+        _write_varint(out, len(self.bins))
+        previous = 0
+        for index in sorted(self.bins):
+            _write_varint(out, _zigzag(index - previous))
+            _write_varint(out, self.bins[index])
+            previous = index
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Восстановление скетча из to_bytes().
+
+        Raises:
+            ValueError: Если формат данных не поддерживается
+        """
+        version, accuracy, count, minimum, maximum, zero_count = cls.HEADER.unpack_from(data)
+        if version != cls.VERSION:
+            raise ValueError(f"Неподдерживаемая версия скетча: {version}")
+        sketch = cls(accuracy)
+        sketch.count = count
+        sketch.zero_count = zero_count
+        if count:
+            sketch.min, sketch.max = minimum, maximum
+
+        pos = cls.HEADER.size
+        size, pos = _read_varint(data, pos)
+        index = 0
+        for _ in range(size):
+            delta, pos = _read_varint(data, pos)
+            bin_count, pos = _read_varint(data, pos)
+            index += _unzigzag(delta)
+            sketch.bins[index] = bin_count
+        return sketch
+
+    @classmethod
+    def merge_all(cls, sketches, relative_accuracy=0.01):
+        """
+        Объединение нескольких скетчей (например, присланных с разных установок).
+
+        Args:
+            sketches: Итерируемый набор LatencySketch или сериализованных скетчей (bytes)
+
+        Returns:
+            LatencySketch: Объединенный скетч
+        """
+        result = cls(relative_accuracy)
+        for sketch in sketches:
+            if isinstance(sketch, (bytes, bytearray, memoryview)):
+                sketch = cls.from_bytes(bytes(sketch))
+            result.merge(sketch)
+        return result
@@ -0,0 +1,228 @@
+# Импорт необходимых библиотек
+import itertools   # Уникальные имена баз в памяти
+import os          # Библиотека для работы с файлами и переменными окружения
+import sqlite3     # Библиотека для работы с SQLite базой данных
+import sys         # Определение расположения собранного приложения
+import tempfile    # Директория архива для базы в памяти
+import time        # Замер длительности фиксации транзакций
+
+
+def default_db_path():
+    """
+    Абсолютный путь к базе по умолчанию.
+
+    База хранится в корне проекта (рядом с директорией src), а в собранном
+    приложении - рядом с исполняемым файлом, поэтому путь не зависит от
+    текущей рабочей директории.
+
+    Returns:
+        str: Абсолютный путь к chat_cache.db
+    """
+    if getattr(sys, 'frozen', False):
+        base = os.path.dirname(sys.executable)
+    else:
+        base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(base, 'chat_cache.db')
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Соединение, учитывающее длительность фиксации транзакций.
+
+    Если задана гистограмма commit_latency (utils.metrics.Histogram),
+    длительность каждого commit() записывается в нее.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commit_latency = None
+
+    def commit(self):
+        if self.commit_latency is None:
+            return super().commit()
+        started = time.perf_counter()
+        super().commit()
+        self.commit_latency.observe(time.perf_counter() - started)
+
+
+class StorageBackend:
+    """
+    Базовый класс хранилища ChatCache.
+
+    Хранилище определяет, где находится база и как открываются соединения
+    с ней; схема и запросы ChatCache одинаковы для всех хранилищ.
+
+    Args:
+        location (str): Расположение базы (абсолютный путь или имя)
+        archive_dir (str, optional): Директория архива "холодных" сообщений.
+            По умолчанию - директория archive рядом с базой
+    """
+
+    # Имя хранилища в переменной окружения CACHE_BACKEND
+    name = None
+
+    def __init__(self, location, archive_dir=None):
+        self.location = location
+        self.archive_dir = archive_dir
+
+    @classmethod
+    def from_env(cls):
+        """
+        Создание хранилища из переменных окружения.
+
+        CACHE_BACKEND выбирает хранилище: file (по умолчанию), memory или log.
+        CACHE_DB_PATH задает путь к базе (для memory - имя базы в памяти).
+
+        Returns:
+            StorageBackend: Настроенное хранилище
+
+        Raises:
+            ValueError: Если указано неизвестное хранилище
+        """
+        name = (os.getenv("CACHE_BACKEND") or SQLiteFileBackend.name).lower()
+        backends = {backend.name: backend for backend in (SQLiteFileBackend, MemoryBackend, LogStructuredBackend)}
+        if name not in backends:
+            raise ValueError(f"Неизвестное хранилище CACHE_BACKEND={name}. Доступны: {', '.join(backends)}")
+        path = os.getenv("CACHE_DB_PATH") or None
+        return backends[name](path)
+
+    def connect(self, timeout, factory=sqlite3.Connection):
+        """
+        Открытие нового соединения с базой.
+
+        Args:
+            timeout (float): Время ожидания блокировки в секундах
+            factory: Класс соединения
+
+        Returns:
+            sqlite3.Connection: Соединение с базой
+        """
+        raise NotImplementedError
+
+    def initialize(self, conn):
+        """Настройка базы при создании таблиц (режим журнала и т.п.)"""
+        # Журнал WAL: чтение не блокируется записью, а запись - чтением
+        # (режим сохраняется в файле базы)
+        conn.execute('PRAGMA journal_mode = WAL')
+
+    def compact(self, conn):
+        """
+        Слияние накопленного журнала с основной базой.
+
+        Returns:
+            int: Количество перенесенных страниц (0 - хранилище журнал не накапливает)
+        """
+        return 0
+
+    def get_archive_dir(self):
+        """Директория архива "холодных" сообщений"""
+        if self.archive_dir:
+            return self.archive_dir
+        return os.path.join(os.path.dirname(self.location), 'archive')
+
+    def close(self):
+        """Освобождение ресурсов хранилища"""
+
+
+class SQLiteFileBackend(StorageBackend):
+    """
+    База SQLite в файле (хранилище по умолчанию).
+
+    Args:
+        path (str, optional): Путь к файлу базы. Относительный путь
+            преобразуется в абсолютный; по умолчанию - default_db_path()
+        archive_dir (str, optional): Директория архива
+    """
+
+    name = 'file'
+
+    def __init__(self, path=None, archive_dir=None):
+        super().__init__(os.path.abspath(path or default_db_path()), archive_dir)
+
+    def connect(self, timeout, factory=sqlite3.Connection):
+        # При занятой другим процессом базе запись ждет до timeout секунд вместо немедленной ошибки
+        return sqlite3.connect(self.location, timeout=timeout, factory=factory)
+
+
+class MemoryBackend(StorageBackend):
+    """
+    База SQLite в памяти с общим кэшем (для тестов и замеров производительности).
+
+    Все соединения процесса с одинаковым именем видят одну базу. База существует,
+    пока открыто служебное соединение хранилища, то есть до вызова close().
+    Общий кэш использует блокировки таблиц, поэтому хранилище рассчитано
+    на работу в одном процессе с небольшим числом потоков.
+
+    Args:
+        name (str, optional): Имя базы в памяти. По умолчанию - уникальное имя
+        archive_dir (str, optional): Директория архива. По умолчанию - временная директория
+    """
+
+    name = 'memory'
+    _counter = itertools.count(1)
+
+    def __init__(self, name=None, archive_dir=None):
+        name = name or f"chat_cache_{os.getpid()}_{next(self._counter)}"
+        super().__init__(f"file:{name}?mode=memory&cache=shared", archive_dir)
+        # Служебное соединение удерживает базу в памяти
+        self._keeper = sqlite3.connect(self.location, uri=True)
+
+    def connect(self, timeout, factory=sqlite3.Connection):
+        return sqlite3.connect(self.location, timeout=timeout, factory=factory, uri=True)
+
+    def initialize(self, conn):
+        # Журнал в памяти: WAL для базы в памяти недоступен
+        pass
+
+    def get_archive_dir(self):
+        if self.archive_dir is None:
+            self.archive_dir = tempfile.mkdtemp(prefix='chat_cache_archive_')
+        return self.archive_dir
+
+    def close(self):
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+
+
+class LogStructuredBackend(SQLiteFileBackend):
+    """
+    Файловая база, настроенная на интенсивную пакетную запись.
+
+    Изменения только дописываются в журнал WAL: автоматическое слияние журнала
+    с базой выключено, а fsync выполняется при слиянии, а не при каждой
+    транзакции (synchronous=NORMAL). Журнал переносится в базу методом
+    compact() - ChatCache.compact_log() в периоды простоя. При сбое питания
+    могут потеряться последние транзакции, но база остается согласованной.
+
+    Args:
+        path (str, optional): Путь к файлу базы
+        archive_dir (str, optional): Директория архива
+        compact_pages (int): Размер журнала (в страницах), после которого compact() выполняет слияние
+    """
+
+    name = 'log'
+
+    def __init__(self, path=None, archive_dir=None, compact_pages=4096):
+        super().__init__(path, archive_dir)
+        self.compact_pages = compact_pages
+
+    def connect(self, timeout, factory=sqlite3.Connection):
+        conn = super().connect(timeout, factory)
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA wal_autocheckpoint = 0')
+        return conn
+
+    def compact(self, conn):
+        wal_path = self.location + '-wal'
+        if not os.path.exists(wal_path):
+            return 0
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        # Кадр журнала - страница и заголовок кадра (24 байта)
+        log_pages = os.path.getsize(wal_path) // (page_size + 24)
+        if log_pages < self.compact_pages:
+            return 0
+        # TRUNCATE обнуляет файл журнала после переноса всех страниц;
+        # при активных читателях журнал переносится позже (busy = 1)
+        busy = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()[0]
+        return 0 if busy else log_pages
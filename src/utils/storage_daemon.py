@@ -0,0 +1,485 @@
+# Импорт необходимых библиотек
+import argparse    # Разбор аргументов командной строки при запуске демона
+import base64      # Передача бинарных значений в JSON
+import builtins    # Восстановление типов исключений на стороне клиента
+import inspect     # Разбор аргументов вызовов клиента
+import json        # Протокол обмена: одна JSON запись на строку
+import os          # Библиотека для работы с файлами и переменными окружения
+import queue       # Очередь операций записи
+import socket      # Unix сокет для связи с демоном
+import socketserver  # Многопоточный сервер на Unix сокете
+import threading   # Поток записи и потоки клиентов
+import time        # Ожидание операций для пакета
+from datetime import datetime  # Передача временных меток
+
+from .cache import ChatCache
+from .storage import TimedConnection
+from .metrics import MetricsRegistry, MetricsServer
+from .compression import CompressedText
+
+
+def _encode(value):
+    """Преобразование значений, которые не поддерживает JSON"""
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, CompressedText):
+        return str(value)
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode('ascii')}
+    raise TypeError(f"Значение типа {type(value).__name__} нельзя передать демону")
+
+
+def _decode(obj):
+    """Восстановление значений, закодированных _encode()"""
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def _dumps(message):
+    return (json.dumps(message, ensure_ascii=False, default=_encode) + '\n').encode('utf-8')
+
+
+def _loads(line):
+    return json.loads(line, object_hook=_decode)
+
+
+class BatchingConnection(TimedConnection):
+    """
+    Соединение потока записи демона.
+
+    Пока открыт пакет (in_batch), commit() методов ChatCache откладывается
+    до конца пакета, а rollback() откатывает только текущую операцию
+    (до точки сохранения operation).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_batch = False
+
+    def commit(self):
+        if not self.in_batch:
+            super().commit()
+
+    def rollback(self):
+        if self.in_batch:
+            self.execute('ROLLBACK TO operation')
+        else:
+            super().rollback()
+
+
+class _ServerCache(ChatCache):
+    """ChatCache демона: соединения с поддержкой пакетных транзакций"""
+    connection_factory = BatchingConnection
+
+
+class _Operation:
+    """Операция записи в очереди демона"""
+    __slots__ = ('method', 'args', 'kwargs', 'done', 'result', 'error')
+
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class StorageDaemon:
+    """
+    Локальный демон хранилища - единственный процесс, пишущий в базу.
+
+    Окна и процессы приложения подключаются к нему через Unix сокет
+    (RemoteChatCache) вместо прямой работы с файлом базы. Все записи
+    выполняет один поток: короткие операции, пришедшие почти одновременно,
+    объединяются в одну транзакцию (каждая - в своей точке сохранения,
+    ошибка одной операции не откатывает остальные). Чтение выполняется
+    параллельно в потоках клиентов (журнал WAL).
+
+    Протокол: одна JSON запись на строку.
+    Запрос {"method": str, "args": list, "kwargs": dict}, ответ {"result": ...}
+    или {"error": str, "type": str}. Генераторы (iter_messages, iter_export_rows)
+    возвращаются как {"iterator": int} и читаются запросами "__next__".
+
+    Args:
+        socket_path (str): Путь к Unix сокету
+        db_name (str, optional): Путь к файлу базы данных. По умолчанию - из CACHE_DB_PATH
+        batch_window (float): Сколько секунд поток записи ждет следующие операции для пакета
+        max_batch (int): Максимальное количество операций в одной транзакции
+    """
+
+    # Короткие записи, которые можно объединять в одну транзакцию
+    BATCHED_METHODS = frozenset({
+        'save_message', 'save_turn', 'save_analytics', 'set_export_watermark',
+        'record_error', 'add_latency_sample', 'update_turn_timings', 'flush_turn_timings',
+        'create_conversation', 'rename_conversation', 'switch_branch', 'fork_from',
+    })
+    # Остальные записи выполняются потоком записи по одной
+    WRITE_METHODS = BATCHED_METHODS | frozenset({
+        'delete_conversation', 'clear_history', 'import_messages', 'import_message_batch', 'save_auth_data',
+        'clear_auth_data', 'train_compression_dictionary', 'compress_existing',
+        'deduplicate_existing', 'apply_retention', 'incremental_vacuum', 'compact_log',
+        'save_model_pricing', 'save_metric_baselines', 'get_or_create_default_conversation',
+    })
+
+    def __init__(self, socket_path, db_name=None, batch_window=0.005, max_batch=256):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("Демон хранилища требует поддержки Unix сокетов")
+        self.socket_path = socket_path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache = _ServerCache(db_name=db_name)
+
+        self.queue = queue.Queue()
+        self.server = None
+        self._writer = None
+
+        # Статистика пакетов записи
+        self.batches = 0
+        self.batched_operations = 0
+
+    def register_metrics(self, registry):
+        """
+        Публикация метрик демона: очередь операций, пакеты записи и метрики базы.
+
+        Args:
+            registry (MetricsRegistry): Реестр метрик
+        """
+        self.cache.register_metrics(registry)
+        registry.gauge('storage_daemon_queue_depth', 'Операции записи, ожидающие потока записи',
+                       callback=self.queue.qsize)
+        registry.counter('storage_daemon_batches', 'Выполненные пакеты записи',
+                         callback=lambda: self.batches)
+        registry.counter('storage_daemon_batched_operations', 'Операции, выполненные в пакетах',
+                         callback=lambda: self.batched_operations)
+
+    def _is_allowed(self, method):
+        """Разрешены только публичные методы ChatCache"""
+        return not method.startswith('_') and callable(getattr(ChatCache, method, None))
+
+    def submit(self, method, args, kwargs):
+        """
+        Выполнение операции записи через поток записи.
+
+        Returns:
+            Результат метода ChatCache
+
+        Raises:
+            Exception: Исключение, возникшее при выполнении операции
+        """
+        operation = _Operation(method, args, kwargs)
+        self.queue.put(operation)
+        operation.done.wait()
+        if operation.error is not None:
+            raise operation.error
+        return operation.result
+
+    def _collect_batch(self, first):
+        """
+        Сбор пакета коротких операций, пришедших в течение batch_window.
+
+        Returns:
+            tuple: (пакет, следующая операция не из пакета или None)
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                operation = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if operation is None or operation.method not in self.BATCHED_METHODS:
+                return batch, operation
+            batch.append(operation)
+        return batch, None
+
+    def _run_batch(self, conn, batch):
+        """Выполнение пакета в одной транзакции с точкой сохранения на каждую операцию"""
+        conn.execute('BEGIN IMMEDIATE')
+        conn.in_batch = True
+        try:
+            for operation in batch:
+                conn.execute('SAVEPOINT operation')
+                try:
+                    operation.result = getattr(self.cache, operation.method)(*operation.args, **operation.kwargs)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO operation')
+                    operation.error = e
+                conn.execute('RELEASE operation')
+            conn.in_batch = False
+            conn.commit()
+        except Exception as e:
+            conn.in_batch = False
+            conn.rollback()
+            for operation in batch:
+                operation.error = operation.error or e
+        self.batches += 1
+        self.batched_operations += len(batch)
+
+    def _writer_loop(self):
+        """Поток записи: единственный поток, изменяющий базу"""
+        conn = self.cache.get_connection()
+        pending = None
+        while True:
+            operation = pending if pending is not None else self.queue.get()
+            pending = None
+            if operation is None:
+                return
+
+            if operation.method in self.BATCHED_METHODS:
+                batch, pending = self._collect_batch(operation)
+                self._run_batch(conn, batch)
+                finished = batch
+            else:
+                try:
+                    operation.result = getattr(self.cache, operation.method)(*operation.args, **operation.kwargs)
+                except Exception as e:
+                    operation.error = e
+                finished = [operation]
+
+            # Ответ клиентам только после фиксации транзакции
+            for item in finished:
+                item.done.set()
+
+    def handle_request(self, request, iterators):
+        """
+        Обработка одного запроса клиента.
+
+        Args:
+            request (dict): Запрос протокола
+            iterators (dict): Открытые генераторы соединения клиента
+
+        Returns:
+            dict: Ответ протокола
+        """
+        method = request.get("method")
+        args = request.get("args") or []
+        kwargs = request.get("kwargs") or {}
+        try:
+            if method == "__next__":
+                iterator = iterators.get(args[0])
+                if iterator is None:
+                    return {"done": True}
+                try:
+                    return {"result": next(iterator)}
+                except StopIteration:
+                    del iterators[args[0]]
+                    return {"done": True}
+            if not self._is_allowed(method):
+                raise ValueError(f"Неизвестный метод хранилища: {method}")
+
+            if method in self.WRITE_METHODS:
+                result = self.submit(method, args, kwargs)
+            else:
+                result = getattr(self.cache, method)(*args, **kwargs)
+
+            if inspect.isgenerator(result):
+                token = max(iterators, default=0) + 1
+                iterators[token] = result
+                return {"iterator": token}
+            return {"result": result}
+        except Exception as e:
+            return {"error": str(e), "type": type(e).__name__}
+
+    def serve_forever(self):
+        """Запуск демона (блокирует вызывающий поток до shutdown())"""
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                iterators = {}
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    self.wfile.write(_dumps(daemon.handle_request(_loads(line), iterators)))
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._writer = threading.Thread(target=self._writer_loop, name="StorageWriter", daemon=True)
+        self._writer.start()
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self.server.daemon_threads = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.queue.put(None)
+            self._writer.join()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        """Остановка демона (из другого потока)"""
+        if self.server:
+            self.server.shutdown()
+
+
+class RemoteChatCache:
+    """
+    Тонкий клиент демона хранилища с интерфейсом ChatCache.
+
+    Вызовы методов передаются демону через Unix сокет (отдельное соединение
+    на каждый поток). Текущая беседа хранится на стороне клиента,
+    поэтому у каждого окна приложения она своя.
+
+    Args:
+        socket_path (str): Путь к Unix сокету демона
+        timeout (float): Таймаут ожидания ответа в секундах
+    """
+
+    # Методы, у которых conversation_id=None означает текущую беседу
+    CURRENT_CONVERSATION_METHODS = frozenset({
+        'save_message', 'save_turn', 'get_chat_history', 'clear_history',
+        'get_formatted_history', 'get_head', 'list_branches',
+    })
+
+    def __init__(self, socket_path, timeout=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.local = threading.local()
+        self.current_conversation_id = self.call('get_or_create_default_conversation')
+
+    def _connection(self):
+        """Соединение с демоном для текущего потока"""
+        if not hasattr(self.local, 'file'):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self.local.sock = sock
+            self.local.file = sock.makefile('rwb')
+        return self.local.file
+
+    def _request(self, message):
+        """Отправка запроса и чтение ответа"""
+        file = self._connection()
+        file.write(_dumps(message))
+        file.flush()
+        line = file.readline()
+        if not line:
+            raise ConnectionError("Демон хранилища закрыл соединение")
+        response = _loads(line)
+        if "error" in response:
+            error_type = getattr(builtins, response.get("type", ""), None)
+            if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+                error_type = RuntimeError
+            raise error_type(response["error"])
+        return response
+
+    def _iterate(self, token):
+        """Постраничное чтение генератора демона"""
+        while True:
+            response = self._request({"method": "__next__", "args": [token]})
+            if response.get("done"):
+                return
+            yield response["result"]
+
+    def call(self, method, *args, **kwargs):
+        """
+        Вызов метода ChatCache в демоне.
+
+        Returns:
+            Результат метода (генераторы возвращаются как генераторы)
+        """
+        response = self._request({"method": method, "args": list(args), "kwargs": kwargs})
+        if "iterator" in response:
+            return self._iterate(response["iterator"])
+        return response.get("result")
+
+    def switch_conversation(self, conversation_id):
+        """Переключение текущей беседы клиента (с проверкой в демоне)"""
+        self.call('switch_conversation', conversation_id)
+        self.current_conversation_id = conversation_id
+
+    def delete_conversation(self, conversation_id):
+        """Удаление беседы; при удалении текущей открывается беседа по умолчанию"""
+        self.call('delete_conversation', conversation_id)
+        if conversation_id == self.current_conversation_id:
+            self.current_conversation_id = self.call('get_or_create_default_conversation')
+
+    def import_messages(self, records, conversation_id=None, conversation_map=None, message_map=None):
+        """
+        Импорт пачки сообщений через демон (ChatCache.import_message_batch).
+
+        Аргументы копируются через JSON, поэтому соответствия ID передаются
+        парами (родители записей пачки и беседы), а новые пары из ответа
+        дописываются в словари клиента - следующие пачки импорта находят
+        беседы и родительские сообщения предыдущих.
+        """
+        if conversation_map is None:
+            conversation_map = {}
+        if message_map is None:
+            message_map = {}
+        parents = {record.get("parent_id") for record in records} & message_map.keys()
+        result = self.call(
+            'import_message_batch', records, conversation_id,
+            list(conversation_map.items()),
+            [(parent_id, message_map[parent_id]) for parent_id in parents]
+        )
+        conversation_map.update((source_id, local_id) for source_id, local_id in result['conversations'])
+        message_map.update((source_id, local_id) for source_id, local_id in result['messages'])
+        return result['rows']
+
+    @staticmethod
+    def verify_backup(path):
+        """Проверка копии выполняется локально (файл читается напрямую)"""
+        return ChatCache.verify_backup(path)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(ChatCache, name, None)):
+            raise AttributeError(name)
+        signature = inspect.signature(getattr(ChatCache, name))
+
+        def method(*args, **kwargs):
+            # Подстановка текущей беседы клиента вместо беседы демона
+            if name in self.CURRENT_CONVERSATION_METHODS:
+                bound = signature.bind_partial(None, *args, **kwargs)
+                if bound.arguments.get('conversation_id') is None:
+                    kwargs = dict(bound.arguments)
+                    kwargs.pop('self')
+                    kwargs['conversation_id'] = self.current_conversation_id
+                    args = ()
+            return self.call(name, *args, **kwargs)
+
+        return method
+
+    def __del__(self):
+        local = self.__dict__.get('local')
+        if local is not None and hasattr(local, 'sock'):
+            self.local.sock.close()
+
+
+def main():
+    """Запуск демона из командной строки: python -m utils.storage_daemon"""
+    parser = argparse.ArgumentParser(description="Демон хранилища чата")
+    parser.add_argument("--db", default=None, help="Путь к файлу базы данных (по умолчанию - из CACHE_DB_PATH)")
+    parser.add_argument("--socket", default=os.getenv("CACHE_DAEMON_SOCKET") or "chat_cache.sock",
+                        help="Путь к Unix сокету")
+    parser.add_argument("--batch-window", type=float, default=0.005,
+                        help="Время сбора пакета записей в секундах")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Порт эндпоинта /metrics (формат OpenMetrics); по умолчанию выключен")
+    args = parser.parse_args()
+
+    daemon = StorageDaemon(args.socket, db_name=args.db, batch_window=args.batch_window)
+    metrics_server = None
+    if args.metrics_port is not None:
+        registry = MetricsRegistry()
+        daemon.register_metrics(registry)
+        metrics_server = MetricsServer(registry, args.metrics_port)
+        metrics_server.start()
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics_server:
+            metrics_server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Импорт необходимых библиотек
+from datetime import timedelta  # Шаг интервалов временного ряда
+
+# Длина интервала сводных таблиц
+BUCKET_STEPS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+
+def lttb(points, threshold):
+    """
+    Прореживание временного ряда алгоритмом Largest-Triangle-Three-Buckets.
+
+    Первая и последняя точки сохраняются, остальные делятся на threshold - 2
+    корзин; из каждой корзины выбирается точка, образующая треугольник
+    наибольшей площади с выбранной точкой предыдущей корзины и средним
+    следующей. Форма графика (пики и провалы) сохраняется при гораздо
+    меньшем числе точек.
+
+    Args:
+        points (list): Точки (x, y) в порядке возрастания x; x - число
+        threshold (int): Максимальное количество точек результата
+
+    Returns:
+        list: Прореженные точки (исходный список, если точек не больше threshold)
+    """
+    size = len(points)
+    if threshold >= size or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (size - 2) / (threshold - 2)
+    selected = 0  # Индекс точки, выбранной в предыдущей корзине
+
+    for i in range(threshold - 2):
+        # Среднее следующей корзины (для последней - последняя точка)
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, size)
+        if next_start >= next_end:
+            next_start, next_end = size - 1, size
+        count = next_end - next_start
+        avg_x = sum(point[0] for point in points[next_start:next_end]) / count
+        avg_y = sum(point[1] for point in points[next_start:next_end]) / count
+
+        # Точка текущей корзины с наибольшей площадью треугольника
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[selected]
+        best_area = -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                selected = j
+        sampled.append(points[selected])
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def fill_buckets(values, start, end, step):
+    """
+    Ряд с нулями для интервалов без данных.
+
+    Args:
+        values (dict): Начало интервала (datetime) -> значение
+        start (datetime): Начало первого интервала
+        end (datetime): Граница, после которой интервалы не добавляются
+        step (timedelta): Длина интервала
+
+    Returns:
+        list: Пары (datetime, значение) для каждого интервала
+    """
+    series = []
+    bucket = start
+    while bucket < end:
+        series.append((bucket, values.get(bucket, 0)))
+        bucket += step
+    return series
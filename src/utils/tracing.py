@@ -0,0 +1,207 @@
+# Импорт необходимых библиотек
+import contextvars  # Текущий интервал в потоке и асинхронной задаче
+import itertools   # Идентификаторы интервалов
+import json        # Формат событий трассировки
+import os          # Библиотека для работы с файлами и переменными окружения
+import threading   # Номера потоков и блокировка записи
+import time        # Монотонные метки времени интервалов
+
+# Текущий открытый интервал (родитель для вложенных интервалов)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+# Трассировщик приложения; None - трассировка выключена
+_tracer = None
+
+
+class _NullSpan:
+    """Интервал выключенной трассировки: ничего не делает и ничего не выделяет"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    Интервал трассировки: именованный участок работы с временем начала и длительностью.
+
+    Используется как контекстный менеджер; родителем становится интервал,
+    открытый в текущем контексте (в том числе в другом потоке, если контекст
+    передан через contextvars.copy_context()).
+
+    Args:
+        tracer (Tracer): Трассировщик, в который записывается интервал
+        name (str): Имя участка (например, 'cache.save_turn')
+        attributes (dict): Дополнительные сведения об участке
+    """
+
+    __slots__ = ('tracer', 'name', 'attributes', 'span_id', 'parent', 'trace_id', 'start', '_token')
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(tracer._ids)
+        self.parent = None
+        self.trace_id = None
+        self.start = None
+        self._token = None
+
+    def set(self, key, value):
+        """Добавление сведения об участке (например, количества токенов)"""
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        # Интервалы одного хода образуют дерево с общим идентификатором
+        self.trace_id = self.parent.trace_id if self.parent else self.span_id
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes['error'] = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self, end)
+        return False
+
+
+class Tracer:
+    """
+    Трассировка участков работы приложения в файл формата Chrome Trace Event.
+
+    Каждый интервал записывается событием "X" (начало и длительность в
+    микросекундах, процесс, поток, сведения и идентификаторы интервала,
+    родителя и хода), поэтому файл открывается в Perfetto
+    (ui.perfetto.dev) и chrome://tracing. События накапливаются в памяти
+    и дописываются в файл при завершении корневого интервала. Файл
+    записывается в формате JSON массива без закрывающей скобки, который
+    допускают оба просмотрщика, поэтому он пригоден для просмотра и после
+    аварийного завершения.
+
+    Args:
+        path (str): Путь к файлу трассировки (перезаписывается при создании)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self._ids = itertools.count(1)
+        self._pending = []
+        self._lock = threading.Lock()    # Запись в файл из разных потоков
+        self._named_threads = set()
+        # Смещение монотонных меток относительно времени эпохи (микросекунды)
+        self._epoch_offset = time.time_ns() // 1000 - time.perf_counter_ns() // 1000
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('[\n')
+
+    @classmethod
+    def from_env(cls):
+        """
+        Создание трассировщика из переменной окружения TRACE_FILE.
+
+        Returns:
+            Tracer: Трассировщик или None, если путь не задан
+        """
+        path = os.getenv("TRACE_FILE")
+        return cls(path) if path else None
+
+    def span(self, name, attributes=None):
+        """Новый интервал (открывается в with)"""
+        return Span(self, name, attributes or {})
+
+    def _finish(self, span, end):
+        """Сохранение завершенного интервала; корневой интервал записывает накопленные события"""
+        thread = threading.current_thread()
+        event = {
+            'name': span.name,
+            'cat': span.name.split('.', 1)[0],
+            'ph': 'X',
+            'ts': self._epoch_offset + span.start // 1000,
+            'dur': (end - span.start) / 1000,
+            'pid': self.pid,
+            'tid': thread.ident,
+            'args': {
+                **span.attributes,
+                'span_id': span.span_id,
+                'parent_id': span.parent.span_id if span.parent else None,
+                'trace_id': span.trace_id,
+            },
+        }
+        with self._lock:
+            if thread.ident not in self._named_threads:
+                # Метаданные: имя потока для дорожки в просмотрщике
+                self._named_threads.add(thread.ident)
+                self._pending.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                                      'tid': thread.ident, 'args': {'name': thread.name}})
+            self._pending.append(event)
+            if span.parent is None:
+                self._flush_locked()
+
+    def flush(self):
+        """Запись накопленных событий в файл"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for event in self._pending:
+                f.write(json.dumps(event, ensure_ascii=False, default=str))
+                f.write(',\n')
+        self._pending.clear()
+
+
+def set_tracer(tracer):
+    """
+    Установка трассировщика приложения.
+
+    Args:
+        tracer (Tracer): Трассировщик или None, чтобы выключить трассировку
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    """Текущий трассировщик приложения (None - трассировка выключена)"""
+    return _tracer
+
+
+def span(name, **attributes):
+    """
+    Интервал трассировки участка кода.
+
+    Пример:
+        with span('cache.save_turn', model=model):
+            ...
+
+    При выключенной трассировке возвращает общий пустой интервал,
+    поэтому стоимость вызова - одна проверка.
+
+    Args:
+        name (str): Имя участка; часть до первой точки - категория события
+        **attributes: Сведения об участке
+
+    Returns:
+        Span: Интервал для использования в with
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, attributes)
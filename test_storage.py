@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки хранилищ ChatCache.
+
+Для каждого хранилища (файл SQLite, база в памяти, журнальное хранилище)
+выполняется одинаковый набор проверок и замер скорости записи и чтения.
+Все базы создаются во временной директории.
+"""
+
+import sys
+import os
+import tempfile
+import time
+sys.path.append('src')
+
+from utils.cache import ChatCache
+from utils.storage import SQLiteFileBackend, MemoryBackend, LogStructuredBackend
+
+# Количество сообщений в замере производительности
+BENCHMARK_MESSAGES = 2000
+
+
+def make_backends(directory):
+    """Хранилища для проверки (каждое со своей базой и архивом)"""
+    return [
+        SQLiteFileBackend(os.path.join(directory, 'file.db')),
+        MemoryBackend(archive_dir=os.path.join(directory, 'memory_archive')),
+        LogStructuredBackend(os.path.join(directory, 'log.db'), compact_pages=1),
+    ]
+
+
+def check(condition, message):
+    print(("✓ " if condition else "✗ ") + message)
+    assert condition, message
+
+
+def check_conformance(backend, directory):
+    cache = ChatCache(backend=backend)
+
+    # Беседы и сообщения
+    conversation_id = cache.create_conversation("Тест")
+    cache.switch_conversation(conversation_id)
+    first_id, _ = cache.save_turn("model-a", "Привет", "Здравствуйте", 10, 0.5)
+    cache.save_message("model-a", "Как дела?", "Хорошо", 5)
+    history = cache.get_chat_history()
+    check([row[2] for row in history] == ["Как дела?", "Привет"], "история беседы в порядке от новых к старым")
+    check(cache.count_messages(conversation_id) == 2, "подсчет сообщений беседы")
+
+    # Ветки беседы
+    cache.fork_from(first_id)
+    cache.save_message("model-a", "Другой вопрос", "Другой ответ", 5)
+    check(len(cache.list_branches()) == 2, "ветвление беседы")
+
+    # Аналитика хода и экспорт
+    analytics = cache.get_analytics_history()
+    check(len(analytics) == 1 and analytics[0][1] == "model-a", "метрики хода в аналитике")
+    cache.set_export_watermark("test", 42)
+    check(cache.get_export_watermark("test") == 42, "отметка экспорта")
+    exported = sum(len(batch) for batch in cache.iter_messages(conversation_id))
+    check(exported == 3, "постраничный обход сообщений")
+
+    # Данные аутентификации
+    cache.save_auth_data("sk-or-v1-test", "1234")
+    check(cache.verify_pin("1234") and not cache.verify_pin("0000"), "проверка PIN")
+
+    # Резервная копия
+    backup_path = os.path.join(directory, f"{backend.name}_backup.db")
+    cache.backup(backup_path)
+    check(ChatCache.verify_backup(backup_path)['ok'], "резервная копия проходит проверку")
+
+    # Удаление беседы
+    cache.delete_conversation(conversation_id)
+    check(cache.count_messages(conversation_id) == 0, "удаление беседы")
+
+    # Слияние журнала (для остальных хранилищ - ничего не делает)
+    merged = cache.compact_log()
+    check(merged >= 0, f"слияние журнала: {merged} страниц")
+
+
+def benchmark(backend):
+    cache = ChatCache(backend=backend)
+    conversation_id = cache.create_conversation("Замер")
+    text = "Сообщение для замера скорости записи " * 4
+
+    started = time.perf_counter()
+    for i in range(BENCHMARK_MESSAGES):
+        cache.save_turn("model-b", f"{i} {text}", text, 20, 0.1, conversation_id=conversation_id)
+    write_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(100):
+        cache.get_chat_history(limit=50, conversation_id=conversation_id)
+    read_time = time.perf_counter() - started
+
+    print(
+        f"  {backend.name:<7} запись: {BENCHMARK_MESSAGES / write_time:8.0f} ходов/с, "
+        f"чтение истории: {read_time / 100 * 1000:6.2f} мс"
+    )
+
+
+def test_storage():
+    print("Тестирование хранилищ...")
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in make_backends(directory):
+            print(f"\nХранилище {backend.name} ({backend.location})")
+            check_conformance(backend, directory)
+            backend.close()
+
+        print("\nЗамер производительности:")
+        bench_directory = os.path.join(directory, 'bench')
+        os.makedirs(bench_directory)
+        for backend in make_backends(bench_directory):
+            benchmark(backend)
+            backend.close()
+
+    print("\n🎉 Все тесты хранилищ пройдены успешно!")
+
+if __name__ == "__main__":
+    test_storage()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки работы через демон хранилища.
+
+Демон запускается в фоновом потоке с базой во временной директории,
+клиент RemoteChatCache подключается к нему через Unix сокет.
+"""
+
+import sys
+import os
+import json
+import socket
+import tempfile
+import threading
+import time
+sys.path.append('src')
+
+from utils.export import HistoryExporter
+from utils.storage_daemon import StorageDaemon, RemoteChatCache
+
+
+def check(condition, message):
+    print(("✓ " if condition else "✗ ") + message)
+    assert condition, message
+
+
+def start_daemon(directory):
+    """Запуск демона в фоновом потоке и ожидание его сокета"""
+    daemon = StorageDaemon(os.path.join(directory, 'daemon.sock'), db_name=os.path.join(directory, 'daemon.db'))
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(daemon.socket_path):
+            break
+        time.sleep(0.05)
+    return daemon
+
+
+def test_daemon_import():
+    if not hasattr(socket, 'AF_UNIX'):
+        print("Демон хранилища требует поддержки Unix сокетов - проверка пропущена")
+        return
+
+    print("Импорт через демон хранилища...")
+    with tempfile.TemporaryDirectory() as directory:
+        daemon = start_daemon(directory)
+        try:
+            cache = RemoteChatCache(daemon.socket_path)
+            exporter = HistoryExporter(cache)
+
+            # Две беседы-цепочки: пачки импорта делят беседы и родительские сообщения
+            total = exporter.IMPORT_BATCH_SIZE + 500
+            path = os.path.join(directory, 'history.ndjson')
+            with open(path, 'w', encoding='utf-8') as f:
+                for i in range(total):
+                    source_conversation = 100 + i % 2
+                    record = {
+                        "id": 1000 + i,
+                        "conversation_id": source_conversation,
+                        "conversation_title": f"Беседа {source_conversation}",
+                        "parent_id": 1000 + i - 2 if i >= 2 else None,
+                        "model": "model-a",
+                        "timestamp": f"2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}",
+                        "user_message": f"Вопрос {i}",
+                        "ai_response": f"Ответ {i}",
+                        "tokens_used": 1,
+                    }
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+            conversations_before = len(cache.list_conversations())
+            result = exporter.import_ndjson(path)
+            check(result['rows'] == total, f"импорт {total} сообщений в несколько пачек")
+
+            conversations = cache.list_conversations()
+            check(len(conversations) == conversations_before + 2, "беседы не создаются повторно в каждой пачке")
+
+            imported = [conversation for conversation in conversations if conversation['title'].startswith("Беседа")]
+            for conversation in imported:
+                cache.switch_conversation(conversation['id'])
+                history = cache.get_chat_history(limit=total)
+                check(len(history) == total // 2, f"{conversation['title']}: вся цепочка сообщений в текущей ветке")
+        finally:
+            daemon.shutdown()
+
+    print("\n🎉 Тесты демона хранилища пройдены успешно!")
+
+
+if __name__ == "__main__":
+    test_daemon_import()